@@ -7,9 +7,9 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from motor.motor_asyncio import AsyncIOMotorDatabase
 import structlog
 
+from repository import Database
 from config import settings
 from database import get_database
 from models import User, TokenData
@@ -42,7 +42,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
-async def get_user_by_email(db: AsyncIOMotorDatabase, email: str) -> Optional[User]:
+async def get_user_by_email(db: Database, email: str) -> Optional[User]:
     """Get user by email from database"""
     try:
         user_data = await db.users.find_one({"email": email})
@@ -53,7 +53,7 @@ async def get_user_by_email(db: AsyncIOMotorDatabase, email: str) -> Optional[Us
         logger.error("Error getting user by email", email=email, error=str(e))
         return None
 
-async def authenticate_user(db: AsyncIOMotorDatabase, email: str, password: str) -> Optional[User]:
+async def authenticate_user(db: Database, email: str, password: str) -> Optional[User]:
     """Authenticate user with email and password"""
     user = await get_user_by_email(db, email)
     if not user:
@@ -64,9 +64,13 @@ async def authenticate_user(db: AsyncIOMotorDatabase, email: str, password: str)
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ) -> User:
     """Get current authenticated user from JWT token"""
+    return await get_user_from_token(db, credentials.credentials)
+
+async def get_user_from_token(db: Database, token: str) -> User:
+    """Resolve a JWT access token to an active user (raises 401/400 otherwise)"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -74,7 +78,6 @@ async def get_current_user(
     )
     
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
         email: str = payload.get("sub")
         if email is None:
@@ -101,7 +104,16 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
-async def create_user(db: AsyncIOMotorDatabase, email: str, password: str, full_name: str) -> User:
+async def get_current_admin_user(current_user: User = Depends(get_current_active_user)) -> User:
+    """Get current user, requiring an address listed in ADMIN_EMAILS"""
+    if current_user.email not in settings.admin_emails:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required"
+        )
+    return current_user
+
+async def create_user(db: Database, email: str, password: str, full_name: str) -> User:
     """Create a new user"""
     # Check if user already exists
     existing_user = await get_user_by_email(db, email)
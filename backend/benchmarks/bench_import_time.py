@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Import-time benchmark for SISMOBI 3.2.0
+
+Measures, in fresh interpreters, how long importing each module takes and
+how much resident memory it adds, and checks which heavy rendering libraries
+end up loaded. Importing routers.reports must not pull in reportlab or
+matplotlib; they are only loaded on the first report render.
+
+Usage (from backend/):
+    python benchmarks/bench_import_time.py [--runs 5] [module ...]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = ["reports", "routers.reports", "server_complex"]
+HEAVY_MODULES = ["reportlab", "reportlab.platypus", "matplotlib", "matplotlib.pyplot"]
+
+PROBE = """
+import json, resource, sys, time
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{
+    "seconds": elapsed,
+    "rss_kb": rss_after - rss_before,
+    "loaded": [name for name in {heavy!r} if name in sys.modules]
+}}))
+"""
+
+def measure(module: str) -> dict:
+    """Import `module` in a fresh interpreter and return its probe result"""
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"Median of {args.runs} fresh-interpreter imports")
+    for module in args.modules:
+        samples = [measure(module) for _ in range(args.runs)]
+        seconds = statistics.median(s["seconds"] for s in samples)
+        rss_mb = statistics.median(s["rss_kb"] for s in samples) / 1024
+        loaded = ", ".join(samples[-1]["loaded"]) or "none"
+        print(f"  {module:<20} {seconds * 1000:8.1f} ms  +{rss_mb:6.1f} MB  heavy libs loaded: {loaded}")
+
+if __name__ == "__main__":
+    main()
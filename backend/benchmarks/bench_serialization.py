@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Serialization microbenchmark for SISMOBI 3.2.0
+
+Compares the cost of rendering one 100-item properties page:
+- before: FastAPI's path (jsonable_encoder + stdlib json), optionally with
+  per-item Property(**doc) revalidation as get_property used to do
+- after:  ORJSONResponse on the raw Mongo documents
+
+Usage (from backend/):
+    python benchmarks/bench_serialization.py [--items 100] [--repeat 200]
+"""
+import argparse
+import os
+import sys
+import timeit
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from models import Property
+from responses import ORJSONResponse
+
+def build_page(items: int) -> dict:
+    """Build a page shaped like get_paginated_results output"""
+    now = datetime.now()
+    documents = [
+        {
+            "id": str(uuid.uuid4()),
+            "name": f"Apartamento {i}",
+            "address": f"Rua das Flores, {i} - Centro",
+            "type": "Apartamento",
+            "size": 75.0 + i,
+            "rooms": 2,
+            "rent_value": 1500.0 + i,
+            "expenses": 200.0,
+            "status": "vacant",
+            "description": "Apartamento moderno no centro da cidade",
+            "tenant_id": None,
+            "created_at": now - timedelta(days=i),
+            "updated_at": now
+        }
+        for i in range(items)
+    ]
+    return {
+        "items": documents,
+        "pagination": {
+            "current_page": 1,
+            "page_size": items,
+            "total_count": items,
+            "total_pages": 1,
+            "has_next": False,
+            "has_prev": False
+        }
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    page = build_page(args.items)
+
+    cases = {
+        "jsonable_encoder + json": lambda: JSONResponse(jsonable_encoder(page)).body,
+        "revalidate + jsonable_encoder + json": lambda: JSONResponse(jsonable_encoder({
+            **page, "items": [Property(**doc) for doc in page["items"]]
+        })).body,
+        "orjson (no revalidation)": lambda: ORJSONResponse(page).body,
+    }
+
+    print(f"Rendering a {args.items}-item page, best of 5 x {args.repeat} runs")
+    baseline = None
+    for name, func in cases.items():
+        best = min(timeit.repeat(func, number=args.repeat, repeat=5)) / args.repeat
+        baseline = baseline or best
+        print(f"  {name:<40} {best * 1000:8.3f} ms  ({baseline / best:5.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Load-testing harness for SISMOBI 3.2.0
+
+Runs server_complex.app in-process (httpx ASGI transport, no network) against
+a local mongod or the in-memory engine (memory_engine.py), seeds it with realistic
+volumes and drives concurrent requests at one endpoint at a time. For each
+endpoint it reports throughput and p50/p95/p99 latency, and writes the whole
+run to a JSON file so runs can be compared with --compare.
+
+The load generator shares the event loop with the app, so absolute numbers
+are lower than behind uvicorn; compare runs made with the same settings.
+
+Data comes from synthetic_data.py; full scale is 10k properties, 50k tenants
+and about 2M transactions over 36 months. The in-memory engine holds
+everything in this process, so use --scale 0.1 or below with --in-memory.
+
+Usage (from backend/):
+    python benchmarks/load_test.py --mongo-url mongodb://localhost:27017
+    python benchmarks/load_test.py --in-memory --scale 0.01 --concurrency 20
+    python benchmarks/load_test.py --mongo-url ... --no-seed --compare benchmarks/results/load_<previous>.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import httpx
+import structlog
+
+import database
+from auth import create_access_token
+from config import settings
+from models import User
+from repository import create_client
+from synthetic_data import COLLECTIONS, DatasetSpec, seed_async, seed_parallel
+
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+
+BENCH_EMAIL = "bench@sismobi.com"
+SEEDED_COLLECTIONS = COLLECTIONS + ["users"]
+
+# Seeding
+
+async def seed(db, spec: DatasetSpec, mongo_url: Optional[str], workers: Optional[int]) -> Dict[str, int]:
+    """Wipe the benchmark database and fill it with a synthetic dataset
+
+    Against a mongod the generator's worker processes insert in parallel;
+    the in-memory engine only exists in this process, so it is filled in-process.
+    """
+    for name in SEEDED_COLLECTIONS:
+        await db[name].delete_many({})
+    if mongo_url:
+        counts = await asyncio.to_thread(seed_parallel, mongo_url, db.name, spec, workers)
+    else:
+        counts = await seed_async(db, spec)
+
+    # Requests authenticate with a token minted directly, so the user needs no
+    # usable password (and seeding skips a bcrypt round)
+    await db.users.insert_one(
+        User(email=BENCH_EMAIL, full_name="Benchmark User", hashed_password="!").model_dump(exclude={"id"})
+    )
+    return counts
+
+async def sample_ids(db, size: int = 500) -> Dict[str, List[str]]:
+    """Ids the endpoint scenarios pick from"""
+    return {
+        name: [doc["id"] async for doc in db[name].find({}, {"_id": 0, "id": 1}).limit(size)]
+        for name in ("properties", "tenants")
+    }
+
+# Scenarios: name -> function(rng, ids) returning a request path
+
+API = settings.api_prefix
+
+SCENARIOS: Dict[str, Callable[[random.Random, Dict[str, List[str]]], str]] = {
+    "health": lambda rng, ids: "/api/health",
+    "dashboard_summary": lambda rng, ids: f"{API}/dashboard/summary",
+    "properties_list": lambda rng, ids: f"{API}/properties/?page={rng.randint(1, 20)}&page_size=50",
+    "property_detail": lambda rng, ids: f"{API}/properties/{rng.choice(ids['properties'])}",
+    "tenants_list": lambda rng, ids: f"{API}/tenants/?page={rng.randint(1, 20)}&page_size=50",
+    "tenant_detail": lambda rng, ids: f"{API}/tenants/{rng.choice(ids['tenants'])}",
+    "transactions_by_property": lambda rng, ids: f"{API}/transactions/?property_id={rng.choice(ids['properties'])}&limit=100",
+    "transactions_by_type": lambda rng, ids: f"{API}/transactions/?type={rng.choice(['income', 'expense'])}&skip={rng.randint(0, 1000)}&limit=100",
+    "alerts_list": lambda rng, ids: f"{API}/alerts/?resolved=false",
+    "report_financial": lambda rng, ids: f"{API}/reports/financial?stream=true",
+}
+# Report rendering takes seconds per request at full scale; opt in explicitly
+DEFAULT_SCENARIOS = [name for name in SCENARIOS if not name.startswith("report_")]
+
+# Load generation
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    # Rounded first so 0.95 * 100 does not become rank 96 through float error
+    rank = max(1, math.ceil(round(fraction * len(sorted_values), 9)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    make_path: Callable,
+    ids: Dict[str, List[str]],
+    requests: int,
+    concurrency: int,
+    warmup: int,
+    rng: random.Random
+) -> dict:
+    for _ in range(warmup):
+        await client.get(make_path(rng, ids))
+
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            path = make_path(rng, ids)
+            start = time.perf_counter()
+            try:
+                response = await client.get(path)
+                statuses[str(response.status_code)] += 1
+            except Exception as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    ok = sum(count for status, count in statuses.items() if status.isdigit() and int(status) < 400)
+    return {
+        "requests": len(latencies),
+        "errors": len(latencies) - ok,
+        "statuses": dict(statuses),
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+            "p50": round(percentile(latencies, 0.50) * 1000, 3),
+            "p95": round(percentile(latencies, 0.95) * 1000, 3),
+            "p99": round(percentile(latencies, 0.99) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3) if latencies else 0.0
+        }
+    }
+
+# Reporting
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def print_results(results: Dict[str, dict], baseline: Dict[str, dict]):
+    header = f"  {'endpoint':<26} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}"
+    if baseline:
+        header += f" {'Δ req/s':>9} {'Δ p95':>8}"
+    print(header)
+    for name, result in results.items():
+        latency = result["latency_ms"]
+        line = (
+            f"  {name:<26} {result['throughput_rps']:>9.1f} {latency['p50']:>9.2f} "
+            f"{latency['p95']:>9.2f} {latency['p99']:>9.2f} {result['errors']:>7}"
+        )
+        previous = baseline.get(name)
+        if previous:
+            rps_change = (result["throughput_rps"] / previous["throughput_rps"] - 1) * 100 if previous["throughput_rps"] else 0.0
+            p95_change = (latency["p95"] / previous["latency_ms"]["p95"] - 1) * 100 if previous["latency_ms"]["p95"] else 0.0
+            line += f" {rps_change:>+8.1f}% {p95_change:>+7.1f}%"
+        print(line)
+
+async def main_async(args) -> dict:
+    if args.in_memory:
+        client = create_client("memory")
+        backend = "memory"
+    else:
+        settings.mongo_url = args.mongo_url
+        client = create_client("mongo", **database.client_options())
+        backend = "mongodb"
+
+    db = client[args.database]
+    database.db.client = client
+    database.db.database = db
+
+    spec = DatasetSpec(seed=args.seed).scaled(args.scale)
+    rng = random.Random(args.seed)
+    seed_seconds = None
+    await database.ensure_indexes(db)
+    if not args.no_seed:
+        print(f"Seeding {backend} database {args.database!r}: {spec.properties} properties, "
+              f"{spec.tenants} tenants, {spec.months} months")
+        started = time.perf_counter()
+        await seed(db, spec, None if args.in_memory else args.mongo_url, args.workers)
+        seed_seconds = round(time.perf_counter() - started, 2)
+        print(f"  seeded in {seed_seconds}s")
+    counts = {name: await db[name].count_documents({}) for name in COLLECTIONS}
+
+    from server_complex import app
+
+    ids = await sample_ids(db)
+    token = create_access_token({"sub": BENCH_EMAIL})
+    transport = httpx.ASGITransport(app=app)
+    results = {}
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", headers={"Authorization": f"Bearer {token}"}, timeout=None
+    ) as http:
+        for name in args.scenarios:
+            print(f"  running {name} ...", flush=True)
+            results[name] = await run_scenario(
+                http, SCENARIOS[name], ids, args.requests, args.concurrency, args.warmup, rng
+            )
+
+    client.close()
+    return {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": backend,
+        "scale": args.scale,
+        "counts": counts,
+        "seed_seconds": seed_seconds,
+        "concurrency": args.concurrency,
+        "requests_per_endpoint": args.requests,
+        "results": results
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--mongo-url", help="Local mongod to seed and run against")
+    target.add_argument("--in-memory", action="store_true", help="Use the in-memory engine instead of a mongod")
+    parser.add_argument("--database", default="sismobi_bench", help="Database to (re)seed; its collections are wiped")
+    parser.add_argument("--scale", type=float, default=1.0, help="Fraction of the full data volume")
+    parser.add_argument("--no-seed", action="store_true", help="Reuse data from a previous run")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for data and request parameters")
+    parser.add_argument("--workers", type=int, default=None, help="Seeding processes against a mongod (default: CPU count)")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests per endpoint")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=DEFAULT_SCENARIOS)
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/load_<timestamp>.json)")
+    parser.add_argument("--compare", help="Previous result file to print deltas against")
+    parser.add_argument("--log-level", default="WARNING", help="App log level during the run")
+    args = parser.parse_args()
+
+    # The app logs every request; keep that out of the measurement
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(getattr(logging, args.log_level.upper())))
+
+    run = asyncio.run(main_async(args))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"load_{datetime.now().strftime('%Y%m%dT%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(run, f, indent=2)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    print(f"\n{run['backend']} · scale {run['scale']} · concurrency {run['concurrency']} · {run['requests_per_endpoint']} requests/endpoint")
+    print_results(run["results"], baseline)
+    print(f"\nResults written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,541 @@
+#!/usr/bin/env python3
+"""
+Synthetic dataset generator for SISMOBI 3.2.0
+
+Fills a database with properties, tenants, recurring rent and one-off
+transactions, alerts, documents and energy/water bills. Every record is built
+through the Pydantic model the API uses for it, so the data always matches
+the current schema.
+
+Everything derives from (seed, kind, index): ids, tenancies and amounts are
+pure functions of the seed, so any slice of any collection can be generated
+independently. That gives referential integrity without shared state (a
+transaction can look up its tenant's property and rent without reading the
+tenants collection) and lets worker processes each generate and bulk insert
+their own slices in parallel.
+
+Tenancies: tenant t lives in property t % properties. The tenants of a
+property split the time span into consecutive contracts; the last one is
+still active for most properties, which are then "rented" and point at it.
+
+The default volume (10k properties, 50k tenants, 36 months) gives roughly 2M
+transactions and 720k bills.
+
+Usage (from backend/):
+    python benchmarks/synthetic_data.py --mongo-url mongodb://localhost:27017 --database sismobi_synthetic --drop
+    python benchmarks/synthetic_data.py --mongo-url ... --properties 1000 --tenants 4000 --months 24 --seed 7
+"""
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+import argparse
+import asyncio
+import hashlib
+import math
+import os
+import random
+import sys
+import time
+import uuid
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from pydantic import BaseModel, Field
+
+from models import (
+    Alert, AlertType, Document, DocumentType, EnergyBill, Property, PropertyStatus,
+    Tenant, TenantStatus, Transaction, TransactionType, WaterBill
+)
+from utils import search_keywords_update
+
+PROPERTY_TYPES = [("Apartamento", 45), ("Casa", 20), ("Kitnet", 15), ("Sala Comercial", 12), ("Loja", 8)]
+INCOME_CATEGORIES = [("Multa", 30), ("Reembolso", 40), ("Taxa extra", 30)]
+EXPENSE_CATEGORIES = [("Manutenção", 35), ("IPTU", 10), ("Seguro", 8), ("Condomínio", 25), ("Administração", 12), ("Reforma", 10)]
+STREETS = ["Rua das Flores", "Avenida Paulista", "Rua Augusta", "Rua XV de Novembro", "Avenida Brasil", "Rua da Consolação"]
+FIRST_NAMES = ["Ana", "Bruno", "Carla", "Diego", "Eduarda", "Felipe", "Gabriela", "Henrique", "Isabela", "João", "Larissa", "Marcos"]
+LAST_NAMES = ["Silva", "Santos", "Oliveira", "Souza", "Lima", "Pereira", "Costa", "Ferreira", "Almeida", "Ribeiro"]
+
+MIN_CONTRACT_DAYS = 30
+
+class DatasetSpec(BaseModel):
+    """Volume and shape of a generated dataset"""
+    properties: int = Field(10_000, ge=1)
+    tenants: int = Field(50_000, ge=0)
+    months: int = Field(36, ge=1, description="Time span covered, ending at `end`")
+    one_off_per_property_month: float = Field(4.5, ge=0, description="Mean one-off transactions per property and month")
+    documents_per_tenant: float = Field(2.0, ge=0)
+    alerts: int = Field(20_000, ge=0)
+    group_size: int = Field(8, ge=1, description="Properties sharing one energy/water meter group")
+    seed: int = 42
+    end: datetime = Field(default_factory=lambda: datetime.now().replace(hour=0, minute=0, second=0, microsecond=0))
+
+    @property
+    def start(self) -> datetime:
+        return self.end - timedelta(days=round(self.months * 30.44))
+
+    def scaled(self, factor: float) -> "DatasetSpec":
+        return self.model_copy(update={
+            "properties": max(1, int(self.properties * factor)),
+            "tenants": int(self.tenants * factor),
+            "alerts": int(self.alerts * factor)
+        })
+
+# Deterministic building blocks
+
+def _digest(seed: int, kind: str, index: int) -> bytes:
+    return hashlib.blake2b(f"{seed}:{kind}:{index}".encode(), digest_size=16).digest()
+
+def entity_id(seed: int, kind: str, index: int) -> str:
+    return str(uuid.UUID(bytes=_digest(seed, kind, index), version=4))
+
+def _rng(seed: int, kind: str, index: int) -> random.Random:
+    return random.Random(int.from_bytes(_digest(seed, kind, index), "big"))
+
+def _weighted(rng: random.Random, options: List[Tuple[str, int]]) -> str:
+    return rng.choices([value for value, _ in options], weights=[weight for _, weight in options])[0]
+
+def _add_months(moment: datetime, months: int, day: Optional[int] = None) -> datetime:
+    month_index = moment.year * 12 + moment.month - 1 + months
+    return moment.replace(year=month_index // 12, month=month_index % 12 + 1, day=min(day or moment.day, 28))
+
+class PropertyProfile(BaseModel):
+    index: int
+    id: str
+    rent_value: float
+    tenant_count: int
+    occupied: bool
+
+class TenancyProfile(BaseModel):
+    index: int
+    id: str
+    property_index: int
+    property_id: str
+    slot: int
+    start: datetime
+    end: datetime
+    active: bool
+    rent_value: float
+    rent_due_date: int
+
+def property_profile(spec: DatasetSpec, index: int) -> PropertyProfile:
+    rng = _rng(spec.seed, "property", index)
+    tenant_count = (spec.tenants - 1 - index) // spec.properties + 1 if index < spec.tenants else 0
+    return PropertyProfile(
+        index=index,
+        id=entity_id(spec.seed, "property", index),
+        rent_value=round(rng.lognormvariate(7.6, 0.45), 2),
+        tenant_count=tenant_count,
+        occupied=tenant_count > 0 and rng.random() < 0.85
+    )
+
+def tenancy_profile(spec: DatasetSpec, index: int, prop: Optional[PropertyProfile] = None) -> TenancyProfile:
+    """Contract of tenant `index`: its slot in the property's sequence of tenants"""
+    property_index = index % spec.properties
+    prop = prop or property_profile(spec, property_index)
+    slot = index // spec.properties
+    rng = _rng(spec.seed, "tenant", index)
+
+    span_days = (spec.end - spec.start).days
+    slot_days = span_days / prop.tenant_count
+    start = spec.start + timedelta(days=round(slot * slot_days + rng.uniform(0, min(20, slot_days / 4))))
+    last = slot == prop.tenant_count - 1
+    active = last and prop.occupied
+    if active:
+        end = spec.end + timedelta(days=rng.choice([90, 180, 365, 540]))
+    else:
+        end = spec.start + timedelta(days=round((slot + 1) * slot_days - rng.uniform(0, min(30, slot_days / 4))))
+    end = max(end, start + timedelta(days=MIN_CONTRACT_DAYS))
+
+    return TenancyProfile(
+        index=index,
+        id=entity_id(spec.seed, "tenant", index),
+        property_index=property_index,
+        property_id=prop.id,
+        slot=slot,
+        start=start,
+        end=end,
+        active=active,
+        rent_value=round(prop.rent_value * rng.uniform(0.95, 1.05), 2),
+        rent_due_date=rng.choice([5, 5, 10, 10, 15, 20, 25])
+    )
+
+def tenant_at(spec: DatasetSpec, prop: PropertyProfile, moment: datetime) -> Optional[TenancyProfile]:
+    """The property's tenant whose contract covers `moment`, if any"""
+    if prop.tenant_count == 0:
+        return None
+    slot_days = (spec.end - spec.start).days / prop.tenant_count
+    slot = max(0, min(int((moment - spec.start).days / slot_days), prop.tenant_count - 1))
+    tenancy = tenancy_profile(spec, prop.index + slot * spec.properties, prop)
+    return tenancy if tenancy.start <= moment <= tenancy.end else None
+
+def _months(spec: DatasetSpec) -> Iterator[datetime]:
+    moment = spec.start.replace(day=1)
+    while moment < spec.end:
+        yield moment
+        moment = _add_months(moment, 1, day=1)
+
+# Record generators, one per work unit kind
+# Each returns {collection: [documents]} for indexes [start, stop)
+
+def _stamp(moment: datetime) -> Dict[str, datetime]:
+    return {"created_at": moment, "updated_at": moment}
+
+def _person_name(rng: random.Random) -> str:
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+def gen_properties(spec: DatasetSpec, start: int, stop: int) -> Dict[str, List[dict]]:
+    documents = []
+    for index in range(start, stop):
+        prop = property_profile(spec, index)
+        rng = _rng(spec.seed, "property-details", index)
+        property_type = _weighted(rng, PROPERTY_TYPES)
+        size = round(rng.uniform(25, 60) if property_type == "Kitnet" else rng.uniform(45, 320), 1)
+        current = tenancy_profile(spec, index + (prop.tenant_count - 1) * spec.properties, prop) if prop.occupied else None
+        if current:
+            status = PropertyStatus.rented
+        else:
+            status = PropertyStatus.maintenance if rng.random() < 0.2 else PropertyStatus.vacant
+        created = spec.start - timedelta(days=rng.randint(0, 365))
+        documents.append(Property(
+            id=prop.id,
+            name=f"{property_type} {index + 1}",
+            address=f"{rng.choice(STREETS)}, {rng.randint(1, 3000)} - Grupo {index // spec.group_size + 1}",
+            type=property_type,
+            size=size,
+            rooms=max(1, min(6, round(size / 40))),
+            rent_value=prop.rent_value,
+            expenses=round(prop.rent_value * rng.uniform(0.05, 0.25), 2),
+            status=status,
+            description=None,
+            tenant_id=current.id if current else None,
+            **_stamp(created)
+        ).model_dump())
+        documents[-1].update(search_keywords_update("properties", documents[-1]))
+    return {"properties": documents}
+
+def gen_tenants(spec: DatasetSpec, start: int, stop: int) -> Dict[str, List[dict]]:
+    documents = []
+    for index in range(start, stop):
+        tenancy = tenancy_profile(spec, index)
+        rng = _rng(spec.seed, "tenant-details", index)
+        documents.append(Tenant(
+            id=tenancy.id,
+            name=_person_name(rng),
+            email=f"inquilino{index + 1}@example.com",
+            phone=f"(11) 9{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}",
+            document=f"{rng.randint(100, 999)}.{rng.randint(100, 999)}.{rng.randint(100, 999)}-{rng.randint(10, 99)}",
+            property_id=tenancy.property_id,
+            rent_value=tenancy.rent_value,
+            rent_due_date=tenancy.rent_due_date,
+            status=TenantStatus.active if tenancy.active else TenantStatus.inactive,
+            notes=None,
+            contract_start_date=tenancy.start,
+            contract_end_date=tenancy.end,
+            **_stamp(tenancy.start - timedelta(days=rng.randint(1, 20)))
+        ).model_dump())
+        documents[-1].update(search_keywords_update("tenants", documents[-1]))
+    return {"tenants": documents}
+
+def gen_rent_transactions(spec: DatasetSpec, start: int, stop: int) -> Dict[str, List[dict]]:
+    """Monthly recurring rent for each tenant over the part of its contract in the span"""
+    documents = []
+    for index in range(start, stop):
+        tenancy = tenancy_profile(spec, index)
+        rng = _rng(spec.seed, "rent", index)
+        due = _add_months(tenancy.start, 1, day=tenancy.rent_due_date)
+        last = min(tenancy.end, spec.end)
+        sequence = 0
+        while due <= last:
+            # A few percent of payments are late
+            paid = due + timedelta(days=rng.randint(1, 15) if rng.random() < 0.06 else 0, hours=rng.randint(8, 20))
+            documents.append(Transaction(
+                id=entity_id(spec.seed, f"rent-{index}", sequence),
+                property_id=tenancy.property_id,
+                tenant_id=tenancy.id,
+                description=f"Aluguel {due.month:02d}/{due.year}",
+                amount=tenancy.rent_value,
+                type=TransactionType.income,
+                category="Aluguel",
+                date=paid,
+                recurring=True,
+                recurring_day=tenancy.rent_due_date,
+                notes=None,
+                **_stamp(paid)
+            ).model_dump())
+            sequence += 1
+            due = _add_months(due, 1, day=tenancy.rent_due_date)
+    return {"transactions": documents}
+
+def gen_one_off_transactions(spec: DatasetSpec, start: int, stop: int) -> Dict[str, List[dict]]:
+    """Expenses and occasional extra income per property, spread over the span"""
+    documents = []
+    span_seconds = int((spec.end - spec.start).total_seconds())
+    for index in range(start, stop):
+        prop = property_profile(spec, index)
+        rng = _rng(spec.seed, "one-off", index)
+        count = round(spec.months * spec.one_off_per_property_month * rng.uniform(0.5, 1.5))
+        for sequence in range(count):
+            date = spec.start + timedelta(seconds=rng.randrange(span_seconds))
+            is_income = rng.random() < 0.15
+            tenancy = tenant_at(spec, prop, date) if is_income else None
+            category = _weighted(rng, INCOME_CATEGORIES if is_income else EXPENSE_CATEGORIES)
+            amount = prop.rent_value * (rng.uniform(0.02, 0.2) if is_income else rng.lognormvariate(-2.2, 0.9))
+            documents.append(Transaction(
+                id=entity_id(spec.seed, f"one-off-{index}", sequence),
+                property_id=prop.id,
+                tenant_id=tenancy.id if tenancy else None,
+                description=f"{category} - {date:%m/%Y}",
+                amount=max(round(amount, 2), 1.0),
+                type=TransactionType.income if is_income else TransactionType.expense,
+                category=category,
+                date=date,
+                recurring=False,
+                recurring_day=None,
+                notes=None,
+                **_stamp(date)
+            ).model_dump())
+    return {"transactions": documents}
+
+def gen_bills(spec: DatasetSpec, start: int, stop: int) -> Dict[str, List[dict]]:
+    """One energy and one water bill per property and month, allocated to the tenant of the month"""
+    energy, water = [], []
+    months = list(_months(spec))
+    for index in range(start, stop):
+        prop = property_profile(spec, index)
+        rng = _rng(spec.seed, "bills", index)
+        group_id = entity_id(spec.seed, "group", index // spec.group_size)
+        base_kwh = rng.uniform(90, 450)
+        base_liters = rng.uniform(4_000, 18_000)
+        for sequence, month in enumerate(months):
+            reading = month + timedelta(days=rng.randint(24, 27))
+            if reading > spec.end:
+                break
+            due = reading + timedelta(days=10)
+            tenancy = tenant_at(spec, prop, reading)
+            # Summer peak for energy, mild seasonality for water
+            season = math.cos((month.month - 1) / 12 * 2 * math.pi)
+            kwh = round(base_kwh * (1 + 0.25 * season) * rng.uniform(0.85, 1.15) * (1 if tenancy else 0.15) + 5, 1)
+            liters = round(base_liters * (1 + 0.1 * season) * rng.uniform(0.8, 1.2) * (1 if tenancy else 0.1) + 100, 0)
+            energy_amount = round(kwh * 0.92 + 12.5, 2)
+            water_amount = round(liters / 1000 * 11.4 + 35.0, 2)
+            common = {"property_id": prop.id, "group_id": group_id, "month": month.month, "year": month.year,
+                      "reading_date": reading, "due_date": due, **_stamp(reading)}
+            energy.append(EnergyBill(
+                id=entity_id(spec.seed, f"energy-{index}", sequence),
+                total_amount=energy_amount, total_kwh=kwh,
+                tenant_allocations={tenancy.id: energy_amount} if tenancy else {},
+                **common
+            ).model_dump())
+            water.append(WaterBill(
+                id=entity_id(spec.seed, f"water-{index}", sequence),
+                total_amount=water_amount, total_liters=liters,
+                tenant_allocations={tenancy.id: water_amount} if tenancy else {},
+                **common
+            ).model_dump())
+    return {"energy_bills": energy, "water_bills": water}
+
+def gen_documents(spec: DatasetSpec, start: int, stop: int) -> Dict[str, List[dict]]:
+    """Contract plus receipts/invoices per tenant (records only; no files on disk)"""
+    documents = []
+    for index in range(start, stop):
+        tenancy = tenancy_profile(spec, index)
+        rng = _rng(spec.seed, "documents", index)
+        count = round(rng.expovariate(1 / spec.documents_per_tenant)) if spec.documents_per_tenant else 0
+        for sequence in range(count):
+            doc_type = DocumentType.contract if sequence == 0 else rng.choice([DocumentType.receipt, DocumentType.invoice, DocumentType.other])
+            is_pdf = doc_type == DocumentType.contract or rng.random() < 0.7
+            created = tenancy.start + timedelta(days=rng.randint(0, max(1, (min(tenancy.end, spec.end) - tenancy.start).days)))
+            document_id = entity_id(spec.seed, f"document-{index}", sequence)
+            documents.append(Document(
+                id=document_id,
+                property_id=tenancy.property_id,
+                tenant_id=tenancy.id,
+                name=f"{doc_type.value}-{index + 1}-{sequence + 1}.{'pdf' if is_pdf else 'jpg'}",
+                type=doc_type,
+                file_path=f"synthetic/{document_id}",
+                file_size=rng.randint(40_000, 4_000_000),
+                mime_type="application/pdf" if is_pdf else "image/jpeg",
+                description=None,
+                sha256=None,
+                **_stamp(created)
+            ).model_dump())
+    return {"documents": documents}
+
+ALERT_WEIGHTS = [
+    (AlertType.rent_due, 30), (AlertType.payment_overdue, 20), (AlertType.maintenance, 20),
+    (AlertType.contract_expiring, 10), (AlertType.high_energy_bill, 10), (AlertType.high_water_bill, 10)
+]
+ALERT_TITLES = {
+    AlertType.rent_due: "Aluguel a vencer",
+    AlertType.payment_overdue: "Pagamento em atraso",
+    AlertType.maintenance: "Manutenção solicitada",
+    AlertType.contract_expiring: "Contrato próximo do vencimento",
+    AlertType.high_energy_bill: "Conta de energia acima da média",
+    AlertType.high_water_bill: "Conta de água acima da média"
+}
+
+def gen_alerts(spec: DatasetSpec, start: int, stop: int) -> Dict[str, List[dict]]:
+    documents = []
+    span_seconds = int((spec.end - spec.start).total_seconds())
+    for index in range(start, stop):
+        rng = _rng(spec.seed, "alert", index)
+        prop = property_profile(spec, rng.randrange(spec.properties))
+        created = spec.start + timedelta(seconds=rng.randrange(span_seconds))
+        tenancy = tenant_at(spec, prop, created)
+        alert_type = _weighted(rng, ALERT_WEIGHTS)
+        # Older alerts are almost always resolved
+        age_days = (spec.end - created).days
+        resolved = rng.random() < (0.97 if age_days > 60 else 0.5)
+        documents.append(Alert(
+            id=entity_id(spec.seed, "alert", index),
+            property_id=prop.id,
+            tenant_id=tenancy.id if tenancy else None,
+            title=ALERT_TITLES[alert_type],
+            message=f"{ALERT_TITLES[alert_type]} no imóvel {prop.index + 1}",
+            type=alert_type,
+            priority=_weighted(rng, [("low", 25), ("medium", 45), ("high", 22), ("critical", 8)]),
+            resolved=resolved,
+            resolved_at=created + timedelta(days=rng.randint(0, 20)) if resolved else None,
+            due_date=created + timedelta(days=rng.randint(3, 30)),
+            **_stamp(created)
+        ).model_dump())
+    return {"alerts": documents}
+
+# kind -> (generator, entity the index runs over, indexes per work unit)
+GENERATORS = {
+    "properties": (gen_properties, "properties", 5_000),
+    "tenants": (gen_tenants, "tenants", 5_000),
+    "rent_transactions": (gen_rent_transactions, "tenants", 2_000),
+    "one_off_transactions": (gen_one_off_transactions, "properties", 200),
+    "bills": (gen_bills, "properties", 200),
+    "documents": (gen_documents, "tenants", 5_000),
+    "alerts": (gen_alerts, "alerts", 10_000),
+}
+
+COLLECTIONS = ["properties", "tenants", "transactions", "energy_bills", "water_bills", "documents", "alerts"]
+
+def work_units(spec: DatasetSpec, kinds: Optional[List[str]] = None) -> List[Tuple[str, int, int]]:
+    """Split the dataset into independent (kind, start, stop) slices"""
+    totals = {"properties": spec.properties, "tenants": spec.tenants, "alerts": spec.alerts}
+    units = []
+    for kind in kinds or GENERATORS:
+        _, entity, step = GENERATORS[kind]
+        units.extend((kind, start, min(start + step, totals[entity])) for start in range(0, totals[entity], step))
+    return units
+
+def generate(spec: DatasetSpec, kind: str, start: int, stop: int) -> Dict[str, List[dict]]:
+    return GENERATORS[kind][0](spec, start, stop)
+
+# Writers
+
+INSERT_BATCH_SIZE = 5_000
+_worker_clients: Dict[str, Any] = {}
+
+def _write_unit(mongo_url: str, database: str, spec_data: dict, kind: str, start: int, stop: int) -> Dict[str, int]:
+    """Generate one slice and bulk insert it (runs in a worker process)"""
+    from pymongo import MongoClient
+    client = _worker_clients.get(mongo_url)
+    if client is None:
+        client = _worker_clients[mongo_url] = MongoClient(mongo_url)
+    db = client[database]
+    written = {}
+    for collection, documents in generate(DatasetSpec(**spec_data), kind, start, stop).items():
+        for offset in range(0, len(documents), INSERT_BATCH_SIZE):
+            db[collection].insert_many(documents[offset:offset + INSERT_BATCH_SIZE], ordered=False)
+        written[collection] = len(documents)
+    return written
+
+def seed_parallel(
+    mongo_url: str,
+    database: str,
+    spec: DatasetSpec,
+    workers: Optional[int] = None,
+    drop: bool = False,
+    progress: bool = True
+) -> Dict[str, int]:
+    """Generate and insert the dataset with a pool of worker processes; returns counts per collection"""
+    from pymongo import MongoClient
+    if drop:
+        with MongoClient(mongo_url) as client:
+            for collection in COLLECTIONS:
+                client[database].drop_collection(collection)
+
+    units = work_units(spec)
+    totals = {collection: 0 for collection in COLLECTIONS}
+    started = time.perf_counter()
+    spec_data = spec.model_dump()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = [pool.submit(_write_unit, mongo_url, database, spec_data, *unit) for unit in units]
+        for done, future in enumerate(as_completed(futures), 1):
+            for collection, count in future.result().items():
+                totals[collection] += count
+            if progress and (done % 20 == 0 or done == len(futures)):
+                written = sum(totals.values())
+                rate = written / (time.perf_counter() - started) * 60
+                print(f"  {done}/{len(futures)} units, {written:,} documents ({rate:,.0f}/min)", flush=True)
+    return totals
+
+async def seed_async(db, spec: DatasetSpec) -> Dict[str, int]:
+    """Generate and insert the dataset through an async (Motor-compatible) database, in-process"""
+    totals = {collection: 0 for collection in COLLECTIONS}
+    for unit in work_units(spec):
+        for collection, documents in generate(spec, *unit).items():
+            for offset in range(0, len(documents), INSERT_BATCH_SIZE):
+                await db[collection].insert_many(documents[offset:offset + INSERT_BATCH_SIZE], ordered=False)
+            totals[collection] += len(documents)
+    return totals
+
+async def create_indexes(mongo_url: str, database: str):
+    """Build the API's indexes once the data is in (faster than indexing during the load)"""
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from database import ensure_indexes
+    client = AsyncIOMotorClient(mongo_url)
+    try:
+        await ensure_indexes(client[database])
+    finally:
+        client.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    defaults = DatasetSpec()
+    parser.add_argument("--mongo-url", required=True)
+    parser.add_argument("--database", default="sismobi_synthetic")
+    parser.add_argument("--drop", action="store_true", help="Drop the generated collections first")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--properties", type=int, default=defaults.properties)
+    parser.add_argument("--tenants", type=int, default=defaults.tenants)
+    parser.add_argument("--months", type=int, default=defaults.months, help="Time span in months, ending at --end")
+    parser.add_argument("--end", type=datetime.fromisoformat, default=defaults.end, help="End of the span (ISO date, default today)")
+    parser.add_argument("--one-off-per-property-month", type=float, default=defaults.one_off_per_property_month)
+    parser.add_argument("--documents-per-tenant", type=float, default=defaults.documents_per_tenant)
+    parser.add_argument("--alerts", type=int, default=defaults.alerts)
+    parser.add_argument("--group-size", type=int, default=defaults.group_size)
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply properties, tenants and alerts")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--no-indexes", action="store_true", help="Skip creating the API's indexes afterwards")
+    args = parser.parse_args()
+
+    spec = DatasetSpec(
+        properties=args.properties, tenants=args.tenants, months=args.months, end=args.end,
+        one_off_per_property_month=args.one_off_per_property_month,
+        documents_per_tenant=args.documents_per_tenant, alerts=args.alerts,
+        group_size=args.group_size, seed=args.seed
+    ).scaled(args.scale)
+
+    print(f"Generating into {args.database!r}: {spec.properties:,} properties, {spec.tenants:,} tenants, "
+          f"{spec.months} months to {spec.end:%Y-%m-%d}, seed {spec.seed}")
+    started = time.perf_counter()
+    totals = seed_parallel(args.mongo_url, args.database, spec, workers=args.workers, drop=args.drop)
+    elapsed = time.perf_counter() - started
+
+    if not args.no_indexes:
+        asyncio.run(create_indexes(args.mongo_url, args.database))
+
+    for collection, count in totals.items():
+        print(f"  {collection:<14} {count:>12,}")
+    total = sum(totals.values())
+    print(f"{total:,} documents in {elapsed:.1f}s ({total / elapsed * 60:,.0f}/min)")
+
+if __name__ == "__main__":
+    main()
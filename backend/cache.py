@@ -0,0 +1,117 @@
+"""
+In-process query cache for SISMOBI 3.2.0
+"""
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+from collections import OrderedDict
+import time
+import structlog
+
+from config import settings
+
+logger = structlog.get_logger(__name__)
+
+class CollectionCache:
+    """LRU cache with TTL whose entries depend on MongoDB collections
+
+    Entries are dropped when any collection they were computed from is written
+    (see invalidate_collections); the TTL is only a safety net for writes that
+    bypass the API. Each invalidation also bumps the collection's generation,
+    so a value loaded while its collections were written is not stored.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int = 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any, Tuple[str, ...]]]" = OrderedDict()
+        self._by_collection: Dict[str, Set[Hashable]] = {}
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value, or None if missing or expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value, _ = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def generation(self, collections: Iterable[str]) -> Tuple[int, ...]:
+        """Snapshot to take before loading a value from the given collections"""
+        return (self._epoch,) + tuple(self._generations.get(collection, 0) for collection in collections)
+
+    def set(self, key: Hashable, value: Any, depends_on: Iterable[str], generation: Optional[Tuple[int, ...]] = None) -> bool:
+        """Store a value computed from the given collections
+
+        With `generation` (see generation()), the value is dropped if any of
+        the collections was invalidated since the snapshot. Returns whether
+        the value was stored.
+        """
+        collections = tuple(depends_on)
+        if generation is not None and generation != self.generation(collections):
+            return False
+        self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value, collections)
+        for collection in collections:
+            self._by_collection.setdefault(collection, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+        return True
+
+    def invalidate(self, *collections: str) -> int:
+        """Drop every entry that depends on any of the collections"""
+        keys = set()
+        for collection in collections:
+            self._generations[collection] = self._generations.get(collection, 0) + 1
+            keys |= self._by_collection.pop(collection, set())
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    def clear(self):
+        self._entries.clear()
+        self._by_collection.clear()
+        self._epoch += 1
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for collection in entry[2]:
+            keys = self._by_collection.get(collection)
+            if keys is not None:
+                keys.discard(key)
+
+# Global cache instance
+query_cache = CollectionCache(ttl_seconds=settings.cache_expire_minutes * 60)
+
+async def cached(key: Hashable, depends_on: Iterable[str], loader: Callable[[], Awaitable[Any]]) -> Any:
+    """Return the cached value for key, computing it with loader on a miss"""
+    value = query_cache.get(key)
+    if value is None:
+        collections = tuple(depends_on)
+        generation = query_cache.generation(collections)
+        value = await loader()
+        # A write during the load may not be reflected in the value
+        query_cache.set(key, value, collections, generation=generation)
+    return value
+
+# Called with the collections of every local invalidation (see cache_sync.py)
+invalidation_listeners: List[Callable[[Tuple[str, ...]], None]] = []
+
+def invalidate_collections(*collections: str):
+    """Invalidate cached queries after a write to the given collections
+
+    Other workers are notified through the registered invalidation listeners.
+    """
+    dropped = query_cache.invalidate(*collections)
+    if dropped:
+        logger.debug("Query cache invalidated", collections=collections, entries=dropped)
+    for listener in invalidation_listeners:
+        try:
+            listener(collections)
+        except Exception as e:
+            logger.warning("Cache invalidation listener failed", error=str(e))
@@ -0,0 +1,188 @@
+"""
+Cross-worker cache invalidation for SISMOBI 3.2.0
+
+Each worker process keeps its own query_cache (cache.py). When one worker
+writes, the others must drop their entries for the written collections too.
+Two transports are available (CACHE_SYNC):
+
+- "change_stream": every worker watches the database's change stream and
+  invalidates the collections it sees written. This covers all workers on
+  all hosts and writes that bypass the API, but needs a replica set.
+- "local": workers on the same host exchange the collection names through
+  Unix datagram sockets in CACHE_SYNC_DIR (one socket per worker). Publishing
+  is one non-blocking send per peer from invalidate_collections.
+
+"auto" (default) uses change streams when the deployment supports them and
+falls back to "local"; "off" disables cross-worker invalidation. Lost
+messages are covered by the cache TTL.
+"""
+from typing import List, Optional, Tuple
+import asyncio
+import json
+import os
+import socket
+import structlog
+from pymongo.errors import PyMongoError
+
+from cache import invalidation_listeners, query_cache
+from config import settings
+from repository import Database
+
+logger = structlog.get_logger(__name__)
+
+_MAX_MESSAGE = 4096
+_WRITE_OPERATIONS = ["insert", "update", "replace", "delete"]
+
+class LocalInvalidationBus:
+    """Same-host pub/sub over Unix datagram sockets, one per worker"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}.sock")
+        self._sock: Optional[socket.socket] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        self._sock.bind(self.path)
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(self._sock.fileno(), self._receive)
+
+    def stop(self):
+        if self._sock is None:
+            return
+        self._loop.remove_reader(self._sock.fileno())
+        self._sock.close()
+        self._sock = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _peers(self) -> List[str]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, name) for name in names if name.endswith(".sock")]
+
+    def publish(self, collections: Tuple[str, ...]):
+        if self._sock is None:
+            return
+        message = json.dumps(list(collections)).encode()
+        for peer in self._peers():
+            if peer == self.path:
+                continue
+            try:
+                self._sock.sendto(message, peer)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Socket left behind by a worker that died without cleaning up
+                try:
+                    os.unlink(peer)
+                except OSError:
+                    pass
+            except BlockingIOError:
+                logger.debug("Cache invalidation dropped, peer busy", peer=peer)
+
+    def _receive(self):
+        while True:
+            try:
+                message = self._sock.recv(_MAX_MESSAGE)
+            except (BlockingIOError, OSError):
+                return
+            try:
+                collections = json.loads(message)
+            except ValueError:
+                continue
+            query_cache.invalidate(*collections)
+
+class ChangeStreamInvalidator:
+    """Invalidates the local cache from the database change stream"""
+
+    def __init__(self, database: Database):
+        self.database = database
+        self._task: Optional[asyncio.Task] = None
+
+    def _watch(self, resume_token=None):
+        return self.database.watch(
+            [{"$match": {"operationType": {"$in": _WRITE_OPERATIONS}}}, {"$project": {"ns": 1}}],
+            resume_after=resume_token
+        )
+
+    async def open(self):
+        """Open the stream (raises OperationFailure without change stream support)"""
+        stream = self._watch()
+        change = await stream.try_next()
+        if change is not None:
+            query_cache.invalidate(change["ns"]["coll"])
+        self._task = asyncio.create_task(self._run(stream))
+
+    async def _run(self, stream):
+        resume_token = stream.resume_token
+        while True:
+            try:
+                async with stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        query_cache.invalidate(change["ns"]["coll"])
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError as e:
+                logger.warning("Cache change stream interrupted, reopening", error=str(e))
+                # Anything written while reconnecting may be cached stale
+                query_cache.clear()
+                await asyncio.sleep(1)
+            stream = self._watch(resume_token)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+class CacheSync:
+    """Starts the configured transport and hooks it into invalidate_collections"""
+
+    def __init__(self, mode: str, directory: str):
+        self.mode = mode
+        self.directory = directory
+        self.transport: Optional[str] = None
+        self._bus: Optional[LocalInvalidationBus] = None
+        self._stream: Optional[ChangeStreamInvalidator] = None
+
+    async def start(self, database):
+        if self.mode == "off":
+            return
+        if self.mode in ("auto", "change_stream"):
+            try:
+                stream = ChangeStreamInvalidator(database)
+                await stream.open()
+                self._stream = stream
+                self.transport = "change_stream"
+            except PyMongoError as e:
+                if self.mode == "change_stream":
+                    raise
+                logger.info("Change streams unavailable, using local cache invalidation", error=str(e))
+        if self._stream is None:
+            self._bus = LocalInvalidationBus(self.directory)
+            self._bus.start()
+            invalidation_listeners.append(self._bus.publish)
+            self.transport = "local"
+        logger.info("Cross-worker cache invalidation started", transport=self.transport)
+
+    async def stop(self):
+        if self._bus is not None:
+            invalidation_listeners.remove(self._bus.publish)
+            self._bus.stop()
+            self._bus = None
+        if self._stream is not None:
+            await self._stream.close()
+            self._stream = None
+        self.transport = None
+
+# Global cache synchronization, started from the app lifespan
+cache_sync = CacheSync(settings.cache_sync, settings.cache_sync_dir)
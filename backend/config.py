@@ -12,6 +12,21 @@ class Settings(BaseSettings):
     # Database Configuration
     mongo_url: str = os.getenv("MONGO_URL", "mongodb://localhost:27017")
     database_name: str = os.getenv("DATABASE_NAME", "sismobi")
+    database_engine: str = os.getenv("DATABASE_ENGINE", "mongo")  # "mongo" or "memory" (see repository.py)
+    
+    # MongoDB Client (see database.client_options; 0 disables a timeout)
+    mongo_max_idle_time_ms: int = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+    mongo_wait_queue_timeout_ms: int = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "0"))
+    mongo_server_selection_timeout_ms: int = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+    mongo_connect_timeout_ms: int = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+    mongo_socket_timeout_ms: int = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "0"))
+    mongo_compressors: str = os.getenv("MONGO_COMPRESSORS", "")  # e.g. "zstd,snappy,zlib" (zstd/snappy need their modules)
+    mongo_zlib_compression_level: int = int(os.getenv("MONGO_ZLIB_COMPRESSION_LEVEL", "-1"))
+    mongo_retry_reads: bool = os.getenv("MONGO_RETRY_READS", "true").lower() == "true"
+    mongo_retry_writes: bool = os.getenv("MONGO_RETRY_WRITES", "true").lower() == "true"
+    mongo_read_preference: str = os.getenv("MONGO_READ_PREFERENCE", "primary")
+    mongo_report_read_preference: str = os.getenv("MONGO_REPORT_READ_PREFERENCE", "secondaryPreferred")
+    mongo_report_max_staleness_seconds: int = int(os.getenv("MONGO_REPORT_MAX_STALENESS_SECONDS", "-1"))
     
     # Security & Authentication
     secret_key: str = os.getenv("SECRET_KEY", "sismobi_super_secret_key_change_in_production_2025")
@@ -35,8 +50,70 @@ class Settings(BaseSettings):
     
     # Performance Settings
     cache_expire_minutes: int = int(os.getenv("CACHE_EXPIRE_MINUTES", "10"))
-    max_connections_count: int = int(os.getenv("MAX_CONNECTIONS_COUNT", "10"))
-    min_connections_count: int = int(os.getenv("MIN_CONNECTIONS_COUNT", "1"))
+    max_connections_count: int = int(os.getenv("MAX_CONNECTIONS_COUNT", "100"))
+    min_connections_count: int = int(os.getenv("MIN_CONNECTIONS_COUNT", "10"))
+    gzip_minimum_size: int = int(os.getenv("GZIP_MINIMUM_SIZE", "1024"))
+    gzip_compress_level: int = int(os.getenv("GZIP_COMPRESS_LEVEL", "6"))
+    slow_query_ms: int = int(os.getenv("SLOW_QUERY_MS", "100"))
+    report_stream_batch_size: int = int(os.getenv("REPORT_STREAM_BATCH_SIZE", "500"))
+    report_fetch_concurrency: int = int(os.getenv("REPORT_FETCH_CONCURRENCY", "3"))
+    report_summary_max_records: int = int(os.getenv("REPORT_SUMMARY_MAX_RECORDS", "10000"))
+    
+    # Server processes (see gunicorn_conf.py), cross-worker cache invalidation (see cache_sync.py)
+    # and metrics (see metrics_sync.py)
+    web_host: str = os.getenv("WEB_HOST", "0.0.0.0")
+    web_port: int = int(os.getenv("WEB_PORT", "8001"))
+    # >1 needs DATABASE_ENGINE=mongo; /metrics then merges every worker's samples
+    # through METRICS_SYNC_DIR (see metrics_sync.py)
+    web_workers: int = int(os.getenv("WEB_WORKERS", "1"))
+    web_graceful_timeout_seconds: int = int(os.getenv("WEB_GRACEFUL_TIMEOUT_SECONDS", "30"))
+    web_max_requests: int = int(os.getenv("WEB_MAX_REQUESTS", "0"))  # recycle workers after N requests, 0 = never
+    cache_sync: str = os.getenv("CACHE_SYNC", "auto")  # auto, change_stream, local or off
+    cache_sync_dir: str = os.getenv("CACHE_SYNC_DIR", "/tmp/sismobi-cache-sync")
+    metrics_sync_dir: str = os.getenv("METRICS_SYNC_DIR", "/tmp/sismobi-metrics")
+    metrics_sync_seconds: float = float(os.getenv("METRICS_SYNC_SECONDS", "5"))
+    
+    # Real-time dashboard push (see dashboard_stream.py)
+    dashboard_stream_mode: str = os.getenv("DASHBOARD_STREAM_MODE", "auto")  # auto, change_stream or poll
+    dashboard_push_interval_ms: int = int(os.getenv("DASHBOARD_PUSH_INTERVAL_MS", "500"))
+    dashboard_poll_seconds: float = float(os.getenv("DASHBOARD_POLL_SECONDS", "5"))
+    dashboard_subscriber_queue_size: int = int(os.getenv("DASHBOARD_SUBSCRIBER_QUEUE_SIZE", "16"))
+    dashboard_auth_timeout_seconds: float = float(os.getenv("DASHBOARD_AUTH_TIMEOUT_SECONDS", "10"))
+    
+    # Startup warmup and readiness probes (see warmup.py)
+    warmup_enabled: bool = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+    warmup_timeout_seconds: int = int(os.getenv("WARMUP_TIMEOUT_SECONDS", "30"))
+    readiness_cache_seconds: float = float(os.getenv("READINESS_CACHE_SECONDS", "5"))
+    readiness_timeout_seconds: float = float(os.getenv("READINESS_TIMEOUT_SECONDS", "2"))
+    
+    # Document Storage
+    document_storage_path: str = os.getenv("DOCUMENT_STORAGE_PATH", "./uploads")
+    document_upload_chunk_size: int = int(os.getenv("DOCUMENT_UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+    document_max_upload_mb: int = int(os.getenv("DOCUMENT_MAX_UPLOAD_MB", "100"))
+    # Internal nginx location serving DOCUMENT_STORAGE_PATH, e.g. "/_blobs/" with
+    #   location /_blobs/ { internal; alias <storage path>/; etag off; add_header ETag $upstream_http_etag; }
+    # Downloads are then sent by nginx (sendfile) instead of through Python; empty serves them in-process
+    document_accel_redirect_prefix: str = os.getenv("DOCUMENT_ACCEL_REDIRECT_PREFIX", "")
+    blob_sweep_interval_minutes: int = int(os.getenv("BLOB_SWEEP_INTERVAL_MINUTES", "60"))
+    blob_sweep_grace_minutes: int = int(os.getenv("BLOB_SWEEP_GRACE_MINUTES", "60"))
+    blob_sweep_batch_size: int = int(os.getenv("BLOB_SWEEP_BATCH_SIZE", "200"))
+    document_workers: int = int(os.getenv("DOCUMENT_WORKERS", "2"))
+    document_queue_size: int = int(os.getenv("DOCUMENT_QUEUE_SIZE", "100"))
+    document_processing_attempts: int = int(os.getenv("DOCUMENT_PROCESSING_ATTEMPTS", "3"))
+    document_processing_rescan_seconds: int = int(os.getenv("DOCUMENT_PROCESSING_RESCAN_SECONDS", "60"))
+    document_thumbnail_size: int = int(os.getenv("DOCUMENT_THUMBNAIL_SIZE", "256"))
+    document_text_max_chars: int = int(os.getenv("DOCUMENT_TEXT_MAX_CHARS", "200000"))
+    # Leading characters of the extracted text whose words are searchable (GET /documents?q=)
+    document_text_index_chars: int = int(os.getenv("DOCUMENT_TEXT_INDEX_CHARS", "20000"))
+    
+    # Profiling (all selectors off by default)
+    profiling_dir: str = os.getenv("PROFILING_DIR", "./profiles")
+    profiling_routes: List[str] = []  # route templates, e.g. PROFILING_ROUTES='["/api/v1/reports/financial"]'
+    profiling_token: str = os.getenv("PROFILING_TOKEN", "")
+    profiling_sample_rate: int = int(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+    profiling_interval_ms: float = float(os.getenv("PROFILING_INTERVAL_MS", "5"))
+    profiling_max_per_route: int = int(os.getenv("PROFILING_MAX_PER_ROUTE", "50"))  # older profiles are deleted
+    admin_emails: List[str] = ["admin@sismobi.com"]
     
     class Config:
         env_file = ".env"
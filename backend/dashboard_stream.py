@@ -0,0 +1,353 @@
+"""
+Real-time dashboard updates for SISMOBI 3.2.0
+
+Clients connect to /api/v1/dashboard/ws, send their access token as the
+first message, {"type": "auth", "token": "..."}, and then receive, instead
+of polling /api/v1/dashboard/summary and /api/v1/alerts:
+
+    {"type": "snapshot", "data": {...DashboardSummary...}}
+        on connect, and again if the client falls behind
+    {"type": "diff", "changes": {field: new value, ...},
+     "alerts": {"upserted": [alert, ...], "deleted": [alert id, ...]}}
+        whenever something changed
+
+One DashboardHub per worker feeds every subscriber of that worker, started
+with the first subscriber. Upstream it uses one of:
+
+- change streams on properties, tenants, transactions and alerts. Events are
+  folded into the counters: the hub remembers what each document contributes
+  (by _id), so an update or delete swaps the old contribution for the new one
+  without a query. Only documents that contribute are remembered: resolved
+  alerts are neither loaded nor kept, so deleting a resolved alert is not
+  pushed (clients drop it on their next alert list reload). Only
+  recent_transactions is re-read, with one indexed sort, after transactions
+  change. A new month triggers a full reload.
+- polling, when the deployment has no change streams: the summary is
+  recomputed every DASHBOARD_POLL_SECONDS and alerts are picked up by
+  updated_at (deletions then only show in pending_alerts).
+
+Changes are coalesced over DASHBOARD_PUSH_INTERVAL_MS, and only fields whose
+value changed are sent.
+"""
+from typing import Any, Dict, List, Optional, Set, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import structlog
+from pymongo.errors import PyMongoError
+
+from repository import Database
+from config import settings
+from models import DashboardSummary
+from utils import calculate_dashboard_summary, convert_objectid_to_str
+
+logger = structlog.get_logger(__name__)
+
+WATCHED_COLLECTIONS = ["properties", "tenants", "transactions", "alerts"]
+COUNTER_FIELDS = (
+    "total_properties", "total_tenants", "occupied_properties", "vacant_properties",
+    "total_monthly_income", "total_monthly_expenses", "pending_alerts"
+)
+_WRITE_OPERATIONS = ["insert", "update", "replace", "delete"]
+_RELOAD_DELAY_SECONDS = 1
+
+def month_window(now: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    """First instant of the current and of the next month (as in calculate_dashboard_summary)"""
+    start = (now or datetime.now()).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return start, (start + timedelta(days=32)).replace(day=1)
+
+def contribution(collection: str, document: Dict[str, Any], month: Tuple[datetime, datetime]) -> Dict[str, float]:
+    """What one document adds to the dashboard counters (non-zero entries only)"""
+    values: Dict[str, float] = {}
+    if collection == "properties":
+        values["total_properties"] = 1
+        if document.get("status") == "rented":
+            values["occupied_properties"] = 1
+        elif document.get("status") == "vacant":
+            values["vacant_properties"] = 1
+    elif collection == "tenants":
+        if document.get("status") == "active":
+            values["total_tenants"] = 1
+    elif collection == "alerts":
+        if document.get("resolved") is False:
+            values["pending_alerts"] = 1
+    elif collection == "transactions":
+        date = document.get("date")
+        if isinstance(date, datetime) and month[0] <= date < month[1]:
+            field = {"income": "total_monthly_income", "expense": "total_monthly_expenses"}.get(document.get("type"))
+            if field:
+                values[field] = document.get("amount") or 0
+    return values
+
+# Documents (and fields) whose contributions are loaded at startup
+_SNAPSHOT_QUERIES = {
+    "properties": lambda month: ({}, {"status": 1}),
+    "tenants": lambda month: ({"status": "active"}, {"status": 1}),
+    "alerts": lambda month: ({"resolved": False}, {"id": 1, "resolved": 1}),
+    "transactions": lambda month: ({"date": {"$gte": month[0], "$lt": month[1]}}, {"type": 1, "amount": 1, "date": 1}),
+}
+
+class DashboardHub:
+    """One upstream watcher per worker, fanned out to subscriber queues"""
+
+    def __init__(self, push_interval: float, poll_interval: float, queue_size: int, mode: str = "auto"):
+        self.push_interval = push_interval
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.mode = mode
+        self.source: Optional[str] = None
+        self._db: Optional[Database] = None
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._tasks: List[asyncio.Task] = []
+        self._start_lock: Optional[asyncio.Lock] = None
+        # Folded state
+        self._month = month_window()
+        self._counters: Dict[str, float] = {}
+        self._contributions: Dict[str, Dict[Any, Dict[str, float]]] = {}
+        # API id of each pending alert, by _id (delete events only carry the _id)
+        self._alert_ids: Dict[Any, str] = {}
+        self._recent: List[Dict[str, Any]] = []
+        self._recent_dirty = False
+        self._summary: Optional[Dict[str, Any]] = None
+        # Pending changes since the last push
+        self._dirty = False
+        self._alerts_upserted: Dict[str, Dict[str, Any]] = {}
+        self._alerts_deleted: Set[str] = set()
+        self._alerts_seen = datetime.now()
+        self._published: Dict[str, Any] = {}
+
+    # Subscribers
+
+    async def subscribe(self, db: Database) -> asyncio.Queue:
+        """Queue of messages for one client, starting with a snapshot"""
+        await self._ensure_started(db)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        queue.put_nowait(self._snapshot_message())
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def _snapshot_message(self) -> Dict[str, Any]:
+        return {"type": "snapshot", "data": self._published}
+
+    def _fan_out(self, message: Dict[str, Any]):
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # A slow client gets the current state instead of the backlog
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self._snapshot_message())
+
+    # Lifecycle
+
+    async def _ensure_started(self, db: Database):
+        if self._tasks:
+            return
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._tasks:
+                return
+            self._db = db
+            self._alerts_seen = datetime.now()
+            stream = None
+            if self.mode in ("auto", "change_stream"):
+                try:
+                    stream = self._watch()
+                    # Opening the stream first means nothing written during the load is missed
+                    change = await stream.try_next()
+                    await self._load()
+                    if change is not None:
+                        self._apply(change)
+                    self.source = "change_stream"
+                except PyMongoError as e:
+                    if self.mode == "change_stream":
+                        raise
+                    logger.info("Change streams unavailable, dashboard updates fall back to polling", error=str(e))
+                    stream = None
+            if stream is None:
+                await self._poll()
+                self.source = "poll"
+                self._tasks.append(asyncio.create_task(self._poll_loop()))
+            else:
+                self._tasks.append(asyncio.create_task(self._stream_loop(stream)))
+            self._publish_state()
+            self._tasks.append(asyncio.create_task(self._push_loop()))
+            logger.info("Dashboard hub started", source=self.source)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._subscribers.clear()
+
+    # Change streams
+
+    def _watch(self, resume_token=None):
+        return self._db.watch(
+            [{"$match": {"ns.coll": {"$in": WATCHED_COLLECTIONS}, "operationType": {"$in": _WRITE_OPERATIONS}}}],
+            full_document="updateLookup",
+            resume_after=resume_token
+        )
+
+    async def _load(self):
+        """Rebuild every contribution from the collections"""
+        self._month = month_window()
+        self._contributions = {name: {} for name in WATCHED_COLLECTIONS}
+        self._alert_ids = {}
+        for name, query in _SNAPSHOT_QUERIES.items():
+            filter_dict, projection = query(self._month)
+            async for document in self._db[name].find(filter_dict, projection):
+                values = contribution(name, document, self._month)
+                if values:
+                    self._contributions[name][document["_id"]] = values
+                if name == "alerts" and "id" in document:
+                    self._alert_ids[document["_id"]] = document["id"]
+        self._counters = {field: 0 for field in COUNTER_FIELDS}
+        for documents in self._contributions.values():
+            for values in documents.values():
+                for field, value in values.items():
+                    self._counters[field] += value
+        self._recent = await self._recent_transactions()
+        self._recent_dirty = False
+        self._dirty = True
+
+    def _apply(self, change: Dict[str, Any]):
+        """Fold one change event into the counters"""
+        collection = change["ns"]["coll"]
+        _id = change["documentKey"]["_id"]
+        document = change.get("fullDocument")
+        new = contribution(collection, document, self._month) if document else {}
+        old = self._contributions[collection].pop(_id, {})
+        if new:
+            self._contributions[collection][_id] = new
+        for field, value in old.items():
+            self._counters[field] -= value
+        for field, value in new.items():
+            self._counters[field] += value
+
+        if collection == "transactions":
+            self._recent_dirty = True
+        elif collection == "alerts":
+            if document is not None and "id" in document:
+                alert = convert_objectid_to_str(dict(document))
+                if new:
+                    self._alert_ids[_id] = alert["id"]
+                else:
+                    self._alert_ids.pop(_id, None)
+                self._alerts_upserted[alert["id"]] = alert
+                self._alerts_deleted.discard(alert["id"])
+            elif document is None and _id in self._alert_ids:
+                alert_id = self._alert_ids.pop(_id)
+                self._alerts_upserted.pop(alert_id, None)
+                self._alerts_deleted.add(alert_id)
+        self._dirty = True
+
+    async def _stream_loop(self, stream):
+        resume_token = stream.resume_token
+        while True:
+            try:
+                async with stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        self._apply(change)
+                stream = self._watch(resume_token)
+                continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # A dropped stream, or an event that could not be folded:
+                # either way the counters can no longer be trusted
+                logger.warning("Dashboard change stream interrupted, reloading", error=str(e) or type(e).__name__)
+            while True:
+                await asyncio.sleep(_RELOAD_DELAY_SECONDS)
+                try:
+                    stream = self._watch()
+                    await stream.try_next()
+                    await self._load()
+                    break
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning("Dashboard reload failed", error=str(e) or type(e).__name__)
+            resume_token = stream.resume_token
+
+    async def _recent_transactions(self) -> List[Dict[str, Any]]:
+        cursor = self._db.transactions.find({}).sort("created_at", -1).limit(5)
+        return [convert_objectid_to_str(transaction) async for transaction in cursor]
+
+    # Polling fallback
+
+    async def _poll(self):
+        self._summary = await calculate_dashboard_summary(self._db)
+        since, self._alerts_seen = self._alerts_seen, datetime.now()
+        async for alert in self._db.alerts.find({"updated_at": {"$gt": since}, "id": {"$exists": True}}):
+            alert = convert_objectid_to_str(alert)
+            self._alerts_upserted[alert["id"]] = alert
+        self._dirty = True
+
+    async def _poll_loop(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self._poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Dashboard poll failed", error=str(e) or type(e).__name__)
+
+    # Publishing
+
+    def _current_summary(self) -> Dict[str, Any]:
+        if self.source == "poll":
+            summary = self._summary
+        else:
+            summary = {field: self._counters[field] for field in COUNTER_FIELDS}
+            for field in ("total_monthly_income", "total_monthly_expenses"):
+                summary[field] = round(summary[field], 2)
+            summary["recent_transactions"] = self._recent
+        return DashboardSummary(**summary).model_dump(mode="json")
+
+    def _publish_state(self) -> Optional[Dict[str, Any]]:
+        """Diff message against the last published state, or None if unchanged"""
+        current = self._current_summary()
+        changes = {field: value for field, value in current.items() if self._published.get(field) != value}
+        alerts = {"upserted": list(self._alerts_upserted.values()), "deleted": sorted(self._alerts_deleted)}
+        self._published = current
+        self._alerts_upserted = {}
+        self._alerts_deleted = set()
+        self._dirty = False
+        if not changes and not alerts["upserted"] and not alerts["deleted"]:
+            return None
+        return {"type": "diff", "changes": changes, "alerts": alerts}
+
+    async def _push_loop(self):
+        while True:
+            await asyncio.sleep(self.push_interval)
+            try:
+                if self.source == "change_stream" and month_window() != self._month:
+                    await self._load()
+                if not self._dirty:
+                    continue
+                if self._recent_dirty:
+                    self._recent_dirty = False
+                    self._recent = await self._recent_transactions()
+                message = self._publish_state()
+                if message is not None:
+                    self._fan_out(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Dashboard push failed", error=str(e))
+
+# Global hub, started by the first subscriber and stopped from the app lifespan
+dashboard_hub = DashboardHub(
+    push_interval=settings.dashboard_push_interval_ms / 1000,
+    poll_interval=settings.dashboard_poll_seconds,
+    queue_size=settings.dashboard_subscriber_queue_size,
+    mode=settings.dashboard_stream_mode
+)
@@ -1,40 +1,139 @@
 """
 Database connection and configuration for SISMOBI 3.2.0
 """
-import motor.motor_asyncio
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
-from typing import Optional
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+from typing import Any, Dict, Optional
 import structlog
 from config import settings
+from db_monitoring import command_listener, pool_listener
+import repository
 
 logger = structlog.get_logger(__name__)
 
+# Route classes with their own read preference (see get_collection)
+READ_DEFAULT = "default"
+READ_REPORTS = "reports"
+
 class Database:
-    client: Optional[AsyncIOMotorClient] = None
-    database: Optional[AsyncIOMotorDatabase] = None
+    client: Optional[repository.Client] = None
+    database: Optional[repository.Database] = None
+    read_views: Dict[str, repository.Database] = {}
 
 # Global database instance
 db = Database()
 
+def _timeout(ms: int) -> Optional[int]:
+    return ms if ms > 0 else None
+
+def client_options() -> Dict[str, Any]:
+    """Motor client keyword arguments built from settings"""
+    options = {
+        "maxPoolSize": settings.max_connections_count,
+        "minPoolSize": settings.min_connections_count,
+        "maxIdleTimeMS": _timeout(settings.mongo_max_idle_time_ms),
+        "waitQueueTimeoutMS": _timeout(settings.mongo_wait_queue_timeout_ms),
+        "serverSelectionTimeoutMS": settings.mongo_server_selection_timeout_ms,
+        "connectTimeoutMS": _timeout(settings.mongo_connect_timeout_ms),
+        "socketTimeoutMS": _timeout(settings.mongo_socket_timeout_ms),
+        "retryReads": settings.mongo_retry_reads,
+        "retryWrites": settings.mongo_retry_writes,
+        "readPreference": settings.mongo_read_preference,
+        "event_listeners": [command_listener, pool_listener],
+    }
+    if settings.mongo_compressors:
+        options["compressors"] = settings.mongo_compressors
+        options["zlibCompressionLevel"] = settings.mongo_zlib_compression_level
+    return options
+
+def read_preference(mode: str, max_staleness_seconds: int = -1):
+    """pymongo read preference from a mode name, e.g. secondaryPreferred"""
+    return make_read_preference(read_pref_mode_from_name(mode), None, max_staleness_seconds)
+
+def _build_read_views(client: repository.Client) -> Dict[str, repository.Database]:
+    report_preference = read_preference(
+        settings.mongo_report_read_preference, settings.mongo_report_max_staleness_seconds
+    )
+    return {
+        READ_DEFAULT: db.database,
+        READ_REPORTS: client.get_database(settings.database_name, read_preference=report_preference),
+    }
+
 async def connect_to_mongo():
     """Create database connection"""
     try:
-        logger.info("Connecting to MongoDB", url=settings.mongo_url)
-        db.client = AsyncIOMotorClient(
-            settings.mongo_url,
-            maxPoolSize=settings.max_connections_count,
-            minPoolSize=settings.min_connections_count,
-        )
+        if settings.database_engine == "memory":
+            logger.info("Using in-memory database engine")
+        else:
+            logger.info("Connecting to MongoDB", url=settings.mongo_url)
+        db.client = repository.create_client(**client_options())
         db.database = db.client[settings.database_name]
+        db.read_views = _build_read_views(db.client)
         
         # Test connection
         await db.client.admin.command('ismaster')
         logger.info("Successfully connected to MongoDB")
         
+        await ensure_indexes(db.database)
+        
     except Exception as e:
         logger.error("Failed to connect to MongoDB", error=str(e))
         raise
 
+# (collection, keys, options, required). A required index backs a
+# correctness guarantee rather than a query plan, so startup fails without it
+_INDEXES = [
+    # Bill group summaries: $match on group_id (+ year), series by year/month
+    ("water_bills", [("group_id", 1), ("year", 1), ("month", 1)], {}, False),
+    ("energy_bills", [("group_id", 1), ("year", 1), ("month", 1)], {}, False),
+    # Contract expiry scan: active tenants by contract end date
+    ("tenants", [("status", 1), ("contract_end_date", 1)], {}, False),
+    # Report filters: distinct property types / statuses
+    ("properties", "type", {}, False),
+    ("properties", "status", {}, False),
+    # Report lookups: anchored prefix match on the normalized words (see utils.SEARCH_FIELDS)
+    ("properties", "search_keywords", {}, False),
+    ("tenants", "search_keywords", {}, False),
+    # Document search: words of the name and of the extracted text (see document_processing)
+    ("documents", "search_keywords", {}, False),
+    # Report history: paginated listing and per-type latency summary
+    ("reports_history", [("report_type", 1), ("created_at", -1)], {}, False),
+    ("reports_history", "created_at", {}, False),
+    # List ETags: newest updated_at of the filtered set (see get_collection_validators)
+    *[
+        (collection, "updated_at", {}, False)
+        for collection in ("properties", "tenants", "transactions", "alerts", "energy_bills", "water_bills")
+    ],
+    # Single-document routes look entities up by their API id
+    *[
+        (collection, "id", {}, False)
+        for collection in ("properties", "tenants", "transactions", "alerts", "documents", "users")
+    ],
+    # Generated alerts are deduplicated on dedup_key
+    ("alerts", "dedup_key", {"unique": True, "sparse": True}, True),
+    # Blob reference counts: one record per hash (see storage.retain_blob),
+    # sweeper scan for unreferenced blobs
+    ("blobs", "sha256", {"unique": True}, True),
+    ("blobs", [("refcount", 1), ("unreferenced_at", 1)], {}, False),
+]
+
+async def ensure_indexes(database: repository.Database):
+    """Create the secondary indexes the routers rely on (idempotent)
+
+    Each index is created on its own, so one failure does not skip the rest.
+    Raises RuntimeError if a required (unique) index could not be created.
+    """
+    missing = []
+    for collection, keys, options, required in _INDEXES:
+        try:
+            await database[collection].create_index(keys, **options)
+        except Exception as e:
+            logger.warning("Could not ensure database index", collection=collection, keys=str(keys), error=str(e))
+            if required:
+                missing.append(f"{collection}.{keys}")
+    if missing:
+        raise RuntimeError(f"Required database indexes could not be created: {', '.join(missing)}")
+    logger.info("Database indexes ensured")
+
 async def close_mongo_connection():
     """Close database connection"""
     try:
@@ -44,13 +143,18 @@ async def close_mongo_connection():
     except Exception as e:
         logger.error("Error closing MongoDB connection", error=str(e))
 
-def get_database() -> AsyncIOMotorDatabase:
+def get_database() -> repository.Database:
     """Get database instance"""
     if db.database is None:
         raise Exception("Database not connected")
     return db.database
 
-def get_collection(collection_name: str):
-    """Get collection instance"""
+def get_collection(collection_name: str, route_class: str = READ_DEFAULT):
+    """Get collection instance
+
+    route_class selects the read preference: READ_REPORTS reads follow
+    MONGO_REPORT_READ_PREFERENCE so heavy report queries can go to
+    secondaries; everything else uses MONGO_READ_PREFERENCE.
+    """
     database = get_database()
-    return database[collection_name]
\ No newline at end of file
+    return db.read_views.get(route_class, database)[collection_name]
\ No newline at end of file
@@ -0,0 +1,195 @@
+"""
+MongoDB command instrumentation for SISMOBI 3.2.0
+
+A pymongo CommandListener that feeds per-collection, per-command latency
+histograms, logs slow commands with their normalized query shape, and adds
+each command to the stats of the HTTP request that issued it.
+
+A ConnectionPoolListener records how long operations wait to check a
+connection out of the pool and how many connections are open and in use,
+which shows when MAX_CONNECTIONS_COUNT is too small for the request load.
+
+Motor runs pymongo calls on its executor with a copy of the caller's
+contextvars, so the listener (called synchronously on that thread) sees the
+request's stats object set by MetricsMiddleware.
+"""
+from typing import Any, Dict, Tuple
+import threading
+import time
+import structlog
+from pymongo import monitoring
+
+from config import settings
+from metrics import current_request_db_stats, registry
+
+logger = structlog.get_logger(__name__)
+
+MONGO_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+POOL_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+mongo_command_duration = registry.histogram(
+    "sismobi_mongo_command_duration_seconds", "MongoDB command latency by collection and command",
+    ("collection", "command"), buckets=MONGO_BUCKETS
+)
+mongo_command_failures = registry.counter(
+    "sismobi_mongo_command_failures_total", "Failed MongoDB commands by collection and command",
+    ("collection", "command")
+)
+mongo_pool_wait = registry.histogram(
+    "sismobi_mongo_pool_wait_seconds", "Time spent checking a connection out of the pool, by outcome",
+    ("outcome",), buckets=POOL_WAIT_BUCKETS
+)
+mongo_pool_connections = registry.gauge(
+    "sismobi_mongo_pool_connections", "Pooled connections by server and state (open, in_use)",
+    ("address", "state")
+)
+
+# Command fields that are not part of the query shape
+_IGNORED_FIELDS = {
+    "lsid", "$db", "$clusterTime", "$readPreference", "txnNumber", "autocommit",
+    "startTransaction", "documents", "cursor", "batchSize", "maxTimeMS", "ordered", "comment"
+}
+_MAX_SHAPE_DEPTH = 6
+# Elements kept from a list of clauses (e.g. a bulk write's updates)
+_MAX_SHAPE_ITEMS = 20
+# Operators whose list holds values rather than clauses
+_VALUE_LIST_OPERATORS = {"$in", "$nin", "$all"}
+
+def normalize_shape(value: Any, depth: int = 0, values_only: bool = False) -> Any:
+    """Replace literal values with '?' keeping field names and operators
+
+    Lists of values ($in/$nin/$all operands, lists of scalars) collapse to
+    the shape of their first element, so {"$in": [...]} with 3 or 300 ids
+    yields the same shape. Other lists (pipeline stages, $or/$and/$facet
+    branches, update batches) keep their elements, up to _MAX_SHAPE_ITEMS.
+    """
+    if depth > _MAX_SHAPE_DEPTH:
+        return "..."
+    if isinstance(value, dict):
+        return {
+            key: normalize_shape(item, depth + 1, key in _VALUE_LIST_OPERATORS)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return []
+        if values_only or not any(isinstance(item, (dict, list, tuple)) for item in value):
+            return [normalize_shape(value[0], depth + 1)]
+        shape = [normalize_shape(item, depth + 1) for item in value[:_MAX_SHAPE_ITEMS]]
+        return shape + ["..."] if len(value) > _MAX_SHAPE_ITEMS else shape
+    return "?"
+
+def command_shape(command_name: str, command: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalized form of a command, without payloads and session fields"""
+    return {
+        key: normalize_shape(value)
+        for key, value in command.items()
+        if key not in _IGNORED_FIELDS and key != command_name
+    }
+
+def _collection_of(command_name: str, command: Dict[str, Any]) -> str:
+    if command_name == "getMore":
+        return str(command.get("collection", "?"))
+    target = command.get(command_name)
+    return target if isinstance(target, str) else "-"
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Records every command's duration; only the slow path does real work"""
+
+    def __init__(self, slow_command_ms: float):
+        self.slow_command_seconds = slow_command_ms / 1000
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[int, Any], Tuple[str, Dict[str, Any]]] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        collection = _collection_of(event.command_name, event.command)
+        with self._lock:
+            self._pending[(event.request_id, event.connection_id)] = (collection, event.command)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._finish(event, failed=False)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self._finish(event, failed=True)
+
+    def _finish(self, event, failed: bool):
+        with self._lock:
+            collection, command = self._pending.pop((event.request_id, event.connection_id), ("?", None))
+        seconds = event.duration_micros / 1_000_000
+        mongo_command_duration.observe(seconds, collection, event.command_name)
+        if failed:
+            mongo_command_failures.inc(collection, event.command_name)
+
+        stats = current_request_db_stats.get()
+        if stats is not None:
+            stats.durations.append(seconds)
+
+        if seconds >= self.slow_command_seconds and command is not None:
+            logger.warning(
+                "Slow Mongo command",
+                collection=collection,
+                command=event.command_name,
+                duration_ms=round(seconds * 1000, 2),
+                shape=command_shape(event.command_name, command),
+                failed=failed
+            )
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Pool wait times and connection counts
+
+    pymongo >= 4.7 reports the checkout duration on the event; older drivers
+    are timed from the checkout-started event, which fires on the same thread.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _address(self, event) -> str:
+        host, port = event.address
+        return f"{host}:{port}"
+
+    def _waited(self, event) -> float:
+        duration = getattr(event, "duration", None)
+        if duration is not None:
+            return duration
+        return time.perf_counter() - getattr(self._local, "started", time.perf_counter())
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        mongo_pool_wait.observe(self._waited(event), "ok")
+        mongo_pool_connections.inc(self._address(event), "in_use")
+
+    def connection_check_out_failed(self, event):
+        mongo_pool_wait.observe(self._waited(event), str(event.reason))
+        if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+            logger.warning("Timed out waiting for a Mongo connection", address=self._address(event))
+
+    def connection_checked_in(self, event):
+        mongo_pool_connections.dec(self._address(event), "in_use")
+
+    def connection_created(self, event):
+        mongo_pool_connections.inc(self._address(event), "open")
+
+    def connection_closed(self, event):
+        mongo_pool_connections.dec(self._address(event), "open")
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+# Global listeners, registered on the client in database.connect_to_mongo
+command_listener = CommandMetricsListener(settings.slow_query_ms)
+pool_listener = PoolMetricsListener()
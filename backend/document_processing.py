@@ -0,0 +1,324 @@
+"""
+Document processing pipeline for SISMOBI 3.2.0
+
+Renders first-page thumbnails and extracts plain text from uploaded blobs on
+a local process pool. Jobs go through a bounded asyncio queue; results are
+written next to the blob (<sha256>.thumb.png, <sha256>.txt), recorded on
+the blob and on every document that points at it, and served by
+GET /documents/{id}/thumbnail and GET /documents/{id}/text. The words of the
+first DOCUMENT_TEXT_INDEX_CHARS characters of the text are added to the
+documents' search_keywords, next to the words of their names, so
+GET /documents?q= finds them through the index. Processing state is kept
+per blob, so deduplicated uploads are processed once; the processor is
+therefore chosen from the content's signature, not from the mime_type the
+first uploader declared.
+
+PDF support uses pypdfium2 and images use Pillow; both are imported inside
+the worker processes only.
+"""
+from typing import Any, Dict, List, Optional, Set
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+import asyncio
+import codecs
+import os
+import re
+import structlog
+
+from repository import Database
+from config import settings
+from leases import Lease
+from storage import BLOBS_COLLECTION, TEXT_SUFFIX, THUMBNAIL_SUFFIX, blob_store
+from utils import search_keywords
+
+logger = structlog.get_logger(__name__)
+
+# Worker-side functions (run in the process pool)
+
+def _write_atomic(path: str, data: bytes):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def _save_thumbnail(image, path: str, size: int):
+    import io
+    image.thumbnail((size, size))
+    if image.mode not in ("RGB", "RGBA", "L"):
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    _write_atomic(path, buffer.getvalue())
+
+# Leading bytes of the image formats Pillow opens
+_IMAGE_SIGNATURES = (
+    b"\x89PNG\r\n\x1a\n", b"\xff\xd8\xff", b"GIF87a", b"GIF89a", b"II*\x00", b"MM\x00*"
+)
+_SNIFF_BYTES = 8192
+
+def detect_kind(path: str) -> Optional[str]:
+    """"pdf", "image" or "text" from the file's leading bytes, None if unsupported"""
+    with open(path, "rb") as f:
+        head = f.read(_SNIFF_BYTES)
+    if head.startswith(b"%PDF-"):
+        return "pdf"
+    if head.startswith(_IMAGE_SIGNATURES) or (head[:4] == b"RIFF" and head[8:12] == b"WEBP"):
+        return "image"
+    if head and b"\x00" not in head:
+        # A multi-byte character may be cut at the end of the sample
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        try:
+            decoder.decode(head, final=len(head) < _SNIFF_BYTES)
+            return "text"
+        except UnicodeDecodeError:
+            pass
+    return None
+
+def process_blob(path: str, thumbnail_size: int, max_text_chars: int, index_chars: int = 0) -> Dict[str, Any]:
+    """Create the thumbnail and text artifacts for one blob
+
+    Returns {"kind": str or None, "thumbnail": bool, "text_chars": int,
+    "keywords": [words of the first index_chars characters], "supported": bool}.
+    """
+    kind = detect_kind(path)
+    result = {"kind": kind, "thumbnail": False, "text_chars": 0, "keywords": [], "supported": True}
+
+    if kind == "pdf":
+        import pypdfium2 as pdfium
+        pdf = pdfium.PdfDocument(path)
+        try:
+            if len(pdf):
+                first_page = pdf[0]
+                width = first_page.get_width()
+                bitmap = first_page.render(scale=thumbnail_size / max(width, 1))
+                _save_thumbnail(bitmap.to_pil(), path + THUMBNAIL_SUFFIX, thumbnail_size)
+                result["thumbnail"] = True
+
+            parts: List[str] = []
+            remaining = max_text_chars
+            for index in range(len(pdf)):
+                if remaining <= 0:
+                    break
+                text = pdf[index].get_textpage().get_text_range()[:remaining]
+                parts.append(text)
+                remaining -= len(text)
+            text = "\n".join(parts).strip()
+        finally:
+            pdf.close()
+    elif kind == "image":
+        from PIL import Image
+        with Image.open(path) as image:
+            image.seek(0)
+            _save_thumbnail(image.copy(), path + THUMBNAIL_SUFFIX, thumbnail_size)
+        result["thumbnail"] = True
+        text = ""
+    elif kind == "text":
+        with open(path, "rb") as f:
+            text = f.read(max_text_chars * 4).decode("utf-8", errors="replace")[:max_text_chars].strip()
+    else:
+        result["supported"] = False
+        return result
+
+    if text:
+        _write_atomic(path + TEXT_SUFFIX, text.encode("utf-8"))
+        result["text_chars"] = len(text)
+        indexed = text[:index_chars]
+        if len(text) > index_chars and text[index_chars].isalnum():
+            # Leave out the word cut in half at the end of the prefix
+            indexed = re.sub(r"\w+$", "", indexed)
+        result["keywords"] = search_keywords(indexed)
+    return result
+
+# Pipeline (runs in the API process)
+
+class DocumentPipeline:
+    """Bounded queue of blobs feeding a process pool
+
+    enqueue() never blocks a request: when the queue is full the blob stays
+    "pending" and is picked up again by the next rescan.
+    """
+
+    def __init__(self, workers: int, queue_size: int, max_attempts: int):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.queue_size = queue_size
+        self.queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=queue_size)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._queued: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+        self._db: Optional[Database] = None
+        self._rescan_lease = Lease("document-rescan", ttl_seconds=settings.document_processing_rescan_seconds * 2)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    async def start(self, db: Database):
+        """Start the consumers and requeue blobs left pending by a previous run"""
+        self._db = db
+        # A queue is bound to the event loop that first waits on it; start
+        # each run (lifespan) with a fresh one
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._queued = set()
+        self._tasks = [asyncio.create_task(self._consume()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._rescan_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._db is not None:
+            await self._rescan_lease.release(self._db)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def enqueue(self, sha256: str, attempt: int = 1) -> bool:
+        """Queue a blob for processing; returns False if the queue is full"""
+        if sha256 in self._queued:
+            return True
+        try:
+            self.queue.put_nowait({"sha256": sha256, "attempt": attempt})
+            self._queued.add(sha256)
+            return True
+        except asyncio.QueueFull:
+            logger.warning("Document processing queue full", sha256=sha256)
+            return False
+
+    async def _rescan_loop(self):
+        """Refill the queue from blobs still pending (queue overflow, restarts)
+
+        Only the worker holding the rescan lease requeues, so with several
+        workers a pending blob is not processed once per worker.
+        """
+        while True:
+            try:
+                free = self.queue.maxsize - self.queue.qsize()
+                if free > 0 and await self._rescan_lease.acquire(self._db):
+                    cursor = self._db[BLOBS_COLLECTION].find(
+                        {"processing.status": "pending", "refcount": {"$gt": 0}},
+                        {"_id": 0, "sha256": 1, "processing": 1}
+                    ).limit(free)
+                    async for blob in cursor:
+                        self.enqueue(blob["sha256"], blob["processing"].get("attempts", 0) + 1)
+            except Exception as e:
+                logger.warning("Document processing rescan failed", error=str(e))
+            await asyncio.sleep(settings.document_processing_rescan_seconds)
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._process(loop, job)
+            except Exception as e:
+                logger.error("Document processing error", sha256=job["sha256"], error=str(e))
+            finally:
+                self._queued.discard(job["sha256"])
+                self.queue.task_done()
+
+    async def _process(self, loop: asyncio.AbstractEventLoop, job: Dict[str, Any]):
+        sha256, attempt = job["sha256"], job["attempt"]
+        blobs = self._db[BLOBS_COLLECTION]
+        blob = await blobs.find_one({"sha256": sha256}, {"_id": 0, "processing.status": 1})
+        if not blob or blob.get("processing", {}).get("status") != "pending":
+            return
+
+        try:
+            result = await loop.run_in_executor(
+                self._get_pool(), process_blob, blob_store.path_for(sha256),
+                settings.document_thumbnail_size, settings.document_text_max_chars,
+                settings.document_text_index_chars
+            )
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self._pool = None
+            await self._failed(job, e)
+            return
+
+        status = "done" if result["supported"] else "unsupported"
+        keywords = result.pop("keywords")
+        await blobs.update_one(
+            {"sha256": sha256},
+            {"$set": {
+                "processing.status": status,
+                "processing.kind": result["kind"],
+                "processing.attempts": attempt,
+                "processing.finished_at": datetime.now(),
+                "has_thumbnail": result["thumbnail"],
+                "text_extracted": result["text_chars"] > 0,
+                "text_keywords": keywords
+            }}
+        )
+        await self._db.documents.update_many(
+            {"sha256": sha256},
+            {
+                "$set": {"has_thumbnail": result["thumbnail"], "text_extracted": result["text_chars"] > 0},
+                "$addToSet": {"search_keywords": {"$each": keywords}}
+            }
+        )
+        logger.info("Document processed", sha256=sha256, status=status, keywords=len(keywords), **result)
+
+    async def _failed(self, job: Dict[str, Any], error: Exception):
+        """Retry with exponential backoff, then give up and mark the blob failed"""
+        sha256, attempt = job["sha256"], job["attempt"]
+        if attempt < self.max_attempts:
+            logger.warning("Document processing failed, retrying", sha256=sha256, attempt=attempt, error=str(error))
+            await self._db[BLOBS_COLLECTION].update_one({"sha256": sha256}, {"$set": {"processing.attempts": attempt}})
+            asyncio.get_running_loop().call_later(2 ** attempt, self.enqueue, sha256, attempt + 1)
+            return
+        logger.error("Document processing failed", sha256=sha256, attempts=attempt, error=str(error))
+        await self._db[BLOBS_COLLECTION].update_one(
+            {"sha256": sha256},
+            {"$set": {"processing.status": "failed", "processing.attempts": attempt, "processing.error": str(error)}}
+        )
+
+# Global pipeline instance
+document_pipeline = DocumentPipeline(
+    workers=settings.document_workers,
+    queue_size=settings.document_queue_size,
+    max_attempts=settings.document_processing_attempts
+)
+
+async def schedule_processing(db: Database, sha256: str) -> Dict[str, bool]:
+    """Queue an uploaded blob unless it was already processed
+
+    Call after the document record is inserted, so a job finishing right away
+    still finds it. Returns the derived flags known so far for the blob and
+    the words of its text (text_keywords, see document_keywords).
+    Blobs marked unsupported before the content was sniffed (no
+    processing.kind) are processed again.
+    """
+    result = await db[BLOBS_COLLECTION].update_one(
+        {"sha256": sha256, "$or": [
+            {"processing": {"$exists": False}},
+            {"processing.status": "unsupported", "processing.kind": {"$exists": False}}
+        ]},
+        {"$set": {"processing": {"status": "pending", "attempts": 0}}}
+    )
+    if result.modified_count:
+        document_pipeline.enqueue(sha256)
+        return {"has_thumbnail": False, "text_extracted": False, "text_keywords": []}
+
+    blob = await db[BLOBS_COLLECTION].find_one(
+        {"sha256": sha256}, {"_id": 0, "has_thumbnail": 1, "text_extracted": 1, "text_keywords": 1}
+    )
+    return {
+        "has_thumbnail": bool(blob and blob.get("has_thumbnail")),
+        "text_extracted": bool(blob and blob.get("text_extracted")),
+        "text_keywords": (blob or {}).get("text_keywords", [])
+    }
+
+def document_keywords(name: Optional[str], text_keywords: List[str]) -> List[str]:
+    """search_keywords of a document: the words of its name, then those of its text"""
+    return list(dict.fromkeys(search_keywords(name) + text_keywords))
+
+async def blob_text_keywords(db: Database, sha256: Optional[str]) -> List[str]:
+    """Words recorded for a blob's extracted text ([] for metadata-only documents)"""
+    if not sha256:
+        return []
+    blob = await db[BLOBS_COLLECTION].find_one({"sha256": sha256}, {"_id": 0, "text_keywords": 1})
+    return (blob or {}).get("text_keywords", [])
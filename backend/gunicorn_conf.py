@@ -0,0 +1,50 @@
+"""
+Gunicorn configuration for SISMOBI 3.2.0 (multi-worker mode)
+
+Run from backend/:
+    gunicorn -c gunicorn_conf.py server_complex:app
+
+Each worker is a uvicorn event loop with its own lifespan: its own Mongo pool
+(MAX_CONNECTIONS_COUNT per worker), warmup, query cache and metrics registry.
+Workers keep their caches consistent through cache_sync.py, /metrics merges
+every worker's samples through metrics_sync.py, and scheduled jobs run in one
+worker at a time through leases.py.
+
+`kill -HUP <master pid>` reloads gracefully: new workers start, and old ones
+stop accepting and finish in-flight requests within WEB_GRACEFUL_TIMEOUT_SECONDS.
+"""
+import os
+
+from config import settings
+from metrics_sync import archive_worker, clear_snapshots
+
+if settings.web_workers > 1 and settings.database_engine == "memory":
+    # Each worker would get its own in-memory database
+    raise SystemExit("WEB_WORKERS > 1 needs DATABASE_ENGINE=mongo")
+
+bind = f"{settings.web_host}:{settings.web_port}"
+workers = settings.web_workers
+worker_class = "uvicorn.workers.UvicornWorker"
+graceful_timeout = settings.web_graceful_timeout_seconds
+keepalive = 5
+
+# Recycle workers after a number of requests (with jitter so they do not all
+# restart together)
+max_requests = settings.web_max_requests
+max_requests_jitter = max(settings.web_max_requests // 10, 1) if settings.web_max_requests else 0
+
+# Import the app in each worker after fork: Motor clients, executor threads
+# and sockets must not be shared across processes
+preload_app = False
+
+def on_starting(server):
+    """Remove invalidation sockets and metrics snapshots left by a previous master"""
+    if os.path.isdir(settings.cache_sync_dir):
+        for name in os.listdir(settings.cache_sync_dir):
+            if name.endswith(".sock"):
+                os.unlink(os.path.join(settings.cache_sync_dir, name))
+    clear_snapshots(settings.metrics_sync_dir)
+
+def child_exit(server, worker):
+    """Keep an exited worker's counters in the merged /metrics output"""
+    archive_worker(settings.metrics_sync_dir, worker.pid)
@@ -0,0 +1,75 @@
+"""
+Shared leases for scheduled jobs in SISMOBI 3.2.0
+
+With several workers (and hosts) running the same lifespan, periodic jobs such
+as the blob sweeper must run in one place only. A Lease is a document in the
+`leases` collection naming its current owner and expiry; taking it is a
+single conditional upsert, so at most one worker holds it at a time. The
+holder renews it each run; if it dies, another worker takes over once the
+lease expires.
+"""
+from typing import Dict, Optional
+from datetime import datetime, timedelta
+import os
+import socket
+import uuid
+import structlog
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from repository import Database
+
+logger = structlog.get_logger(__name__)
+
+LEASES_COLLECTION = "leases"
+# One document per job: the last run's result, or the completion of a one-off job
+JOBS_COLLECTION = "jobs"
+
+_worker_ids: Dict[int, str] = {}
+
+def worker_id() -> str:
+    """Identifies this worker process in lease documents (computed after fork)"""
+    pid = os.getpid()
+    if pid not in _worker_ids:
+        _worker_ids[pid] = f"{socket.gethostname()}:{pid}:{uuid.uuid4().hex[:6]}"
+    return _worker_ids[pid]
+
+class Lease:
+    def __init__(self, name: str, ttl_seconds: float, owner: Optional[str] = None):
+        self.name = name
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self._owner = owner
+        self.held = False
+
+    @property
+    def owner(self) -> str:
+        return self._owner or worker_id()
+
+    async def acquire(self, db: Database) -> bool:
+        """Take or renew the lease; False while another worker holds it"""
+        # UTC, so workers on hosts in different time zones agree on expiry
+        now = datetime.utcnow()
+        try:
+            await db[LEASES_COLLECTION].update_one(
+                {"_id": self.name, "$or": [{"owner": self.owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + self.ttl, "renewed_at": now}},
+                upsert=True
+            )
+            acquired = True
+        except DuplicateKeyError:
+            # The lease exists, is unexpired and belongs to someone else
+            acquired = False
+        if acquired != self.held:
+            logger.info("Lease acquired" if acquired else "Lease lost", lease=self.name, owner=self.owner)
+        self.held = acquired
+        return acquired
+
+    async def release(self, db: Database):
+        """Give the lease up early (it expires on its own if this fails)"""
+        if not self.held:
+            return
+        self.held = False
+        try:
+            await db[LEASES_COLLECTION].delete_one({"_id": self.name, "owner": self.owner})
+            logger.info("Lease released", lease=self.name, owner=self.owner)
+        except PyMongoError as e:
+            logger.warning("Could not release lease", lease=self.name, error=str(e))
@@ -0,0 +1,1188 @@
+"""
+In-memory storage engine for SISMOBI 3.2.0
+
+A dependency-free stand-in for Motor covering the operations the routers and
+services use (see repository.py): find/find_one with projection, sort, skip
+and limit; inserts, updates with the common operators and upserts; deletes;
+count_documents/distinct; bulk_write; find_one_and_*; and aggregation with
+$match, $group, $sort, $skip, $limit, $project/$addFields, $unwind, $count
+and $facet.
+
+Documents are held as plain dicts per collection. Indexes declared with
+create_index are real: each keeps a hash map from the value of its first
+field to document slots, so equality and $in filters on an indexed field
+(and on _id) touch only the matching documents, and unique indexes raise
+DuplicateKeyError like the server. Everything else is a scan with a filter
+compiled once per query.
+
+Results and errors reuse pymongo's classes, so calling code cannot tell the
+engines apart. Operations run synchronously on the event loop; this engine is
+meant for tests, local development and CPU-only benchmarks, not production.
+"""
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
+from datetime import datetime
+import re
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.operations import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+_MISSING = object()
+
+# Value helpers
+
+def _copy(value: Any) -> Any:
+    """Copy the mutable containers of a document (leaves are immutable)"""
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
+
+def _hashable(value: Any) -> Any:
+    if isinstance(value, dict):
+        return ("__doc__",) + tuple((key, _hashable(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return ("__list__",) + tuple(_hashable(item) for item in value)
+    return value
+
+def _resolve(value: Any, parts: Sequence[str]) -> List[Any]:
+    """Values at a dotted path, expanding arrays of sub-documents like the server"""
+    if not parts:
+        return [value]
+    if len(parts) == 1 and type(value) is dict:
+        # Plain top-level field: the common case, kept off the generic path
+        item = value.get(parts[0], _MISSING)
+        return [] if item is _MISSING else [item]
+    head, rest = parts[0], parts[1:]
+    if isinstance(value, dict):
+        return _resolve(value[head], rest) if head in value else []
+    if isinstance(value, list):
+        if head.isdigit():
+            index = int(head)
+            return _resolve(value[index], rest) if index < len(value) else []
+        found = []
+        for item in value:
+            if isinstance(item, dict):
+                found.extend(_resolve(item, parts))
+        return found
+    return []
+
+def _get_field(document: Any, path: str) -> Any:
+    """Single value at a dotted path for expressions ($field); _MISSING if absent"""
+    value = document
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        elif isinstance(value, list):
+            value = [item.get(part) for item in value if isinstance(item, dict) and part in item]
+        else:
+            return _MISSING
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+def _set_path(document: dict, path: str, value: Any):
+    parts = path.split(".")
+    target = document
+    for part in parts[:-1]:
+        if isinstance(target, list) and part.isdigit():
+            target = target[int(part)]
+            continue
+        child = target.get(part)
+        if not isinstance(child, (dict, list)):
+            child = target[part] = {}
+        target = child
+    last = parts[-1]
+    if isinstance(target, list) and last.isdigit():
+        index = int(last)
+        target.extend([None] * (index + 1 - len(target)))
+        target[index] = value
+    else:
+        target[last] = value
+
+def _unset_path(document: dict, path: str):
+    parts = path.split(".")
+    target = document
+    for part in parts[:-1]:
+        target = target.get(part) if isinstance(target, dict) else None
+        if target is None:
+            return
+    if isinstance(target, dict):
+        target.pop(parts[-1], None)
+
+# Type ordering used by sorts and comparisons (BSON comparison order)
+
+_TYPE_RANKS = {
+    type(None): 1, int: 2, float: 2, str: 3, dict: 4, list: 5, ObjectId: 7, bool: 8, datetime: 9
+}
+
+def _type_rank(value: Any) -> int:
+    rank = _TYPE_RANKS.get(type(value))
+    if rank is not None:
+        return rank
+    if value is _MISSING:
+        return 1
+    # Subclasses (str enums, datetime subclasses...) rank like their base type
+    rank = next((r for cls, r in list(_TYPE_RANKS.items()) if cls is not type(None) and isinstance(value, cls)), 10)
+    _TYPE_RANKS[type(value)] = rank
+    return rank
+
+def _sort_key(value: Any) -> Tuple[int, Any]:
+    rank = _type_rank(value)
+    if rank in (1,):
+        return (rank, 0)
+    if rank in (4, 5, 10):
+        return (rank, repr(value))
+    return (rank, value)
+
+_ORDERED_TYPES = (int, float, str, datetime, ObjectId)
+
+def _comparable(a: Any, b: Any) -> bool:
+    return _type_rank(a) == _type_rank(b) and _type_rank(a) not in (4, 5, 10)
+
+_TYPE_ALIASES = {
+    "double": (float,), "int": (int,), "long": (int,), "decimal": (float,),
+    "number": (int, float), "string": (str,), "object": (dict,), "array": (list,),
+    "objectId": (ObjectId,), "bool": (bool,), "date": (datetime,), "null": (type(None),),
+    1: (float,), 2: (str,), 3: (dict,), 4: (list,), 7: (ObjectId,), 8: (bool,), 9: (datetime,),
+    10: (type(None),), 16: (int,), 18: (int,),
+}
+
+def _is_type(value: Any, type_name: Any) -> bool:
+    names = type_name if isinstance(type_name, list) else [type_name]
+    for name in names:
+        types = _TYPE_ALIASES.get(name)
+        if types is None:
+            raise OperationFailure(f"Unsupported $type: {name!r}")
+        if isinstance(value, bool) and bool not in types:
+            continue
+        if isinstance(value, types):
+            return True
+    return False
+
+# Query filters
+
+def _regex(pattern: Any, options: str = "") -> "re.Pattern":
+    if isinstance(pattern, re.Pattern):
+        return pattern
+    flags = 0
+    for option in options:
+        flags |= {"i": re.IGNORECASE, "m": re.MULTILINE, "s": re.DOTALL, "x": re.VERBOSE}.get(option, 0)
+    return re.compile(pattern, flags)
+
+def _equals(values: List[Any], target: Any) -> bool:
+    """Server equality: missing matches None, arrays match any element or as a whole"""
+    if not values:
+        return target is None
+    for value in values:
+        if type(value) is type(target):
+            if value == target:
+                return True
+            if type(value) is not list:
+                continue
+        if value == target and _type_rank(value) == _type_rank(target):
+            return True
+        if isinstance(value, list) and not isinstance(target, list) and any(
+            item == target and _type_rank(item) == _type_rank(target) for item in value
+        ):
+            return True
+    return False
+
+def _flatten(values: List[Any]) -> Iterator[Any]:
+    for value in values:
+        if isinstance(value, list):
+            yield from value
+        yield value
+
+def _compare(values: List[Any], target: Any, op: Callable[[Any, Any], bool]) -> bool:
+    if len(values) == 1 and type(values[0]) is type(target) and type(target) in _ORDERED_TYPES:
+        return op(values[0], target)
+    return any(_comparable(value, target) and op(value, target) for value in _flatten(values))
+
+_COMPARISONS = {
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b,
+}
+
+def _field_predicate(path: str, condition: Any) -> Callable[[dict], bool]:
+    parts = path.split(".")
+    is_operator_doc = isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition)
+
+    if isinstance(condition, re.Pattern):
+        return lambda doc: any(isinstance(v, str) and condition.search(v) for v in _flatten(_resolve(doc, parts)))
+    if not is_operator_doc:
+        return lambda doc: _equals(_resolve(doc, parts), condition)
+
+    checks: List[Callable[[List[Any]], bool]] = []
+    for op, operand in condition.items():
+        if op == "$eq":
+            checks.append(lambda values, t=operand: _equals(values, t))
+        elif op == "$ne":
+            checks.append(lambda values, t=operand: not _equals(values, t))
+        elif op in _COMPARISONS:
+            checks.append(lambda values, t=operand, f=_COMPARISONS[op]: _compare(values, t, f))
+        elif op == "$in":
+            targets = list(operand)
+            patterns = [t for t in targets if isinstance(t, re.Pattern)]
+            checks.append(lambda values, ts=targets, ps=patterns: any(_equals(values, t) for t in ts if not isinstance(t, re.Pattern)) or any(
+                isinstance(v, str) and p.search(v) for p in ps for v in _flatten(values)))
+        elif op == "$nin":
+            targets = list(operand)
+            checks.append(lambda values, ts=targets: not any(_equals(values, t) for t in ts))
+        elif op == "$exists":
+            checks.append(lambda values, flag=bool(operand): bool(values) == flag)
+        elif op == "$regex":
+            pattern = _regex(operand, condition.get("$options", ""))
+            checks.append(lambda values, p=pattern: any(isinstance(v, str) and p.search(v) for v in _flatten(values)))
+        elif op == "$options":
+            continue
+        elif op == "$type":
+            checks.append(lambda values, t=operand: any(_is_type(v, t) for v in values))
+        elif op == "$size":
+            checks.append(lambda values, n=operand: any(isinstance(v, list) and len(v) == n for v in values))
+        elif op == "$all":
+            targets = list(operand)
+            checks.append(lambda values, ts=targets: bool(ts) and all(_equals(values, t) for t in ts))
+        elif op == "$elemMatch":
+            if all(key.startswith("$") for key in operand):
+                inner = _field_predicate("v", operand)
+                checks.append(lambda values, m=inner: any(
+                    isinstance(v, list) and any(m({"v": item}) for item in v) for v in values))
+            else:
+                inner = compile_filter(operand)
+                checks.append(lambda values, m=inner: any(
+                    isinstance(v, list) and any(isinstance(item, dict) and m(item) for item in v) for v in values))
+        elif op == "$not":
+            inner = _field_predicate(path, operand)
+            return_inner = inner
+            checks.append(lambda values, m=return_inner, p=parts: not m(_rebuild(p, values)))
+        else:
+            raise OperationFailure(f"Unsupported query operator: {op}")
+
+    return lambda doc: all(check(_resolve(doc, parts)) for check in checks)
+
+def _rebuild(parts: Sequence[str], values: List[Any]) -> dict:
+    """Wrap resolved values back into a document so a nested predicate can re-read them"""
+    if not values:
+        return {}
+    document: dict = {}
+    _set_path(document, ".".join(parts), values[0] if len(values) == 1 else values)
+    return document
+
+def compile_filter(filter_dict: Optional[Dict[str, Any]]) -> Callable[[dict], bool]:
+    """Turn a query document into a predicate over stored documents"""
+    if not filter_dict:
+        return lambda doc: True
+    predicates: List[Callable[[dict], bool]] = []
+    for key, condition in filter_dict.items():
+        if key == "$and":
+            subs = [compile_filter(sub) for sub in condition]
+            predicates.append(lambda doc, s=subs: all(p(doc) for p in s))
+        elif key == "$or":
+            subs = [compile_filter(sub) for sub in condition]
+            predicates.append(lambda doc, s=subs: any(p(doc) for p in s))
+        elif key == "$nor":
+            subs = [compile_filter(sub) for sub in condition]
+            predicates.append(lambda doc, s=subs: not any(p(doc) for p in s))
+        elif key == "$expr":
+            predicates.append(lambda doc, e=condition: bool(evaluate(e, doc)))
+        elif key == "$comment":
+            continue
+        elif key.startswith("$"):
+            raise OperationFailure(f"Unsupported query operator: {key}")
+        else:
+            predicates.append(_field_predicate(key, condition))
+    if len(predicates) == 1:
+        return predicates[0]
+    return lambda doc: all(p(doc) for p in predicates)
+
+def _equality_values(condition: Any) -> Optional[List[Any]]:
+    """Values an index lookup can serve for a field condition, or None"""
+    if isinstance(condition, dict):
+        if len(condition) == 1 and "$eq" in condition:
+            condition = condition["$eq"]
+        elif len(condition) == 1 and "$in" in condition and not any(
+            isinstance(v, (re.Pattern, dict, list)) for v in condition["$in"]
+        ):
+            return list(condition["$in"])
+        else:
+            return None
+    if isinstance(condition, (dict, list, re.Pattern)):
+        return None
+    return [condition]
+
+# Projection and sorting
+
+def project(document: dict, projection: Optional[Union[Dict[str, Any], Sequence[str]]]) -> dict:
+    if not projection:
+        return _copy(document)
+    if not isinstance(projection, dict):
+        projection = {field: 1 for field in projection}
+    include_id = bool(projection.get("_id", 1))
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+
+    if any(fields.values()):
+        result: dict = {}
+        if include_id and "_id" in document:
+            result["_id"] = document["_id"]
+        for path, flag in fields.items():
+            if not flag:
+                continue
+            value = _get_field(document, path)
+            if value is not _MISSING:
+                _set_path(result, path, _copy(value))
+        return result
+
+    result = _copy(document)
+    for path in fields:
+        _unset_path(result, path)
+    if not include_id:
+        result.pop("_id", None)
+    return result
+
+def _normalize_sort(key_or_list: Any, direction: Optional[int] = None) -> List[Tuple[str, int]]:
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return [(key, value) for key, value in key_or_list]
+
+def sort_documents(documents: List[dict], spec: List[Tuple[str, int]]) -> List[dict]:
+    """Stable multi-key sort with server type ordering (missing/null first ascending)"""
+    ordered = list(documents)
+    for path, direction in reversed(spec):
+        parts = path.split(".")
+        ordered.sort(
+            key=lambda doc: _sort_key((_resolve(doc, parts) or [None])[0]),
+            reverse=direction in (-1, "desc", "descending")
+        )
+    return ordered
+
+# Updates
+
+def _apply_update(document: dict, update: Dict[str, Any], inserting: bool = False):
+    """Apply update operators to `document` in place"""
+    if not update or not all(key.startswith("$") for key in update):
+        raise ValueError("update only works with $ operators")
+    for op, fields in update.items():
+        for path, value in fields.items():
+            if path == "_id" and op != "$setOnInsert":
+                continue
+            if op == "$set":
+                _set_path(document, path, _copy(value))
+            elif op == "$setOnInsert":
+                if inserting:
+                    _set_path(document, path, _copy(value))
+            elif op == "$unset":
+                _unset_path(document, path)
+            elif op == "$inc":
+                current = _get_field(document, path)
+                _set_path(document, path, value if current in (_MISSING, None) else current + value)
+            elif op == "$mul":
+                current = _get_field(document, path)
+                _set_path(document, path, 0 if current in (_MISSING, None) else current * value)
+            elif op in ("$min", "$max"):
+                current = _get_field(document, path)
+                if current is _MISSING or (_comparable(current, value) and (value < current if op == "$min" else value > current)):
+                    _set_path(document, path, _copy(value))
+            elif op in ("$push", "$addToSet"):
+                current = _get_field(document, path)
+                items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                array = list(current) if isinstance(current, list) else []
+                for item in items:
+                    if op == "$push" or item not in array:
+                        array.append(_copy(item))
+                _set_path(document, path, array)
+            elif op == "$pull":
+                current = _get_field(document, path)
+                if isinstance(current, list):
+                    if isinstance(value, dict):
+                        matches = compile_filter(value) if not all(k.startswith("$") for k in value) else (
+                            lambda item, m=_field_predicate("v", value): m({"v": item}))
+                        kept = [item for item in current if not matches(item)]
+                    else:
+                        kept = [item for item in current if item != value]
+                    _set_path(document, path, kept)
+            elif op == "$currentDate":
+                _set_path(document, path, datetime.now())
+            elif op == "$rename":
+                current = _get_field(document, path)
+                if current is not _MISSING:
+                    _unset_path(document, path)
+                    _set_path(document, value, current)
+            else:
+                raise OperationFailure(f"Unsupported update operator: {op}")
+
+def _upsert_seed(filter_dict: Optional[Dict[str, Any]]) -> dict:
+    """Document an upsert starts from: the equality fields of the filter"""
+    document: dict = {}
+    for key, condition in (filter_dict or {}).items():
+        if key == "$and":
+            for sub in condition:
+                document.update(_upsert_seed(sub))
+            continue
+        if key.startswith("$"):
+            continue
+        if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+            if "$eq" in condition:
+                _set_path(document, key, _copy(condition["$eq"]))
+            continue
+        _set_path(document, key, _copy(condition))
+    return document
+
+# Aggregation expressions
+
+def _date_part(part: str) -> Callable[[Any], Any]:
+    def extract(value):
+        if not isinstance(value, datetime):
+            raise OperationFailure(f"can't convert from {type(value).__name__} to Date")
+        return {
+            "year": value.year, "month": value.month, "dayOfMonth": value.day, "hour": value.hour,
+            "minute": value.minute, "second": value.second, "dayOfWeek": value.isoweekday() % 7 + 1,
+            "dayOfYear": value.timetuple().tm_yday
+        }[part]
+    return extract
+
+def _numbers(values: Iterable[Any]) -> List[Union[int, float]]:
+    return [v for v in values if isinstance(v, (int, float)) and not isinstance(v, bool)]
+
+def _evaluate_operator(op: str, args: Any, document: dict) -> Any:
+    if op == "$literal":
+        return args
+    if op in ("$year", "$month", "$dayOfMonth", "$hour", "$minute", "$second", "$dayOfWeek", "$dayOfYear"):
+        value = evaluate(args["date"] if isinstance(args, dict) else args, document)
+        return None if value is None else _date_part(op[1:])(value)
+    if op == "$cond":
+        if isinstance(args, dict):
+            condition, then, otherwise = args["if"], args["then"], args["else"]
+        else:
+            condition, then, otherwise = args
+        return evaluate(then if _truthy(evaluate(condition, document)) else otherwise, document)
+    if op == "$switch":
+        for branch in args["branches"]:
+            if _truthy(evaluate(branch["case"], document)):
+                return evaluate(branch["then"], document)
+        return evaluate(args.get("default"), document)
+
+    values = [evaluate(arg, document) for arg in (args if isinstance(args, list) else [args])]
+    if op == "$ifNull":
+        for value in values[:-1]:
+            if value is not None:
+                return value
+        return values[-1]
+    if op in ("$add", "$multiply"):
+        if any(v is None for v in values):
+            return None
+        if op == "$add":
+            total = values[0]
+            for value in values[1:]:
+                total = total + value
+            return total
+        product = 1
+        for value in values:
+            product *= value
+        return product
+    if op in ("$subtract", "$divide", "$mod"):
+        left, right = values
+        if left is None or right is None:
+            return None
+        if op == "$subtract":
+            return left - right
+        if op == "$mod":
+            return left % right
+        return left / right
+    if op in ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte"):
+        left, right = (_sort_key(v) for v in values)
+        return {"$eq": left == right, "$ne": left != right, "$gt": left > right,
+                "$gte": left >= right, "$lt": left < right, "$lte": left <= right}[op]
+    if op == "$and":
+        return all(_truthy(v) for v in values)
+    if op == "$or":
+        return any(_truthy(v) for v in values)
+    if op == "$not":
+        return not _truthy(values[0])
+    if op == "$in":
+        needle, haystack = values
+        return needle in (haystack or [])
+    if op == "$size":
+        return len(values[0])
+    if op == "$concat":
+        return None if any(v is None for v in values) else "".join(values)
+    if op in ("$toLower", "$toUpper"):
+        text = "" if values[0] is None else str(values[0])
+        return text.lower() if op == "$toLower" else text.upper()
+    if op == "$toString":
+        return None if values[0] is None else str(values[0])
+    if op == "$abs":
+        return None if values[0] is None else abs(values[0])
+    if op == "$round":
+        return None if values[0] is None else round(values[0], values[1] if len(values) > 1 else 0)
+    if op in ("$sum", "$avg", "$min", "$max"):
+        flat = list(_flatten(values)) if len(values) == 1 else values
+        flat = [v for v in flat if not isinstance(v, list)]
+        if op == "$sum":
+            return sum(_numbers(flat))
+        if op == "$avg":
+            numbers = _numbers(flat)
+            return sum(numbers) / len(numbers) if numbers else None
+        present = [v for v in flat if v is not None]
+        if not present:
+            return None
+        return (min if op == "$min" else max)(present, key=_sort_key)
+    raise OperationFailure(f"Unsupported expression operator: {op}")
+
+def _truthy(value: Any) -> bool:
+    return value not in (None, False, 0) and value is not _MISSING
+
+def evaluate(expression: Any, document: dict) -> Any:
+    """Evaluate an aggregation expression against a document"""
+    if isinstance(expression, str) and expression.startswith("$"):
+        if expression.startswith("$$"):
+            name, _, path = expression[2:].partition(".")
+            if name not in ("ROOT", "CURRENT"):
+                raise OperationFailure(f"Unsupported variable: $${name}")
+            value = _get_field(document, path) if path else document
+        else:
+            value = _get_field(document, expression[1:])
+        return None if value is _MISSING else value
+    if isinstance(expression, dict):
+        if len(expression) == 1:
+            (key, args), = expression.items()
+            if key.startswith("$"):
+                return _evaluate_operator(key, args, document)
+        return {key: evaluate(value, document) for key, value in expression.items()}
+    if isinstance(expression, list):
+        return [evaluate(item, document) for item in expression]
+    return expression
+
+# Aggregation pipeline
+
+class _Accumulator:
+    def __init__(self, op: str, expression: Any):
+        self.op = op
+        self.expression = expression
+        self.values: List[Any] = []
+
+    def add(self, document: dict):
+        value = evaluate(self.expression, document) if self.op != "$count" else 1
+        self.values.append(value)
+
+    def result(self) -> Any:
+        values = self.values
+        if self.op in ("$sum", "$count"):
+            return sum(_numbers(values))
+        if self.op == "$avg":
+            numbers = _numbers(values)
+            return sum(numbers) / len(numbers) if numbers else None
+        if self.op in ("$min", "$max"):
+            present = [v for v in values if v is not None]
+            return (min if self.op == "$min" else max)(present, key=_sort_key) if present else None
+        if self.op == "$push":
+            return values
+        if self.op == "$addToSet":
+            seen, unique = set(), []
+            for value in values:
+                key = _hashable(value)
+                if key not in seen:
+                    seen.add(key)
+                    unique.append(value)
+            return unique
+        if self.op == "$first":
+            return values[0] if values else None
+        if self.op == "$last":
+            return values[-1] if values else None
+        raise OperationFailure(f"Unsupported accumulator: {self.op}")
+
+def _group(documents: List[dict], spec: Dict[str, Any]) -> List[dict]:
+    fields = {name: next(iter(acc.items())) for name, acc in spec.items() if name != "_id"}
+    groups: Dict[Any, Tuple[Any, Dict[str, _Accumulator]]] = {}
+    for document in documents:
+        group_id = evaluate(spec["_id"], document)
+        key = _hashable(group_id)
+        entry = groups.get(key)
+        if entry is None:
+            entry = groups[key] = (group_id, {name: _Accumulator(op, expr) for name, (op, expr) in fields.items()})
+        for accumulator in entry[1].values():
+            accumulator.add(document)
+    return [
+        {"_id": group_id, **{name: acc.result() for name, acc in accumulators.items()}}
+        for group_id, accumulators in groups.values()
+    ]
+
+def _project_stage(documents: List[dict], spec: Dict[str, Any], add_fields: bool) -> List[dict]:
+    if not add_fields and all(value in (0, 1, True, False) for value in spec.values()):
+        return [project(document, spec) for document in documents]
+    results = []
+    for document in documents:
+        if add_fields:
+            result = _copy(document)
+        else:
+            result = {"_id": document["_id"]} if spec.get("_id", 1) and "_id" in document else {}
+        for path, expression in spec.items():
+            if path == "_id" and not add_fields:
+                if expression not in (0, 1, True, False):
+                    result["_id"] = evaluate(expression, document)
+                continue
+            if expression in (1, True) and not add_fields:
+                value = _get_field(document, path)
+                if value is not _MISSING:
+                    _set_path(result, path, _copy(value))
+            elif expression not in (0, False) or add_fields:
+                _set_path(result, path, evaluate(expression, document))
+        results.append(result)
+    return results
+
+def _unwind(documents: List[dict], spec: Union[str, Dict[str, Any]]) -> List[dict]:
+    path = (spec if isinstance(spec, str) else spec["path"])[1:]
+    keep_empty = isinstance(spec, dict) and spec.get("preserveNullAndEmptyArrays", False)
+    results = []
+    for document in documents:
+        value = _get_field(document, path)
+        if isinstance(value, list) and value:
+            for item in value:
+                copy = _copy(document)
+                _set_path(copy, path, item)
+                results.append(copy)
+        elif isinstance(value, list) or value in (_MISSING, None):
+            if keep_empty:
+                results.append(document)
+        else:
+            results.append(document)
+    return results
+
+def run_pipeline(documents: List[dict], pipeline: List[Dict[str, Any]]) -> List[dict]:
+    """Run aggregation stages over already-selected documents (not mutated)"""
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name == "$match":
+            predicate = compile_filter(spec)
+            documents = [document for document in documents if predicate(document)]
+        elif name == "$group":
+            documents = _group(documents, spec)
+        elif name == "$sort":
+            documents = sort_documents(documents, _normalize_sort(spec))
+        elif name == "$skip":
+            documents = documents[spec:]
+        elif name == "$limit":
+            documents = documents[:spec]
+        elif name == "$project":
+            documents = _project_stage(documents, spec, add_fields=False)
+        elif name in ("$addFields", "$set"):
+            documents = _project_stage(documents, spec, add_fields=True)
+        elif name == "$unwind":
+            documents = _unwind(documents, spec)
+        elif name == "$count":
+            documents = [{spec: len(documents)}] if documents else []
+        elif name == "$facet":
+            documents = [{key: run_pipeline(documents, sub) for key, sub in spec.items()}]
+        else:
+            raise OperationFailure(f"Unsupported aggregation stage: {name}")
+    return documents
+
+# Indexes
+
+class _Index:
+    """Hash index on the first key of an index specification"""
+
+    def __init__(self, name: str, keys: List[Tuple[str, Any]], unique: bool, sparse: bool):
+        self.name = name
+        self.keys = keys
+        self.fields = [key for key, _ in keys]
+        self.parts = self.fields[0].split(".")
+        self.unique = unique
+        self.sparse = sparse
+        self.buckets: Dict[Any, Set[int]] = {}
+
+    def _entries(self, document: dict) -> Set[Any]:
+        values = _resolve(document, self.parts)
+        if not values:
+            return set() if self.sparse else {None}
+        entries = set()
+        for value in values:
+            if isinstance(value, list):
+                entries.update(_hashable(item) for item in value)
+                if not value:
+                    entries.add(None)
+            else:
+                entries.add(_hashable(value))
+        return entries
+
+    def full_key(self, document: dict) -> Optional[Tuple[Any, ...]]:
+        values = [_resolve(document, field.split(".")) for field in self.fields]
+        if self.sparse and not any(values):
+            return None
+        return tuple(_hashable(v[0]) if v else None for v in values)
+
+    def add(self, slot: int, document: dict):
+        for entry in self._entries(document):
+            self.buckets.setdefault(entry, set()).add(slot)
+
+    def remove(self, slot: int, document: dict):
+        for entry in self._entries(document):
+            bucket = self.buckets.get(entry)
+            if bucket is not None:
+                bucket.discard(slot)
+                if not bucket:
+                    del self.buckets[entry]
+
+    def lookup(self, values: List[Any]) -> Set[int]:
+        slots: Set[int] = set()
+        for value in values:
+            slots.update(self.buckets.get(_hashable(value), ()))
+        return slots
+
+def _index_name(keys: List[Tuple[str, Any]]) -> str:
+    return "_".join(f"{key}_{direction}" for key, direction in keys)
+
+# Cursors
+
+class MemoryCursor:
+    """Motor-style cursor; the query runs when iteration starts"""
+
+    def __init__(self, collection: "MemoryCollection", filter_dict, projection, sort=None, skip: int = 0, limit: int = 0):
+        self._collection = collection
+        self._filter = filter_dict
+        self._projection = projection
+        self._sort = _normalize_sort(sort) if sort else []
+        self._skip = skip
+        self._limit = limit
+        self._results: Optional[Iterator[dict]] = None
+
+    def sort(self, key_or_list, direction: Optional[int] = None) -> "MemoryCursor":
+        self._sort = _normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, skip: int) -> "MemoryCursor":
+        self._skip = skip
+        return self
+
+    def limit(self, limit: int) -> "MemoryCursor":
+        self._limit = abs(limit)
+        return self
+
+    def batch_size(self, batch_size: int) -> "MemoryCursor":
+        return self
+
+    def _iterate(self) -> Iterator[dict]:
+        if self._results is None:
+            documents = self._collection._select(self._filter)
+            if self._sort:
+                documents = sort_documents(documents, self._sort)
+            end = self._skip + self._limit if self._limit else None
+            documents = documents[self._skip:end]
+            self._results = (project(document, self._projection) for document in documents)
+        return self._results
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        try:
+            return next(self._iterate())
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def next(self) -> dict:
+        return await self.__anext__()
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        results = self._iterate()
+        if length is None:
+            return list(results)
+        return [document for _, document in zip(range(length), results)]
+
+    async def close(self):
+        self._results = iter(())
+
+class MemoryAggregationCursor(MemoryCursor):
+    def __init__(self, collection: "MemoryCollection", pipeline: List[Dict[str, Any]]):
+        super().__init__(collection, None, None)
+        self._pipeline = pipeline
+
+    def _iterate(self) -> Iterator[dict]:
+        if self._results is None:
+            pipeline = self._pipeline
+            # A leading $match can use the collection's indexes
+            if pipeline and "$match" in pipeline[0]:
+                documents = self._collection._select(pipeline[0]["$match"])
+                pipeline = pipeline[1:]
+            else:
+                documents = self._collection._select(None)
+            self._results = (_copy(document) for document in run_pipeline(documents, pipeline))
+        return self._results
+
+# Collections
+
+class MemoryCollection:
+    def __init__(self, database: "MemoryDatabase", name: str):
+        self.database = database
+        self.name = name
+        self._documents: Dict[int, dict] = {}
+        self._next_slot = 0
+        self._ids: Dict[Any, int] = {}
+        self._indexes: Dict[str, _Index] = {}
+
+    def __repr__(self) -> str:
+        return f"MemoryCollection({self.database.name!r}, {self.name!r})"
+
+    # Selection
+
+    def _slots_for(self, filter_dict: Dict[str, Any]) -> Optional[Set[int]]:
+        """Candidate slots from the most selective usable index, or None for a scan"""
+        best: Optional[Set[int]] = None
+        for field, condition in filter_dict.items():
+            if field.startswith("$"):
+                continue
+            values = _equality_values(condition)
+            if values is None:
+                continue
+            if field == "_id":
+                slots = {self._ids[key] for key in map(_hashable, values) if key in self._ids}
+            else:
+                index = next((ix for ix in self._indexes.values() if ix.fields[0] == field and not (ix.sparse and None in values)), None)
+                if index is None:
+                    continue
+                slots = index.lookup(values)
+            if best is None or len(slots) < len(best):
+                best = slots
+        return best
+
+    def _select(self, filter_dict: Optional[Dict[str, Any]]) -> List[dict]:
+        """Stored documents matching the filter, in insertion order (not copies)"""
+        if not filter_dict:
+            return list(self._documents.values())
+        predicate = compile_filter(filter_dict)
+        slots = self._slots_for(filter_dict)
+        if slots is None:
+            return [document for document in self._documents.values() if predicate(document)]
+        return [self._documents[slot] for slot in sorted(slots) if predicate(self._documents[slot])]
+
+    def _select_slots(self, filter_dict: Optional[Dict[str, Any]], sort=None) -> List[int]:
+        predicate = compile_filter(filter_dict)
+        slots = self._slots_for(filter_dict or {}) if filter_dict else None
+        candidates = sorted(slots) if slots is not None else list(self._documents)
+        matched = [slot for slot in candidates if predicate(self._documents[slot])]
+        if sort:
+            by_doc = {id(self._documents[slot]): slot for slot in matched}
+            documents = sort_documents([self._documents[slot] for slot in matched], _normalize_sort(sort))
+            matched = [by_doc[id(document)] for document in documents]
+        return matched
+
+    # Storage with index maintenance
+
+    def _check_unique(self, document: dict, ignore_slot: Optional[int] = None):
+        _id = _hashable(document["_id"])
+        if _id in self._ids and self._ids[_id] != ignore_slot:
+            raise DuplicateKeyError(
+                f"E11000 duplicate key error collection: {self.database.name}.{self.name} index: _id_",
+                11000, {"keyValue": {"_id": document["_id"]}}
+            )
+        for index in self._indexes.values():
+            if not index.unique:
+                continue
+            key = index.full_key(document)
+            if key is None:
+                continue
+            for slot in index.lookup([key[0]] if not isinstance(key[0], tuple) else [document.get(index.fields[0])]):
+                if slot != ignore_slot and index.full_key(self._documents[slot]) == key:
+                    raise DuplicateKeyError(
+                        f"E11000 duplicate key error collection: {self.database.name}.{self.name} index: {index.name}",
+                        11000, {"keyPattern": dict(index.keys)}
+                    )
+
+    def _store(self, document: dict) -> Any:
+        if "_id" not in document:
+            document["_id"] = ObjectId()
+        self._check_unique(document)
+        slot = self._next_slot
+        self._next_slot += 1
+        self._documents[slot] = document
+        self._ids[_hashable(document["_id"])] = slot
+        for index in self._indexes.values():
+            index.add(slot, document)
+        return document["_id"]
+
+    def _replace(self, slot: int, document: dict):
+        old = self._documents[slot]
+        self._check_unique(document, ignore_slot=slot)
+        for index in self._indexes.values():
+            index.remove(slot, old)
+            index.add(slot, document)
+        self._documents[slot] = document
+
+    def _remove(self, slot: int):
+        document = self._documents.pop(slot)
+        self._ids.pop(_hashable(document["_id"]), None)
+        for index in self._indexes.values():
+            index.remove(slot, document)
+
+    # Reads
+
+    def find(self, filter: Optional[Dict[str, Any]] = None, projection=None, *, sort=None, skip: int = 0, limit: int = 0, **kwargs) -> MemoryCursor:
+        return MemoryCursor(self, filter, projection, sort=sort, skip=skip, limit=limit)
+
+    async def find_one(self, filter: Any = None, projection=None, *args, sort=None, **kwargs) -> Optional[dict]:
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        results = await MemoryCursor(self, filter, projection, sort=sort, limit=1).to_list(1)
+        return results[0] if results else None
+
+    async def count_documents(self, filter: Dict[str, Any], skip: int = 0, limit: int = 0, **kwargs) -> int:
+        count = len(self._select(filter)) - skip
+        count = max(count, 0)
+        return min(count, limit) if limit else count
+
+    async def estimated_document_count(self, **kwargs) -> int:
+        return len(self._documents)
+
+    async def distinct(self, key: str, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Any]:
+        parts = key.split(".")
+        seen, values = set(), []
+        for document in self._select(filter):
+            for value in _flatten(_resolve(document, parts)):
+                if isinstance(value, list):
+                    continue
+                marker = _hashable(value)
+                if marker not in seen:
+                    seen.add(marker)
+                    values.append(value)
+        return values
+
+    def aggregate(self, pipeline: List[Dict[str, Any]], **kwargs) -> MemoryAggregationCursor:
+        return MemoryAggregationCursor(self, pipeline)
+
+    # Writes
+
+    async def insert_one(self, document: dict, **kwargs) -> InsertOneResult:
+        # Like pymongo, the caller's dict receives the generated _id
+        document.setdefault("_id", ObjectId())
+        return InsertOneResult(self._store(_copy(document)), True)
+
+    async def insert_many(self, documents: Iterable[dict], ordered: bool = True, **kwargs) -> InsertManyResult:
+        inserted, errors = [], []
+        for position, document in enumerate(documents):
+            document.setdefault("_id", ObjectId())
+            try:
+                inserted.append(self._store(_copy(document)))
+            except DuplicateKeyError as e:
+                errors.append({"index": position, "code": 11000, "errmsg": str(e), "op": document})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({
+                "writeErrors": errors, "writeConcernErrors": [], "nInserted": len(inserted),
+                "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []
+            })
+        return InsertManyResult(inserted, True)
+
+    def _update(self, filter_dict, update, upsert: bool, multi: bool, replacement: bool = False, sort=None) -> Dict[str, Any]:
+        slots = self._select_slots(filter_dict, sort=sort)
+        if not multi:
+            slots = slots[:1]
+        modified = 0
+        for slot in slots:
+            current = self._documents[slot]
+            if replacement:
+                updated = {"_id": current["_id"], **_copy(update)}
+            else:
+                updated = _copy(current)
+                _apply_update(updated, update)
+            if updated != current:
+                self._replace(slot, updated)
+                modified += 1
+        if slots or not upsert:
+            return {"n": len(slots), "nModified": modified, "updatedExisting": bool(slots)}
+
+        document = _upsert_seed(filter_dict)
+        if replacement:
+            document = {**({"_id": document["_id"]} if "_id" in document else {}), **_copy(update)}
+        else:
+            _apply_update(document, update, inserting=True)
+        upserted_id = self._store(document)
+        return {"n": 1, "nModified": 0, "upserted": upserted_id, "updatedExisting": False}
+
+    async def update_one(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False, *, sort=None, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, multi=False, sort=sort), True)
+
+    async def update_many(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, multi=True), True)
+
+    async def replace_one(self, filter: Dict[str, Any], replacement: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        if any(key.startswith("$") for key in replacement):
+            raise ValueError("replacement can not include $ operators")
+        return UpdateResult(self._update(filter, replacement, upsert, multi=False, replacement=True), True)
+
+    def _delete(self, filter_dict, multi: bool, sort=None) -> int:
+        slots = self._select_slots(filter_dict, sort=sort)
+        if not multi:
+            slots = slots[:1]
+        for slot in slots:
+            self._remove(slot)
+        return len(slots)
+
+    async def delete_one(self, filter: Dict[str, Any], **kwargs) -> DeleteResult:
+        return DeleteResult({"n": self._delete(filter, multi=False)}, True)
+
+    async def delete_many(self, filter: Dict[str, Any], **kwargs) -> DeleteResult:
+        return DeleteResult({"n": self._delete(filter, multi=True)}, True)
+
+    async def find_one_and_delete(self, filter: Dict[str, Any], projection=None, sort=None, **kwargs) -> Optional[dict]:
+        slots = self._select_slots(filter, sort=sort)[:1]
+        if not slots:
+            return None
+        document = self._documents[slots[0]]
+        self._remove(slots[0])
+        return project(document, projection)
+
+    async def find_one_and_update(
+        self, filter: Dict[str, Any], update: Dict[str, Any], projection=None, sort=None,
+        upsert: bool = False, return_document: bool = ReturnDocument.BEFORE, **kwargs
+    ) -> Optional[dict]:
+        slots = self._select_slots(filter, sort=sort)[:1]
+        before = _copy(self._documents[slots[0]]) if slots else None
+        result = self._update(filter, update, upsert, multi=False, sort=sort)
+        if return_document == ReturnDocument.BEFORE:
+            return project(before, projection) if before is not None else None
+        _id = before["_id"] if before is not None else result.get("upserted")
+        if _id is None:
+            return None
+        return project(self._documents[self._ids[_hashable(_id)]], projection)
+
+    async def bulk_write(self, requests: List[Any], ordered: bool = True, **kwargs) -> BulkWriteResult:
+        counts = {"nInserted": 0, "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0}
+        upserted, errors = [], []
+        for position, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    request._doc.setdefault("_id", ObjectId())
+                    self._store(_copy(request._doc))
+                    counts["nInserted"] += 1
+                elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                    raw = self._update(
+                        request._filter, request._doc, request._upsert,
+                        multi=isinstance(request, UpdateMany), replacement=isinstance(request, ReplaceOne)
+                    )
+                    if "upserted" in raw:
+                        counts["nUpserted"] += 1
+                        upserted.append({"index": position, "_id": raw["upserted"]})
+                    else:
+                        counts["nMatched"] += raw["n"]
+                        counts["nModified"] += raw["nModified"]
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    counts["nRemoved"] += self._delete(request._filter, multi=isinstance(request, DeleteMany))
+                else:
+                    raise TypeError(f"{request!r} is not a valid request")
+            except DuplicateKeyError as e:
+                errors.append({"index": position, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        result = {**counts, "upserted": upserted, "writeErrors": errors, "writeConcernErrors": []}
+        if errors:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    # Indexes and maintenance
+
+    async def create_index(self, keys: Union[str, List[Tuple[str, Any]]], unique: bool = False, sparse: bool = False, name: Optional[str] = None, **kwargs) -> str:
+        keys = _normalize_sort(keys, 1)
+        name = name or _index_name(keys)
+        if name in self._indexes:
+            return name
+        index = _Index(name, keys, unique, sparse)
+        for slot, document in self._documents.items():
+            index.add(slot, document)
+        self._indexes[name] = index
+        if unique:
+            seen = set()
+            for document in self._documents.values():
+                key = index.full_key(document)
+                if key is not None and key in seen:
+                    del self._indexes[name]
+                    raise DuplicateKeyError(f"E11000 duplicate key error building index {name}", 11000)
+                seen.add(key)
+        return name
+
+    async def drop_index(self, name: str, **kwargs):
+        if self._indexes.pop(name, None) is None:
+            raise OperationFailure(f"index not found with name [{name}]")
+
+    async def index_information(self, **kwargs) -> Dict[str, Dict[str, Any]]:
+        info = {"_id_": {"key": [("_id", 1)]}}
+        for index in self._indexes.values():
+            info[index.name] = {"key": index.keys, **({"unique": True} if index.unique else {}), **({"sparse": True} if index.sparse else {})}
+        return info
+
+    async def drop(self):
+        await self.database.drop_collection(self.name)
+
+class MemoryDatabase:
+    def __init__(self, client: "MemoryClient", name: str):
+        self.client = client
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = MemoryCollection(self, name)
+        return collection
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name: str, **kwargs) -> MemoryCollection:
+        return self[name]
+
+    def watch(self, *args, **kwargs):
+        # Like a standalone mongod: there is no oplog to stream from
+        raise OperationFailure("The $changeStream stage is only supported on replica sets", 40573)
+
+    async def list_collection_names(self, **kwargs) -> List[str]:
+        return list(self._collections)
+
+    async def drop_collection(self, name: str, **kwargs):
+        self._collections.pop(name if isinstance(name, str) else name.name, None)
+
+    async def command(self, command: Union[str, Dict[str, Any]], **kwargs) -> Dict[str, Any]:
+        name = command if isinstance(command, str) else next(iter(command))
+        if name in ("ping", "hello"):
+            return {"ok": 1.0}
+        if name in ("ismaster", "isMaster"):
+            return {"ismaster": True, "ok": 1.0}
+        if name == "dbStats":
+            return {"db": self.name, "collections": len(self._collections),
+                    "objects": sum(len(c._documents) for c in self._collections.values()), "ok": 1.0}
+        raise OperationFailure(f"Unsupported command: {name}")
+
+class MemoryClient:
+    """Process-local client; databases live until the client is garbage collected"""
+
+    def __init__(self, *args, **kwargs):
+        self._databases: Dict[str, MemoryDatabase] = {}
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        database = self._databases.get(name)
+        if database is None:
+            database = self._databases[name] = MemoryDatabase(self, name)
+        return database
+
+    def __getattr__(self, name: str) -> MemoryDatabase:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_database(self, name: str, **kwargs) -> MemoryDatabase:
+        return self[name]
+
+    async def drop_database(self, name: str):
+        self._databases.pop(name if isinstance(name, str) else name.name, None)
+
+    def close(self):
+        pass
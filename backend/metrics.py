@@ -0,0 +1,276 @@
+"""
+Prometheus-style metrics for SISMOBI 3.2.0
+
+A small in-process registry rendered in the Prometheus text exposition format
+(version 0.0.4). Metrics are updated from the event loop and from pymongo's
+monitoring threads, so every update takes the metric's lock; an observation
+is a dict lookup and a bisect, cheap enough for the request hot path.
+
+Under several workers the registry can also render the other workers'
+samples (see metrics_sync.py): counters and histograms are summed across
+workers and gauges are summed across live workers.
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from bisect import bisect_left
+import asyncio
+from contextvars import ContextVar
+import threading
+import time
+import structlog
+from fastapi import Request
+from fastapi.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = structlog.get_logger(__name__)
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def snapshot(self) -> List[list]:
+        """JSON-serializable samples, as [labels, value] pairs"""
+        raise NotImplementedError
+
+    def collect(self, peers: Iterable[List[list]] = (), local: bool = True) -> List[str]:
+        """Exposition lines for the peers' snapshots plus, if `local`, this process's samples"""
+        raise NotImplementedError
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self) -> List[list]:
+        with self._lock:
+            return [[list(labels), value] for labels, value in self._values.items()]
+
+    def collect(self, peers: Iterable[List[list]] = (), local: bool = True) -> List[str]:
+        with self._lock:
+            values = dict(self._values) if local else {}
+        for samples in peers:
+            for labels, value in samples:
+                key = tuple(labels)
+                values[key] = values.get(key, 0) + value
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in values.items()]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def snapshot(self) -> List[list]:
+        with self._lock:
+            return [[list(labels), list(counts), total] for labels, (counts, total) in self._values.items()]
+
+    def collect(self, peers: Iterable[List[list]] = (), local: bool = True) -> List[str]:
+        with self._lock:
+            values = {labels: (list(counts), total) for labels, (counts, total) in self._values.items()} if local else {}
+        for samples in peers:
+            for labels, counts, total in samples:
+                if len(counts) != len(self.buckets) + 1:
+                    # Written by a worker with other buckets (e.g. before a deploy)
+                    continue
+                key = tuple(labels)
+                merged, merged_total = values.get(key, ([0] * len(counts), 0.0))
+                values[key] = ([a + b for a, b in zip(merged, counts)], merged_total + total)
+        lines = []
+        for labels, (counts, total) in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self, gauges: bool = True) -> Dict[str, Any]:
+        """Samples of every metric by name (see metrics_sync.py)"""
+        return {
+            name: metric.snapshot()
+            for name, metric in self._metrics.items()
+            if gauges or not isinstance(metric, Gauge)
+        }
+
+    def gauge_names(self) -> List[str]:
+        return [name for name, metric in self._metrics.items() if isinstance(metric, Gauge)]
+
+    def render(self, snapshots: Iterable[Dict[str, Any]] = (), local: bool = True) -> str:
+        """Exposition text of the given snapshots plus, if `local`, this process's samples"""
+        snapshots = list(snapshots)
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.header())
+            lines.extend(metric.collect([snapshot[metric.name] for snapshot in snapshots if metric.name in snapshot], local))
+        return "\n".join(lines) + "\n"
+
+# Global registry and HTTP metrics
+registry = MetricsRegistry()
+
+# When set (see metrics_sync.py), /metrics renders the snapshots it returns,
+# which include this worker's, instead of the local samples
+snapshot_source: Optional[Callable[[], List[Dict[str, Any]]]] = None
+
+http_request_duration = registry.histogram(
+    "sismobi_http_request_duration_seconds", "HTTP request latency by route template",
+    ("method", "route", "status")
+)
+http_requests_in_flight = registry.gauge(
+    "sismobi_http_requests_in_flight", "HTTP requests currently being served", ("method",)
+)
+http_request_errors = registry.counter(
+    "sismobi_http_request_errors_total", "HTTP requests answered with a 5xx status or an unhandled exception",
+    ("method", "route", "status")
+)
+
+UNMATCHED_ROUTE = "unmatched"
+
+class RequestDbStats:
+    """DB time and command count for one HTTP request (filled by db_monitoring)"""
+    __slots__ = ("durations",)
+
+    def __init__(self):
+        # list.append is atomic, so Motor's executor threads can record concurrently
+        self.durations: List[float] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.durations)
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(self.durations)
+
+current_request_db_stats: ContextVar[Optional[RequestDbStats]] = ContextVar("current_request_db_stats", default=None)
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, in-flight requests and errors
+
+    Routes are labelled with their template (/api/v1/properties/{property_id})
+    rather than the raw path to keep label cardinality bounded. Also emits the
+    structured request log line, including the time spent in and number of
+    Mongo commands issued by the request.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        db_stats = RequestDbStats()
+        current_request_db_stats.set(db_stats)
+        start = time.perf_counter()
+        http_requests_in_flight.inc(method)
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception:
+            status = 500
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            http_requests_in_flight.dec(method)
+            route = scope.get("route")
+            route_label = getattr(route, "path_format", None) or UNMATCHED_ROUTE
+            status_label = str(status)
+            http_request_duration.observe(duration, method, route_label, status_label)
+            if status >= 500:
+                http_request_errors.inc(method, route_label, status_label)
+            logger.info(
+                "HTTP request", method=method, path=scope["path"], route=route_label,
+                status_code=status, duration_ms=round(duration * 1000, 2),
+                db_ms=round(db_stats.total_seconds * 1000, 2), db_queries=db_stats.count
+            )
+
+async def metrics_endpoint(request: Request) -> PlainTextResponse:
+    """Prometheus scrape endpoint"""
+    if snapshot_source is None:
+        return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
+    snapshots = await asyncio.to_thread(snapshot_source)
+    return PlainTextResponse(registry.render(snapshots, local=False), media_type=CONTENT_TYPE)
@@ -0,0 +1,173 @@
+"""
+Cross-worker metrics for SISMOBI 3.2.0
+
+Each worker process keeps its own registry (metrics.py), and a scrape of
+/metrics reaches whichever worker accepts the connection. With WEB_WORKERS > 1
+every worker writes a snapshot of its samples to METRICS_SYNC_DIR every
+METRICS_SYNC_SECONDS, and /metrics renders all the snapshots instead of the
+local samples, so any worker answers for the whole server:
+
+- counters and histograms are summed across workers;
+- gauges are summed across live workers.
+
+The scraped worker writes its own snapshot first, and the others' are at most
+METRICS_SYNC_SECONDS old. Every snapshot only grows, so counters never appear
+to go backwards between scrapes answered by different workers.
+
+When a worker exits, the gunicorn master folds its counters and histograms
+into archived.json and drops its gauges (see archive_worker and
+gunicorn_conf.child_exit), so totals survive worker recycling. Workers on
+other hosts are separate scrape targets.
+"""
+from typing import Any, Dict, List, Optional
+import asyncio
+import json
+import os
+import uuid
+import structlog
+
+import metrics
+from config import settings
+
+logger = structlog.get_logger(__name__)
+
+ARCHIVE_NAME = "archived.json"
+_SUFFIX = ".json"
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+def _dump(path: str, data: Dict[str, Any]):
+    """Write atomically, so readers see the old or the new file, never a partial one"""
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def merge_samples(into: Dict[str, List[list]], samples: Dict[str, List[list]]):
+    """Add one snapshot's samples to another (see MetricsRegistry.snapshot)"""
+    for name, series in samples.items():
+        merged = {tuple(sample[0]): sample for sample in into.get(name, [])}
+        for sample in series:
+            key = tuple(sample[0])
+            current = merged.get(key)
+            if current is None:
+                merged[key] = sample
+            elif len(sample) == 2:
+                merged[key] = [sample[0], current[1] + sample[1]]
+            elif len(current[1]) == len(sample[1]):
+                merged[key] = [sample[0], [a + b for a, b in zip(current[1], sample[1])], current[2] + sample[2]]
+        into[name] = list(merged.values())
+
+def archive_worker(directory: str, pid: int):
+    """Fold an exited worker's counters and histograms into the archive
+
+    Runs in the gunicorn master. The archive lists the files it absorbed, so a
+    reader that still sees the worker's file skips it rather than counting it
+    twice.
+    """
+    archive_path = os.path.join(directory, ARCHIVE_NAME)
+    try:
+        names = [name for name in os.listdir(directory) if name.startswith(f"{pid}-") and name.endswith(_SUFFIX)]
+        if not names:
+            return
+        archive = _load(archive_path) if os.path.exists(archive_path) else {"samples": {}}
+        for name in names:
+            snapshot = _load(os.path.join(directory, name))
+            gauges = set(snapshot.get("gauges", []))
+            merge_samples(archive["samples"], {
+                metric: series for metric, series in snapshot["samples"].items() if metric not in gauges
+            })
+        archive["absorbed"] = names
+        _dump(archive_path, archive)
+        for name in names:
+            os.unlink(os.path.join(directory, name))
+    except (OSError, ValueError) as e:
+        logger.warning("Could not archive worker metrics", pid=pid, error=str(e))
+
+def clear_snapshots(directory: str):
+    """Remove the snapshots of a previous server run (called by the master)"""
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.endswith(_SUFFIX) or name.endswith(".tmp"):
+                os.unlink(os.path.join(directory, name))
+
+class MetricsSync:
+    """Writes this worker's snapshot periodically and serves everyone's to /metrics"""
+
+    def __init__(self, directory: str, interval: float):
+        self.directory = directory
+        self.interval = interval
+        self.path: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return settings.web_workers > 1
+
+    async def start(self):
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # Named after the worker's pid, which is all the master knows on exit
+        self.path = os.path.join(self.directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}{_SUFFIX}")
+        self.write()
+        metrics.snapshot_source = self.snapshots
+        self._task = asyncio.create_task(self._run())
+        logger.info("Cross-worker metrics started", directory=self.directory)
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        metrics.snapshot_source = None
+        # Counted since the last write; archived by the master once we exit
+        self.write()
+
+    def write(self):
+        registry = metrics.registry
+        _dump(self.path, {
+            "samples": registry.snapshot(),
+            "gauges": registry.gauge_names()
+        })
+
+    def snapshots(self) -> List[Dict[str, Any]]:
+        """Every worker's samples, this one's freshly written"""
+        self.write()
+        archive_path = os.path.join(self.directory, ARCHIVE_NAME)
+        names = [name for name in os.listdir(self.directory) if name.endswith(_SUFFIX) and name != ARCHIVE_NAME]
+        archive = self._load_archive(archive_path)
+        snapshots = [archive.get("samples", {})]
+        for name in names:
+            if name in archive.get("absorbed", []):
+                continue
+            try:
+                snapshots.append(_load(os.path.join(self.directory, name))["samples"])
+            except FileNotFoundError:
+                # Archived since the listing: the new archive holds it
+                archive = self._load_archive(archive_path)
+                snapshots[0] = archive.get("samples", {})
+            except ValueError as e:
+                logger.warning("Unreadable metrics snapshot", file=name, error=str(e))
+        return snapshots
+
+    @staticmethod
+    def _load_archive(path: str) -> Dict[str, Any]:
+        try:
+            return _load(path)
+        except FileNotFoundError:
+            return {}
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.write)
+            except OSError as e:
+                logger.warning("Could not write metrics snapshot", error=str(e))
+
+# Global metrics synchronization, started from the app lifespan
+metrics_sync = MetricsSync(settings.metrics_sync_dir, settings.metrics_sync_seconds)
@@ -1,9 +1,9 @@
 """
 Pydantic models for SISMOBI 3.2.0
 """
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, Field, model_validator
 from typing import Optional, List, Dict, Any
-from datetime import datetime
+from datetime import datetime, timezone
 from enum import Enum
 import uuid
 
@@ -73,6 +73,17 @@ class Property(PropertyBase, BaseDocument):
     tenant_id: Optional[str] = None
 
 # Tenant Models
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # MongoDB hands back naive UTC datetimes; payloads may carry an offset
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def check_contract_dates(start: Optional[datetime], end: Optional[datetime]) -> None:
+    start, end = _naive_utc(start), _naive_utc(end)
+    if start and end and end < start:
+        raise ValueError('contract_end_date must not be before contract_start_date')
+
 class TenantBase(BaseModel):
     name: str = Field(..., min_length=1, max_length=200)
     email: str = Field(..., pattern=r'^[^@]+@[^@]+\.[^@]+$')
@@ -83,6 +94,13 @@ class TenantBase(BaseModel):
     rent_due_date: int = Field(..., ge=1, le=31)
     status: TenantStatus = TenantStatus.active
     notes: Optional[str] = Field(None, max_length=1000)
+    contract_start_date: Optional[datetime] = None
+    contract_end_date: Optional[datetime] = None
+
+    @model_validator(mode='after')
+    def validate_contract_dates(self):
+        check_contract_dates(self.contract_start_date, self.contract_end_date)
+        return self
 
 class TenantCreate(TenantBase):
     pass
@@ -97,6 +115,15 @@ class TenantUpdate(BaseModel):
     rent_due_date: Optional[int] = Field(None, ge=1, le=31)
     status: Optional[TenantStatus] = None
     notes: Optional[str] = Field(None, max_length=1000)
+    contract_start_date: Optional[datetime] = None
+    contract_end_date: Optional[datetime] = None
+
+    @model_validator(mode='after')
+    def validate_contract_dates(self):
+        # Covers updates sending both dates; the router checks a single
+        # date against the stored one
+        check_contract_dates(self.contract_start_date, self.contract_end_date)
+        return self
 
 class Tenant(TenantBase, BaseDocument):
     pass
@@ -179,7 +206,10 @@ class DocumentUpdate(BaseModel):
     description: Optional[str] = Field(None, max_length=1000)
 
 class Document(DocumentBase, BaseDocument):
-    pass
+    # Set by uploads only: a client-chosen hash would release a blob it never retained
+    sha256: Optional[str] = Field(None, min_length=64, max_length=64)
+    has_thumbnail: bool = False
+    text_extracted: bool = False
 
 # Energy Bill Models
 class EnergyBillBase(BaseModel):
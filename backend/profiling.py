@@ -0,0 +1,242 @@
+"""
+Opt-in request profiling for SISMOBI 3.2.0
+
+ProfilingMiddleware runs a stack sampler for selected requests and stores the
+result as collapsed stacks (the input format of flamegraph.pl / speedscope)
+under settings.profiling_dir/<route>/. A request is profiled when any of
+these holds:
+
+- its route template is listed in PROFILING_ROUTES
+- it carries `X-Profile: <PROFILING_TOKEN>`
+- it is picked by 1-in-PROFILING_SAMPLE_RATE sampling
+
+All three are off by default, and unprofiled requests pay one cheap check.
+
+The sampler thread looks at the event loop thread every interval. Samples
+where the request's own frames are on the stack are on-CPU time; otherwise
+the request is suspended and the sample records the await chain it is
+parked on under a "[await]" root, so I/O waits show up too. Other requests
+running on the loop at the same time are not attributed to this one.
+"""
+from typing import Any, Dict, List, Optional
+from collections import Counter
+from datetime import datetime
+import asyncio
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+import structlog
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import settings
+
+logger = structlog.get_logger(__name__)
+
+PROFILE_SUFFIX = ".collapsed"
+# Ids made by ProfileStore.save: <route slug>__<timestamp>_<random hex>
+_PROFILE_ID = re.compile(r"^(?P<slug>[A-Za-z0-9]+(?:_[A-Za-z0-9]+)*)__\d{8}T\d{6}_[0-9a-f]{8}$")
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class StackSampler:
+    """Samples one request's stack from a background thread"""
+
+    def __init__(self, entry_frame, task: Optional[asyncio.Task], interval: float):
+        self.entry_frame = entry_frame
+        self.task = task
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = self._running_stack(frame) if frame is not None else None
+            if stack is None:
+                stack = self._awaiting_stack()
+            if stack:
+                self.stacks[";".join(stack)] += 1
+
+    def _running_stack(self, frame) -> Optional[List[str]]:
+        """Frames below the entry frame if the request is on the CPU, else None"""
+        labels = []
+        while frame is not None:
+            if frame is self.entry_frame:
+                return labels[::-1]
+            labels.append(_frame_label(frame.f_code))
+            frame = frame.f_back
+        return None
+
+    def _awaiting_stack(self) -> List[str]:
+        """The await chain of the suspended request, below the entry frame"""
+        if self.task is None:
+            return []
+        labels = ["[await]"]
+        inside = False
+        awaitable = self.task.get_coro()
+        while awaitable is not None:
+            frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "ag_frame", None)
+            if frame is None:
+                break
+            if inside:
+                labels.append(_frame_label(frame.f_code))
+            elif frame is self.entry_frame:
+                inside = True
+            awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "ag_await", None)
+        return labels if inside else []
+
+class ProfileStore:
+    """Collapsed-stack files on local disk, one directory per route
+
+    Only the newest `max_per_route` profiles of each route are kept.
+    """
+
+    def __init__(self, root: str, max_per_route: int = 50):
+        self.root = os.path.abspath(root)
+        self.max_per_route = max_per_route
+
+    @staticmethod
+    def route_slug(route: str) -> str:
+        return re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+
+    def save(self, route: str, method: str, status: int, duration: float, stacks: Counter) -> str:
+        slug = self.route_slug(route)
+        directory = os.path.join(self.root, slug)
+        os.makedirs(directory, exist_ok=True)
+        profile_id = f"{slug}__{datetime.now().strftime('%Y%m%dT%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        header = f"# route={route} method={method} status={status} duration_ms={duration * 1000:.2f} samples={sum(stacks.values())}\n"
+        body = "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        with open(os.path.join(directory, profile_id + PROFILE_SUFFIX), "w") as f:
+            f.write(header + body)
+        self._prune(directory)
+        return profile_id
+
+    def _prune(self, directory: str):
+        """Delete the oldest profiles of a route beyond max_per_route"""
+        paths = [
+            os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(PROFILE_SUFFIX)
+        ]
+        if len(paths) <= self.max_per_route:
+            return
+        paths.sort(key=os.path.getmtime)
+        for path in paths[:len(paths) - self.max_per_route]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def path_for(self, profile_id: str) -> Optional[str]:
+        """File of a saved profile; None for unknown ids or anything but the generated format"""
+        match = _PROFILE_ID.match(profile_id)
+        if not match:
+            return None
+        path = os.path.realpath(os.path.join(self.root, match.group("slug"), profile_id + PROFILE_SUFFIX))
+        if os.path.commonpath([path, os.path.realpath(self.root)]) != os.path.realpath(self.root):
+            return None
+        return path if os.path.isfile(path) else None
+
+    def list(self, route: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Most recent profiles first, with the metadata from each header line"""
+        if not os.path.isdir(self.root):
+            return []
+        slugs = [self.route_slug(route)] if route else os.listdir(self.root)
+        entries = []
+        for slug in slugs:
+            directory = os.path.join(self.root, slug)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                if name.endswith(PROFILE_SUFFIX):
+                    entries.append((os.path.getmtime(os.path.join(directory, name)), os.path.join(directory, name)))
+        entries.sort(reverse=True)
+
+        profiles = []
+        for mtime, path in entries[:limit]:
+            with open(path) as f:
+                header = f.readline()
+            meta = dict(part.split("=", 1) for part in header.lstrip("# ").split() if "=" in part)
+            profiles.append({
+                "id": os.path.basename(path)[:-len(PROFILE_SUFFIX)],
+                "created_at": datetime.fromtimestamp(mtime),
+                **meta
+            })
+        return profiles
+
+# Global profile store
+profile_store = ProfileStore(settings.profiling_dir, settings.profiling_max_per_route)
+
+class ProfilingMiddleware:
+    """Profile selected requests with StackSampler (see module docstring)"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.routes = set(settings.profiling_routes)
+        self.token = settings.profiling_token
+        self.sample_rate = settings.profiling_sample_rate
+        self.interval = settings.profiling_interval_ms / 1000
+        self._route_patterns = None
+
+    def _route_selected(self, scope: Scope) -> bool:
+        if self._route_patterns is None:
+            router = scope["app"].router
+            self._route_patterns = [
+                (route.path_regex, route.methods) for route in router.routes
+                if getattr(route, "path_format", None) in self.routes
+            ]
+        return any(
+            regex.match(scope["path"]) and (not methods or scope["method"] in methods)
+            for regex, methods in self._route_patterns
+        )
+
+    def _selected(self, scope: Scope) -> bool:
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == b"x-profile" and value.decode("latin-1") == self.token:
+                    return True
+        if self.sample_rate > 0 and random.random() * self.sample_rate < 1:
+            return True
+        return bool(self.routes) and self._route_selected(scope)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self._selected(scope):
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        sampler = StackSampler(sys._getframe(), asyncio.current_task(), self.interval)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            await asyncio.to_thread(sampler.stop)
+            route = getattr(scope.get("route"), "path_format", None) or "unmatched"
+            try:
+                profile_id = await asyncio.to_thread(
+                    profile_store.save, route, scope["method"], status, duration, sampler.stacks
+                )
+                logger.info("Request profiled", route=route, profile_id=profile_id, samples=sum(sampler.stacks.values()))
+            except OSError as e:
+                logger.warning("Could not store request profile", route=route, error=str(e))
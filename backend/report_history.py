@@ -0,0 +1,113 @@
+"""
+Histórico de geração de relatórios para SISMOBI
+"""
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timedelta
+import asyncio
+import uuid
+import numpy as np
+import structlog
+
+from config import settings
+from database import get_collection
+from utils import get_paginated_results
+
+logger = structlog.get_logger(__name__)
+
+HISTORY_COLLECTION = "reports_history"
+
+async def record_report_generation(
+    report_type: str,
+    filters: Dict[str, Any],
+    user_email: str,
+    metrics: Dict[str, Any],
+    total_seconds: float
+):
+    """Grava um registro de geração de relatório
+
+    Chamado como background task, depois que a resposta foi enviada; falhas
+    são apenas logadas para nunca afetar o usuário.
+    """
+    record = {
+        "id": str(uuid.uuid4()),
+        "report_type": report_type,
+        "filters": {k: v for k, v in filters.items() if v is not None},
+        "user": user_email,
+        "rows": metrics.get("rows", 0),
+        "query_ms": round(metrics.get("query_seconds", 0) * 1000, 2),
+        "render_ms": round(metrics.get("render_seconds", 0) * 1000, 2),
+        "total_ms": round(total_seconds * 1000, 2),
+        "pdf_bytes": metrics.get("pdf_bytes", 0),
+        "cache_hit": metrics.get("cache_hit", False),
+        "phases_ms": {phase: round(seconds * 1000, 2) for phase, seconds in metrics.get("phases", {}).items()},
+        "created_at": datetime.now()
+    }
+    try:
+        await get_collection(HISTORY_COLLECTION).insert_one(record)
+    except Exception as e:
+        logger.warning("Could not record report generation", report_type=report_type, error=str(e))
+
+async def get_reports_history(
+    page: int = 1,
+    page_size: int = 20,
+    report_type: Optional[str] = None
+) -> Dict[str, Any]:
+    """Histórico paginado, mais recentes primeiro"""
+    filter_dict = {"report_type": report_type} if report_type else {}
+    return await get_paginated_results(
+        get_collection(HISTORY_COLLECTION), filter_dict, page, page_size, "created_at", -1
+    )
+
+async def _latency_samples(report_type: str, since: datetime, limit: int) -> Optional[Dict[str, Any]]:
+    """Latências dos `limit` registros mais recentes de um tipo desde `since`"""
+    pipeline = [
+        {"$match": {"report_type": report_type, "created_at": {"$gte": since}}},
+        {"$sort": {"created_at": -1}},
+        {"$limit": limit},
+        {
+            "$group": {
+                "_id": "$report_type",
+                "total_ms": {"$push": "$total_ms"},
+                "query_ms": {"$push": "$query_ms"},
+                "render_ms": {"$push": "$render_ms"},
+                "avg_rows": {"$avg": "$rows"},
+                "avg_pdf_bytes": {"$avg": "$pdf_bytes"},
+                "cache_hits": {"$sum": {"$cond": ["$cache_hit", 1, 0]}}
+            }
+        }
+    ]
+    rows = await get_collection(HISTORY_COLLECTION).aggregate(pipeline, allowDiskUse=True).to_list(1)
+    return rows[0] if rows else None
+
+async def get_latency_summary(days: int = 30, max_records: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Percentis de latência por tipo de relatório no período
+
+    Usa no máximo os `max_records` registros mais recentes da janela de cada
+    tipo (settings.report_summary_max_records por padrão): o $group acumula
+    as latências em arrays, que não podem crescer com o histórico. Cada tipo
+    tem sua própria consulta limitada (índice report_type + created_at), para
+    que tipos frequentes não tirem os raros do resumo.
+    """
+    since = datetime.now() - timedelta(days=days)
+    limit = max_records or settings.report_summary_max_records
+    report_types = sorted(await get_collection(HISTORY_COLLECTION).distinct(
+        "report_type", {"created_at": {"$gte": since}}
+    ))
+    rows = await asyncio.gather(*(_latency_samples(report_type, since, limit) for report_type in report_types))
+
+    summary = []
+    for row in filter(None, rows):
+        count = len(row["total_ms"])
+        entry = {
+            "report_type": row["_id"],
+            "count": count,
+            "avg_rows": row["avg_rows"],
+            "avg_pdf_bytes": row["avg_pdf_bytes"],
+            "cache_hit_rate": row["cache_hits"] / count
+        }
+        for field in ("total_ms", "query_ms", "render_ms"):
+            p50, p95, p99 = np.percentile(np.asarray(row[field], dtype=np.float64), [50, 95, 99])
+            entry[field] = {"p50": round(float(p50), 2), "p95": round(float(p95), 2), "p99": round(float(p99), 2)}
+        summary.append(entry)
+
+    return summary
@@ -6,34 +6,108 @@ Data: 2025-01-07
 
 import io
 import os
+import asyncio
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Any
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4, letter
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch, cm
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-from reportlab.graphics.shapes import Drawing, Rect, String
-from reportlab.graphics.charts.linecharts import HorizontalLineChart
-from reportlab.graphics.charts.barcharts import VerticalBarChart
-from reportlab.graphics.widgets.markers import makeMarker
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_pdf import PdfPages
-import base64
-
-from database import get_collection
+from typing import List, Dict, Optional, Any, AsyncIterator, Callable
+import numpy as np
+
+from database import READ_REPORTS, get_collection
 from models import Property, Tenant, Transaction, Alert
 from utils import convert_objectid_to_str
+from config import settings
+
+# O reportlab é importado sob demanda (ver _load_reportlab): importar o módulo
+# de relatórios não deve custar tempo nem memória no startup de cada worker.
+colors = A4 = getSampleStyleSheet = ParagraphStyle = inch = None
+SimpleDocTemplate = Paragraph = Spacer = Table = TableStyle = Frame = PageTemplate = None
+TA_CENTER = TA_LEFT = TA_RIGHT = None
+Drawing = String = HorizontalLineChart = VerticalBarChart = makeMarker = None
+
+_reportlab_loaded = False
+_reportlab_lock = threading.Lock()
+
+def _load_reportlab():
+    """Importa o reportlab na primeira renderização e publica os nomes no módulo"""
+    global _reportlab_loaded, colors, A4, getSampleStyleSheet, ParagraphStyle, inch
+    global SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Frame, PageTemplate, TA_CENTER, TA_LEFT, TA_RIGHT
+    global Drawing, String, HorizontalLineChart, VerticalBarChart, makeMarker
+    
+    if _reportlab_loaded:
+        return
+    with _reportlab_lock:
+        if _reportlab_loaded:
+            return
+        from reportlab.lib import colors
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.lib.units import inch
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Frame, PageTemplate
+        from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+        from reportlab.graphics.shapes import Drawing, String
+        from reportlab.graphics.charts.linecharts import HorizontalLineChart
+        from reportlab.graphics.charts.barcharts import VerticalBarChart
+        from reportlab.graphics.widgets.markers import makeMarker
+        _reportlab_loaded = True
+
+# Gráficos: no máximo N meses / categorias por gráfico
+MAX_CHART_MONTHS = 24
+MAX_CHART_CATEGORIES = 10
+CHART_CACHE_SIZE = 64
+
+# Cache de Drawings já renderizados, por (tipo, hash das séries, tamanho)
+_chart_cache: "OrderedDict[tuple, Any]" = OrderedDict()
+_chart_cache_lock = threading.Lock()
+
+def _series_key(kind: str, labels: List[str], series: List[np.ndarray], width: float, height: float) -> tuple:
+    """Chave do cache de gráficos: hash dos rótulos e dos valores das séries"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update("\x1f".join(labels).encode())
+    for values in series:
+        digest.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    return (kind, digest.hexdigest(), width, height)
+
+def _cached_chart(key: tuple, build) -> tuple:
+    """Retorna (drawing, cache_hit), construindo o Drawing só na primeira vez
+
+    O platypus grava estado de layout no flowable durante o build, então cada
+    documento recebe uma cópia rasa do Drawing em cache, nunca o original.
+    """
+    with _chart_cache_lock:
+        drawing = _chart_cache.get(key)
+        if drawing is not None:
+            _chart_cache.move_to_end(key)
+            return copy.copy(drawing), True
+    drawing = build()
+    with _chart_cache_lock:
+        _chart_cache[key] = drawing
+        while len(_chart_cache) > CHART_CACHE_SIZE:
+            _chart_cache.popitem(last=False)
+    return copy.copy(drawing), False
 
 class PDFReportGenerator:
     """Gerador de relatórios em PDF para SISMOBI"""
     
     def __init__(self):
-        self.styles = getSampleStyleSheet()
-        self.setup_custom_styles()
+        self._styles = None
+    
+    @property
+    def styles(self):
+        """Folha de estilos, criada (junto com o import do reportlab) no primeiro uso"""
+        if self._styles is None:
+            _load_reportlab()
+            self._styles = getSampleStyleSheet()
+            self.setup_custom_styles()
+        return self._styles
+    
+    async def _ensure_renderer(self):
+        """Carrega o reportlab fora do event loop antes da primeira renderização"""
+        if not _reportlab_loaded:
+            await asyncio.to_thread(_load_reportlab)
         
     def setup_custom_styles(self):
         """Configura estilos personalizados para os relatórios"""
@@ -84,10 +158,26 @@ class PDFReportGenerator:
         start_date: Optional[datetime] = None,
         end_date: Optional[datetime] = None,
         property_id: Optional[str] = None,
-        tenant_id: Optional[str] = None
+        tenant_id: Optional[str] = None,
+        metrics: Optional[Dict[str, Any]] = None
     ) -> bytes:
-        """Gera relatório financeiro em PDF"""
+        """Gera relatório financeiro em PDF
+        
+        Se `metrics` for informado, é preenchido com tempos de consulta e
+        renderização, número de linhas e tamanho do PDF.
+        """
+        metrics = metrics if metrics is not None else {}
+        await self._ensure_renderer()
+        
+        # Buscar dados das transações
+        query_start = time.perf_counter()
+        transactions_data = await self._get_transactions_data(
+            start_date, end_date, property_id, tenant_id
+        )
+        metrics["query_seconds"] = time.perf_counter() - query_start
+        metrics["rows"] = transactions_data["count"]
         
+        render_start = time.perf_counter()
         buffer = io.BytesIO()
         doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=1*inch)
         story = []
@@ -96,11 +186,6 @@ class PDFReportGenerator:
         story.extend(await self._create_header("Relatório Financeiro"))
         story.extend(await self._create_period_info(start_date, end_date))
         
-        # Buscar dados das transações
-        transactions_data = await self._get_transactions_data(
-            start_date, end_date, property_id, tenant_id
-        )
-        
         # Resumo financeiro
         story.extend(await self._create_financial_summary(transactions_data))
         
@@ -108,23 +193,32 @@ class PDFReportGenerator:
         story.extend(await self._create_transactions_detail(transactions_data))
         
         # Gráfico de receitas vs despesas (se houver dados)
-        if transactions_data['transactions']:
-            story.extend(await self._create_financial_chart(transactions_data))
+        if transactions_data['count']:
+            story.extend(await self._create_financial_chart(transactions_data, metrics))
         
         # Footer
         story.extend(await self._create_footer())
         
         doc.build(story)
-        buffer.seek(0)
-        return buffer.getvalue()
+        return self._finish(buffer, metrics, render_start)
 
     async def generate_properties_report(
         self,
         status_filter: Optional[str] = None,
-        property_type: Optional[str] = None
+        property_type: Optional[str] = None,
+        metrics: Optional[Dict[str, Any]] = None
     ) -> bytes:
         """Gera relatório de propriedades em PDF"""
+        metrics = metrics if metrics is not None else {}
+        await self._ensure_renderer()
+        
+        # Buscar dados das propriedades
+        query_start = time.perf_counter()
+        properties_data = await self._get_properties_data(status_filter, property_type)
+        metrics["query_seconds"] = time.perf_counter() - query_start
+        metrics["rows"] = properties_data["count"]
         
+        render_start = time.perf_counter()
         buffer = io.BytesIO()
         doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=1*inch)
         story = []
@@ -132,9 +226,6 @@ class PDFReportGenerator:
         # Header do relatório
         story.extend(await self._create_header("Relatório de Propriedades"))
         
-        # Buscar dados das propriedades
-        properties_data = await self._get_properties_data(status_filter, property_type)
-        
         # Resumo de propriedades
         story.extend(await self._create_properties_summary(properties_data))
         
@@ -145,16 +236,25 @@ class PDFReportGenerator:
         story.extend(await self._create_footer())
         
         doc.build(story)
-        buffer.seek(0)
-        return buffer.getvalue()
+        return self._finish(buffer, metrics, render_start)
 
     async def generate_tenants_report(
         self,
         property_id: Optional[str] = None,
-        status_filter: Optional[str] = None
+        status_filter: Optional[str] = None,
+        metrics: Optional[Dict[str, Any]] = None
     ) -> bytes:
         """Gera relatório de inquilinos em PDF"""
+        metrics = metrics if metrics is not None else {}
+        await self._ensure_renderer()
+        
+        # Buscar dados dos inquilinos
+        query_start = time.perf_counter()
+        tenants_data = await self._get_tenants_data(property_id, status_filter)
+        metrics["query_seconds"] = time.perf_counter() - query_start
+        metrics["rows"] = tenants_data["count"]
         
+        render_start = time.perf_counter()
         buffer = io.BytesIO()
         doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=1*inch)
         story = []
@@ -162,9 +262,6 @@ class PDFReportGenerator:
         # Header do relatório
         story.extend(await self._create_header("Relatório de Inquilinos"))
         
-        # Buscar dados dos inquilinos
-        tenants_data = await self._get_tenants_data(property_id, status_filter)
-        
         # Resumo de inquilinos
         story.extend(await self._create_tenants_summary(tenants_data))
         
@@ -175,16 +272,47 @@ class PDFReportGenerator:
         story.extend(await self._create_footer())
         
         doc.build(story)
-        buffer.seek(0)
-        return buffer.getvalue()
+        return self._finish(buffer, metrics, render_start)
 
     async def generate_comprehensive_report(
         self,
         start_date: Optional[datetime] = None,
-        end_date: Optional[datetime] = None
+        end_date: Optional[datetime] = None,
+        metrics: Optional[Dict[str, Any]] = None
     ) -> bytes:
         """Gera relatório completo do sistema"""
+        metrics = metrics if metrics is not None else {}
+        await self._ensure_renderer()
+        
+        # Buscar todos os dados antes de montar o documento; as consultas são
+        # independentes e rodam em paralelo, limitadas a report_fetch_concurrency
+        query_start = time.perf_counter()
+        semaphore = asyncio.Semaphore(settings.report_fetch_concurrency)
+        phases: Dict[str, float] = {}
+        
+        async def timed(phase: str, fetch):
+            async with semaphore:
+                phase_start = time.perf_counter()
+                try:
+                    return await fetch
+                finally:
+                    phases[phase] = time.perf_counter() - phase_start
+        
+        dashboard_data, transactions_data, properties_data, tenants_data, alerts_data = await asyncio.gather(
+            timed("dashboard", self._get_dashboard_summary()),
+            timed("transactions", self._get_transactions_data(start_date, end_date)),
+            timed("properties", self._get_properties_data()),
+            timed("tenants", self._get_tenants_data()),
+            timed("alerts", self._get_alerts_data())
+        )
+        metrics["query_seconds"] = time.perf_counter() - query_start
+        metrics["phases"] = phases
+        metrics["rows"] = (
+            transactions_data["count"] + properties_data["count"]
+            + tenants_data["count"] + alerts_data["count"]
+        )
         
+        render_start = time.perf_counter()
         buffer = io.BytesIO()
         doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=1*inch)
         story = []
@@ -194,31 +322,242 @@ class PDFReportGenerator:
         story.extend(await self._create_period_info(start_date, end_date))
         
         # Dashboard summary
-        dashboard_data = await self._get_dashboard_summary()
         story.extend(await self._create_dashboard_summary(dashboard_data))
         
         # Resumo financeiro
-        transactions_data = await self._get_transactions_data(start_date, end_date)
         story.extend(await self._create_financial_summary(transactions_data))
         
         # Resumo de propriedades
-        properties_data = await self._get_properties_data()
         story.extend(await self._create_properties_summary(properties_data))
         
         # Resumo de inquilinos
-        tenants_data = await self._get_tenants_data()
         story.extend(await self._create_tenants_summary(tenants_data))
         
         # Alertas pendentes
-        alerts_data = await self._get_alerts_data()
         story.extend(await self._create_alerts_summary(alerts_data))
         
         # Footer
         story.extend(await self._create_footer())
         
         doc.build(story)
-        buffer.seek(0)
-        return buffer.getvalue()
+        return self._finish(buffer, metrics, render_start)
+
+    # Modo streaming: PDF escrito em arquivo, linhas lidas do cursor em lotes
+
+    async def generate_financial_report_stream(
+        self,
+        path: str,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        property_id: Optional[str] = None,
+        tenant_id: Optional[str] = None,
+        metrics: Optional[Dict[str, Any]] = None
+    ) -> int:
+        """Gera o relatório financeiro com todos os lançamentos em `path`
+        
+        O resumo vem de agregações no servidor; os lançamentos são lidos do
+        cursor em lotes de settings.report_stream_batch_size e renderizados
+        lote a lote, então a memória não cresce com o número de linhas.
+        Retorna o tamanho do arquivo em bytes.
+        """
+        metrics = metrics if metrics is not None else {}
+        await self._ensure_renderer()
+        
+        query_start = time.perf_counter()
+        summary = await self._get_transactions_summary(start_date, end_date, property_id, tenant_id)
+        metrics["query_seconds"] = time.perf_counter() - query_start
+        
+        head = []
+        head.extend(await self._create_header("Relatório Financeiro"))
+        head.extend(await self._create_period_info(start_date, end_date))
+        head.extend(await self._create_financial_summary(summary))
+        head.extend(await self._create_transactions_detail(summary))
+        if summary['count']:
+            head.extend(await self._create_financial_chart(summary, metrics))
+            head.append(Paragraph("🧾 Lançamentos", self.styles['CustomSubtitle']))
+        
+        cursor = get_collection("transactions", READ_REPORTS).find(
+            self._transactions_query(start_date, end_date, property_id, tenant_id),
+            {"_id": 0, "date": 1, "description": 1, "category": 1, "type": 1, "amount": 1}
+        ).sort("date", -1)
+        batches = self._stream_table(
+            cursor,
+            ['Data', 'Descrição', 'Categoria', 'Tipo', 'Valor'],
+            [0.9*inch, 2.4*inch, 1.3*inch, 0.8*inch, 1.1*inch],
+            lambda t: [
+                t["date"].strftime('%d/%m/%Y') if isinstance(t.get("date"), datetime) else 'N/A',
+                str(t.get("description", ""))[:40],
+                str(t.get("category", "Outros"))[:20],
+                'Receita' if t.get("type") == "income" else 'Despesa',
+                f"R$ {t.get('amount', 0):,.2f}"
+            ],
+            metrics
+        )
+        return await self._build_streaming(path, head, batches, await self._create_footer(), metrics)
+
+    async def generate_tenants_report_stream(
+        self,
+        path: str,
+        property_id: Optional[str] = None,
+        status_filter: Optional[str] = None,
+        metrics: Optional[Dict[str, Any]] = None
+    ) -> int:
+        """Gera o relatório de inquilinos com a lista completa em `path`
+        
+        Ver generate_financial_report_stream. Retorna o tamanho do arquivo em bytes.
+        """
+        metrics = metrics if metrics is not None else {}
+        await self._ensure_renderer()
+        
+        query = {}
+        if property_id:
+            query["property_id"] = property_id
+        if status_filter:
+            query["status"] = status_filter
+        
+        query_start = time.perf_counter()
+        collection = get_collection("tenants", READ_REPORTS)
+        status_counts = {
+            row["_id"]: row["count"]
+            async for row in collection.aggregate([
+                {"$match": query},
+                {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+            ])
+        }
+        metrics["query_seconds"] = time.perf_counter() - query_start
+        count = sum(status_counts.values())
+        summary = {
+            "count": count,
+            "active_count": status_counts.get("active", 0),
+            "inactive_count": count - status_counts.get("active", 0)
+        }
+        
+        head = []
+        head.extend(await self._create_header("Relatório de Inquilinos"))
+        head.extend(await self._create_tenants_summary(summary))
+        if count:
+            head.append(Paragraph("👨‍👩‍👧‍👦 Lista de Inquilinos", self.styles['CustomSubtitle']))
+        else:
+            head.append(Paragraph("Nenhum inquilino encontrado.", self.styles['Normal']))
+        
+        cursor = collection.find(
+            query, {"_id": 0, "name": 1, "email": 1, "phone": 1, "status": 1}
+        ).sort("created_at", -1)
+        batches = self._stream_table(
+            cursor,
+            ['Nome', 'Email', 'Telefone', 'Status'],
+            [1.5*inch, 2*inch, 1.5*inch, 1*inch],
+            lambda t: [
+                str(t.get('name', 'N/A'))[:20],
+                str(t.get('email', 'N/A'))[:25],
+                t.get('phone', 'N/A'),
+                'Ativo' if t.get('status') == 'active' else 'Inativo'
+            ],
+            metrics
+        )
+        return await self._build_streaming(path, head, batches, await self._create_footer(), metrics)
+
+    async def _stream_table(
+        self,
+        cursor,
+        header: List[str],
+        col_widths: List[float],
+        to_row: Callable[[Dict[str, Any]], List[str]],
+        metrics: Dict[str, Any]
+    ) -> AsyncIterator[List]:
+        """Converte um cursor em tabelas de até report_stream_batch_size linhas"""
+        batch_size = settings.report_stream_batch_size
+        style = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('ALIGN', (-1, 1), (-1, -1), 'RIGHT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 8),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#f8fafc')),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.black)
+        ])
+        metrics["rows"] = 0
+        rows = [header]
+        try:
+            async for doc in cursor.batch_size(batch_size):
+                rows.append(to_row(doc))
+                if len(rows) > batch_size:
+                    metrics["rows"] += len(rows) - 1
+                    yield [Table(rows, colWidths=col_widths, repeatRows=1, style=style)]
+                    rows = [header]
+            if len(rows) > 1:
+                metrics["rows"] += len(rows) - 1
+                yield [Table(rows, colWidths=col_widths, repeatRows=1, style=style)]
+        finally:
+            # Também quando a renderização falha e o gerador é fechado no meio
+            await cursor.close()
+
+    async def _build_streaming(
+        self,
+        path: str,
+        head: List,
+        batches: AsyncIterator[List],
+        tail: List,
+        metrics: Dict[str, Any]
+    ) -> int:
+        """Renderiza head + lotes + tail em `path`, um lote por vez
+
+        Cada lote é buscado no event loop e disposto no documento aberto numa
+        thread, então só um lote de linhas existe em memória por vez. O
+        cursor é fechado mesmo se a renderização falhar.
+        """
+        render_start = time.perf_counter()
+        doc = SimpleDocTemplate(path, pagesize=A4, topMargin=1*inch, pageCompression=1)
+        # Os mesmos templates de página que SimpleDocTemplate.build cria
+        frame = Frame(doc.leftMargin, doc.bottomMargin, doc.width, doc.height, id='normal')
+        doc.addPageTemplates([
+            PageTemplate(id='First', frames=frame, pagesize=doc.pagesize),
+            PageTemplate(id='Later', frames=frame, pagesize=doc.pagesize)
+        ])
+        try:
+            await asyncio.to_thread(self._begin_document, doc)
+            await asyncio.to_thread(self._layout, doc, head)
+            async for batch in batches:
+                await asyncio.to_thread(self._layout, doc, batch)
+            await asyncio.to_thread(self._layout, doc, tail)
+            await asyncio.to_thread(self._end_document, doc)
+        finally:
+            await batches.aclose()
+        
+        metrics["render_seconds"] = time.perf_counter() - render_start
+        metrics["pdf_bytes"] = os.path.getsize(path)
+        metrics.setdefault("cache_hit", False)
+        return metrics["pdf_bytes"]
+
+    # O laço de BaseDocTemplate.build dividido em etapas, para dispor os
+    # flowables à medida que os lotes chegam
+
+    @staticmethod
+    def _begin_document(doc) -> None:
+        doc._startBuild()
+        doc.canv._doctemplate = doc
+
+    @staticmethod
+    def _layout(doc, flowables: List) -> None:
+        """Dispõe flowables no documento aberto (handle_flowable consome a lista)"""
+        flowables = list(flowables)
+        while flowables:
+            doc.clean_hanging()
+            doc.handle_flowable(flowables)
+
+    @staticmethod
+    def _end_document(doc) -> None:
+        del doc.canv._doctemplate
+        doc._endBuild()
+
+    def _finish(self, buffer: io.BytesIO, metrics: Dict[str, Any], render_start: float) -> bytes:
+        """Extrai o PDF do buffer e registra tempo de renderização e tamanho"""
+        pdf_bytes = buffer.getvalue()
+        metrics["render_seconds"] = time.perf_counter() - render_start
+        metrics["pdf_bytes"] = len(pdf_bytes)
+        metrics.setdefault("cache_hit", False)
+        return pdf_bytes
 
     # Métodos auxiliares para criação de seções do PDF
 
@@ -280,22 +619,8 @@ class PDFReportGenerator:
     ) -> Dict[str, Any]:
         """Busca dados de transações com filtros"""
         
-        collection = get_collection("transactions")
-        query = {}
-        
-        # Filtros de data
-        if start_date or end_date:
-            query["date"] = {}
-            if start_date:
-                query["date"]["$gte"] = start_date
-            if end_date:
-                query["date"]["$lte"] = end_date
-                
-        # Filtros por propriedade/inquilino
-        if property_id:
-            query["property_id"] = property_id
-        if tenant_id:
-            query["tenant_id"] = tenant_id
+        collection = get_collection("transactions", READ_REPORTS)
+        query = self._transactions_query(start_date, end_date, property_id, tenant_id)
             
         cursor = collection.find(query).sort("date", -1)
         transactions = [convert_objectid_to_str(doc) async for doc in cursor]
@@ -319,9 +644,121 @@ class PDFReportGenerator:
             "total_expense": total_expense,
             "net_result": net_result,
             "categories": categories,
+            "monthly": self._monthly_series(transactions),
             "count": len(transactions)
         }
 
+    @staticmethod
+    def _transactions_query(
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        property_id: Optional[str] = None,
+        tenant_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Monta o filtro Mongo de transações"""
+        query = {}
+        
+        # Filtros de data
+        if start_date or end_date:
+            query["date"] = {}
+            if start_date:
+                query["date"]["$gte"] = start_date
+            if end_date:
+                query["date"]["$lte"] = end_date
+                
+        # Filtros por propriedade/inquilino
+        if property_id:
+            query["property_id"] = property_id
+        if tenant_id:
+            query["tenant_id"] = tenant_id
+        return query
+
+    async def _get_transactions_summary(
+        self,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        property_id: Optional[str] = None,
+        tenant_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Resumo financeiro agregado no servidor, sem carregar as transações"""
+        collection = get_collection("transactions", READ_REPORTS)
+        pipeline = [
+            {"$match": self._transactions_query(start_date, end_date, property_id, tenant_id)},
+            {
+                "$facet": {
+                    "categories": [
+                        {"$group": {
+                            "_id": {"category": {"$ifNull": ["$category", "Outros"]}, "type": "$type"},
+                            "total": {"$sum": "$amount"},
+                            "count": {"$sum": 1}
+                        }}
+                    ],
+                    "monthly": [
+                        {"$match": {"date": {"$type": "date"}}},
+                        {"$group": {
+                            "_id": {"year": {"$year": "$date"}, "month": {"$month": "$date"}, "type": "$type"},
+                            "total": {"$sum": "$amount"}
+                        }}
+                    ]
+                }
+            }
+        ]
+        result = await collection.aggregate(pipeline, allowDiskUse=True).to_list(length=1)
+        facets = result[0] if result else {"categories": [], "monthly": []}
+        
+        categories = {}
+        totals = {"income": 0, "expense": 0}
+        count = 0
+        for row in facets["categories"]:
+            amounts = categories.setdefault(row["_id"]["category"], {"income": 0, "expense": 0})
+            amounts[row["_id"]["type"]] += row["total"]
+            totals[row["_id"]["type"]] += row["total"]
+            count += row["count"]
+        
+        monthly = facets["monthly"]
+        monthly_series = self._bin_monthly(
+            np.array([r["_id"]["year"] * 12 + r["_id"]["month"] - 1 for r in monthly], dtype=np.int64),
+            np.array([r["total"] for r in monthly], dtype=np.float64),
+            np.array([r["_id"]["type"] == "income" for r in monthly], dtype=bool)
+        )
+        
+        return {
+            "total_income": totals["income"],
+            "total_expense": totals["expense"],
+            "net_result": totals["income"] - totals["expense"],
+            "categories": categories,
+            "monthly": monthly_series,
+            "count": count
+        }
+
+    @classmethod
+    def _monthly_series(cls, transactions: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Agrega receitas/despesas por mês em arrays NumPy"""
+        dated = [t for t in transactions if isinstance(t.get("date"), datetime)]
+        return cls._bin_monthly(
+            np.fromiter((t["date"].year * 12 + t["date"].month - 1 for t in dated), dtype=np.int64, count=len(dated)),
+            np.fromiter((t["amount"] for t in dated), dtype=np.float64, count=len(dated)),
+            np.fromiter((t["type"] == "income" for t in dated), dtype=bool, count=len(dated))
+        )
+
+    @staticmethod
+    def _bin_monthly(month_index: np.ndarray, amounts: np.ndarray, is_income: np.ndarray) -> Dict[str, Any]:
+        """Soma valores por índice de mês (ano*12 + mês-1)
+
+        Mantém apenas os últimos MAX_CHART_MONTHS meses com movimentação.
+        """
+        if not len(month_index):
+            return {"labels": [], "income": np.zeros(0), "expense": np.zeros(0)}
+
+        first = max(month_index.min(), month_index.max() - MAX_CHART_MONTHS + 1)
+        keep = month_index >= first
+        offsets = month_index[keep] - first
+        size = int(month_index.max() - first) + 1
+        income = np.bincount(offsets[is_income[keep]], weights=amounts[keep][is_income[keep]], minlength=size)
+        expense = np.bincount(offsets[~is_income[keep]], weights=amounts[keep][~is_income[keep]], minlength=size)
+        labels = [f"{(first + i) % 12 + 1:02d}/{(first + i) // 12 % 100:02d}" for i in range(size)]
+        return {"labels": labels, "income": income, "expense": expense}
+
     async def _get_properties_data(
         self,
         status_filter: Optional[str] = None,
@@ -329,7 +766,7 @@ class PDFReportGenerator:
     ) -> Dict[str, Any]:
         """Busca dados de propriedades com filtros"""
         
-        collection = get_collection("properties")
+        collection = get_collection("properties", READ_REPORTS)
         query = {}
         
         if status_filter:
@@ -373,7 +810,7 @@ class PDFReportGenerator:
     ) -> Dict[str, Any]:
         """Busca dados de inquilinos com filtros"""
         
-        collection = get_collection("tenants")
+        collection = get_collection("tenants", READ_REPORTS)
         query = {}
         
         if property_id:
@@ -399,10 +836,10 @@ class PDFReportGenerator:
         """Busca dados do dashboard"""
         
         # Buscar todas as collections
-        properties = get_collection("properties")
-        tenants = get_collection("tenants")
-        transactions = get_collection("transactions")
-        alerts = get_collection("alerts")
+        properties = get_collection("properties", READ_REPORTS)
+        tenants = get_collection("tenants", READ_REPORTS)
+        transactions = get_collection("transactions", READ_REPORTS)
+        alerts = get_collection("alerts", READ_REPORTS)
         
         # Contar totais
         total_properties = await properties.count_documents({})
@@ -442,7 +879,7 @@ class PDFReportGenerator:
     async def _get_alerts_data(self) -> Dict[str, Any]:
         """Busca dados de alertas"""
         
-        collection = get_collection("alerts")
+        collection = get_collection("alerts", READ_REPORTS)
         cursor = collection.find({"resolved": False}).sort("priority", 1).sort("created_at", -1)
         alerts = [convert_objectid_to_str(doc) async for doc in cursor]
         
@@ -497,7 +934,7 @@ class PDFReportGenerator:
         """Cria detalhamento de transações"""
         elements = []
         
-        if not data['transactions']:
+        if not data['count']:
             elements.append(Paragraph("Nenhuma transação encontrada no período.", self.styles['Normal']))
             return elements
         
@@ -533,21 +970,91 @@ class PDFReportGenerator:
         
         return elements
 
-    async def _create_financial_chart(self, data: Dict[str, Any]) -> List:
-        """Cria gráfico financeiro"""
+    async def _create_financial_chart(self, data: Dict[str, Any], metrics: Optional[Dict[str, Any]] = None) -> List:
+        """Cria gráficos de receitas/despesas mensais e por categoria"""
         elements = []
+        charts = []
+        
+        monthly = data.get("monthly") or {}
+        if len(monthly.get("labels", [])) > 1:
+            charts.append(self._monthly_chart(monthly["labels"], monthly["income"], monthly["expense"]))
+        
+        top = sorted(
+            data["categories"].items(),
+            key=lambda item: item[1]["income"] + item[1]["expense"],
+            reverse=True
+        )[:MAX_CHART_CATEGORIES]
+        if top:
+            labels = [str(name)[:12] for name, _ in top]
+            income = np.array([values["income"] for _, values in top], dtype=np.float64)
+            expense = np.array([values["expense"] for _, values in top], dtype=np.float64)
+            if income.any() or expense.any():
+                charts.append(self._category_chart(labels, income, expense))
+        
+        if not charts:
+            return elements
         
-        # Nota: Em um ambiente real, aqui seria criado um gráfico com matplotlib
-        # Por simplicidade, vamos adicionar apenas uma representação textual
         elements.append(Paragraph("📈 Análise Visual", self.styles['CustomSubtitle']))
-        elements.append(Paragraph(
-            f"Receitas representam {(data['total_income']/(data['total_income']+data['total_expense'])*100):,.1f}% do total de movimentações." if data['total_income']+data['total_expense'] > 0 else "Sem movimentações no período.",
-            self.styles['Normal']
-        ))
-        elements.append(Spacer(1, 20))
+        hits = 0
+        for drawing, hit in charts:
+            elements.append(drawing)
+            elements.append(Spacer(1, 15))
+            hits += hit
+        if metrics is not None:
+            metrics["cache_hit"] = hits == len(charts)
+        elements.append(Spacer(1, 5))
         
         return elements
 
+    def _monthly_chart(self, labels: List[str], income: np.ndarray, expense: np.ndarray, width: float = 430, height: float = 200) -> tuple:
+        """Gráfico de linhas com receitas e despesas por mês"""
+        def build():
+            drawing = Drawing(width, height)
+            chart = HorizontalLineChart()
+            chart.x, chart.y = 50, 40
+            chart.width, chart.height = width - 70, height - 70
+            chart.data = [tuple(income.tolist()), tuple(expense.tolist())]
+            chart.categoryAxis.categoryNames = labels
+            chart.categoryAxis.labels.angle = 45 if len(labels) > 12 else 0
+            chart.categoryAxis.labels.boxAnchor = 'ne' if len(labels) > 12 else 'n'
+            chart.categoryAxis.labels.fontSize = 7
+            chart.valueAxis.valueMin = 0
+            chart.valueAxis.labels.fontSize = 7
+            chart.valueAxis.labelTextFormat = lambda value: f"{value:,.0f}"
+            for index, color in enumerate((colors.HexColor('#059669'), colors.HexColor('#dc2626'))):
+                chart.lines[index].strokeColor = color
+                chart.lines[index].strokeWidth = 1.5
+                chart.lines[index].symbol = makeMarker('FilledCircle', size=3, fillColor=color)
+            drawing.add(chart)
+            drawing.add(String(width / 2, height - 15, "Receitas x Despesas por mês", fontSize=10, textAnchor='middle'))
+            return drawing
+        
+        return _cached_chart(_series_key("monthly", labels, [income, expense], width, height), build)
+
+    def _category_chart(self, labels: List[str], income: np.ndarray, expense: np.ndarray, width: float = 430, height: float = 200) -> tuple:
+        """Gráfico de barras com receitas e despesas por categoria"""
+        def build():
+            drawing = Drawing(width, height)
+            chart = VerticalBarChart()
+            chart.x, chart.y = 50, 40
+            chart.width, chart.height = width - 70, height - 70
+            chart.data = [tuple(income.tolist()), tuple(expense.tolist())]
+            chart.categoryAxis.categoryNames = labels
+            chart.categoryAxis.labels.fontSize = 7
+            chart.categoryAxis.labels.angle = 30
+            chart.categoryAxis.labels.boxAnchor = 'ne'
+            chart.valueAxis.valueMin = 0
+            chart.valueAxis.labels.fontSize = 7
+            chart.valueAxis.labelTextFormat = lambda value: f"{value:,.0f}"
+            chart.bars[0].fillColor = colors.HexColor('#059669')
+            chart.bars[1].fillColor = colors.HexColor('#dc2626')
+            chart.barSpacing = 1
+            drawing.add(chart)
+            drawing.add(String(width / 2, height - 15, "Receitas x Despesas por categoria", fontSize=10, textAnchor='middle'))
+            return drawing
+        
+        return _cached_chart(_series_key("category", labels, [income, expense], width, height), build)
+
     async def _create_properties_summary(self, data: Dict[str, Any]) -> List:
         """Cria resumo de propriedades"""
         elements = []
@@ -0,0 +1,88 @@
+"""
+Storage backend abstraction for SISMOBI 3.2.0
+
+Routers and services talk to the database through the Motor API (collections
+reached as attributes of the database returned by get_database), typed
+against the protocols below. They pin down the subset of that API the code
+base relies on, so any engine implementing them can be plugged in with
+DATABASE_ENGINE (tests/test_memory_engine.py checks both engines against them):
+
+- "mongo": Motor on top of a MongoDB deployment (default)
+- "memory": memory_engine.MemoryClient, a process-local engine with
+  secondary indexes for tests, local development and CPU-only benchmarks
+
+New code should stay inside this subset (or extend both engines) so the
+in-memory engine keeps covering every route.
+"""
+from typing import Any, AsyncIterator, Dict, List, Optional, Protocol, Sequence, Union
+
+from config import settings
+
+ENGINES = ("mongo", "memory")
+
+Filter = Dict[str, Any]
+Projection = Optional[Union[Dict[str, Any], Sequence[str]]]
+
+class AggregationCursor(Protocol):
+    def batch_size(self, batch_size: int) -> "AggregationCursor": ...
+    def __aiter__(self) -> AsyncIterator[Dict[str, Any]]: ...
+    async def to_list(self, length: Optional[int]) -> List[Dict[str, Any]]: ...
+    async def close(self) -> None: ...
+
+class Cursor(AggregationCursor, Protocol):
+    def sort(self, key_or_list: Any, direction: Optional[int] = None) -> "Cursor": ...
+    def skip(self, skip: int) -> "Cursor": ...
+    def limit(self, limit: int) -> "Cursor": ...
+
+class ChangeStream(Protocol):
+    """What Database.watch returns (engines without change streams raise OperationFailure instead)"""
+    resume_token: Any
+    def __aiter__(self) -> AsyncIterator[Dict[str, Any]]: ...
+    async def __aenter__(self) -> "ChangeStream": ...
+    async def __aexit__(self, *exc_info: Any) -> Any: ...
+    async def try_next(self) -> Optional[Dict[str, Any]]: ...
+    async def close(self) -> None: ...
+
+class Collection(Protocol):
+    def find(self, filter: Optional[Filter] = None, projection: Projection = None, **kwargs) -> Cursor: ...
+    async def find_one(self, filter: Optional[Filter] = None, projection: Projection = None, **kwargs) -> Optional[Dict[str, Any]]: ...
+    async def count_documents(self, filter: Filter, **kwargs) -> int: ...
+    async def estimated_document_count(self, **kwargs) -> int: ...
+    async def distinct(self, key: str, filter: Optional[Filter] = None, **kwargs) -> List[Any]: ...
+    def aggregate(self, pipeline: List[Dict[str, Any]], **kwargs) -> AggregationCursor: ...
+    async def insert_one(self, document: Dict[str, Any], **kwargs) -> Any: ...
+    async def insert_many(self, documents: List[Dict[str, Any]], **kwargs) -> Any: ...
+    async def update_one(self, filter: Filter, update: Dict[str, Any], upsert: bool = False, **kwargs) -> Any: ...
+    async def update_many(self, filter: Filter, update: Dict[str, Any], upsert: bool = False, **kwargs) -> Any: ...
+    async def replace_one(self, filter: Filter, replacement: Dict[str, Any], upsert: bool = False, **kwargs) -> Any: ...
+    async def delete_one(self, filter: Filter, **kwargs) -> Any: ...
+    async def delete_many(self, filter: Filter, **kwargs) -> Any: ...
+    async def bulk_write(self, requests: List[Any], **kwargs) -> Any: ...
+    async def find_one_and_delete(self, filter: Filter, **kwargs) -> Optional[Dict[str, Any]]: ...
+    async def find_one_and_update(self, filter: Filter, update: Dict[str, Any], **kwargs) -> Optional[Dict[str, Any]]: ...
+    async def create_index(self, keys: Any, **kwargs) -> str: ...
+    async def index_information(self, **kwargs) -> Dict[str, Dict[str, Any]]: ...
+
+class Database(Protocol):
+    def __getitem__(self, name: str) -> Collection: ...
+    def __getattr__(self, name: str) -> Collection: ...
+    def watch(self, pipeline: Optional[List[Dict[str, Any]]] = None, **kwargs) -> ChangeStream: ...
+    async def command(self, command: Any, **kwargs) -> Dict[str, Any]: ...
+    async def drop_collection(self, name: str, **kwargs) -> Any: ...
+
+class Client(Protocol):
+    def __getitem__(self, name: str) -> Database: ...
+    def __getattr__(self, name: str) -> Database: ...
+    def get_database(self, name: str, **kwargs) -> Database: ...
+    def close(self) -> None: ...
+
+def create_client(engine: Optional[str] = None, **mongo_options) -> Client:
+    """Client for the configured engine; mongo_options are passed to Motor"""
+    engine = engine or settings.database_engine
+    if engine == "memory":
+        from memory_engine import MemoryClient
+        return MemoryClient()
+    if engine == "mongo":
+        from motor.motor_asyncio import AsyncIOMotorClient
+        return AsyncIOMotorClient(settings.mongo_url, **mongo_options)
+    raise ValueError(f"Unknown DATABASE_ENGINE {engine!r} (expected one of {', '.join(ENGINES)})")
@@ -0,0 +1,222 @@
+"""
+Fast JSON and conditional GET responses for SISMOBI 3.2.0
+"""
+from typing import Any, Dict, Optional, Tuple
+from datetime import datetime
+from decimal import Decimal
+import hashlib
+import os
+import anyio
+import orjson
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+from fastapi import Request, Response
+from fastapi.responses import FileResponse, JSONResponse
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder
+from starlette.types import Message, Receive, Scope, Send
+
+def _default(obj: Any) -> Any:
+    """Fallback encoder for BSON types orjson does not know about"""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal128):
+        return float(obj.to_decimal())
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Type {type(obj).__name__} not serializable")
+
+def dumps(content: Any) -> bytes:
+    """Serialize API content with orjson (BSON types included)"""
+    return orjson.dumps(
+        content,
+        default=_default,
+        option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    )
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson
+
+    datetime, UUID, Enum and numpy values are encoded natively. Returning an
+    instance directly from an endpoint also skips FastAPI's jsonable_encoder and
+    response_model revalidation, so use it for documents that were already
+    validated when they were written.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+# Conditional GET helpers
+
+def conditional_headers(request: Request, validators: Dict[str, Any]) -> Dict[str, str]:
+    """Build the ETag header for a list response
+
+    The ETag covers the path and query string (filters, page) plus the match
+    count and latest updated_at from get_collection_validators, so any insert,
+    update or delete in the filtered set changes it. No Last-Modified is sent:
+    a delete does not move the latest updated_at, and HTTP dates only have
+    second precision, so If-Modified-Since would answer 304 for changed lists.
+    """
+    last_modified: Optional[datetime] = validators.get("last_modified")
+    fingerprint = "|".join([
+        request.url.path,
+        str(request.url.query),
+        str(validators.get("total_count")),
+        last_modified.isoformat() if last_modified else ""
+    ])
+    return {
+        "ETag": f'W/"{hashlib.blake2b(fingerprint.encode(), digest_size=16).hexdigest()}"',
+        "Cache-Control": "private, no-cache"
+    }
+
+def is_not_modified(request: Request, headers: Dict[str, str]) -> bool:
+    """Check If-None-Match against the ETag from conditional_headers"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    etag = headers["ETag"]
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison: W/"x" matches "x"
+    return "*" in candidates or any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in candidates)
+
+def not_modified_response(headers: Dict[str, str]) -> Response:
+    """Empty 304 response carrying the current validators"""
+    return Response(status_code=304, headers=headers)
+
+# Compression
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml", "image/svg+xml")
+
+class SelectiveGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware that leaves already-compressed media types alone
+
+    PDFs and images gain nothing from gzip, and compressing a 50 MB scan would
+    pull it through Python memory; those responses are passed through
+    untouched. So are byte-range capable responses (Accept-Ranges,
+    Content-Range or 206): their Content-Range counts identity bytes and their
+    strong ETag names the identity representation, whatever the media type.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and "gzip" in Headers(scope=scope).get("Accept-Encoding", ""):
+            responder = _SelectiveGZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel)
+            await responder(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+class _SelectiveGZipResponder(GZipResponder):
+    passthrough = False
+
+    async def send_with_gzip(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            self.passthrough = (
+                message["status"] == 206
+                or "content-range" in headers
+                or "accept-ranges" in headers
+                or not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+            )
+        if self.passthrough:
+            await self.send(message)
+            return
+        await super().send_with_gzip(message)
+
+# Blob downloads
+
+class RangeNotSatisfiable(Exception):
+    """Raised by parse_range when no requested byte falls inside the file"""
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range `Range: bytes=...` header into (start, end) inclusive
+
+    Returns None when the whole file should be sent: no header, another unit,
+    or several ranges (serving the full representation is allowed and avoids
+    multipart/byteranges). Raises RangeNotSatisfiable for ranges past the end.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[6:].strip().partition("-")
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable()
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+class BlobFileResponse(FileResponse):
+    """FileResponse for stored blobs with single-range support
+
+    By default the file is read in chunk_size pieces in a worker thread, so
+    neither the event loop nor memory scale with the file size, but every
+    byte still passes through Python. The ASGI zero-copy send extension
+    (os.sendfile) is used when the server offers it; uvicorn does not, so
+    under gunicorn_conf.py that path never runs.
+
+    For real zero-copy, pass `accel_redirect` (see DOCUMENT_ACCEL_REDIRECT_PREFIX):
+    the response then carries only headers plus an X-Accel-Redirect to the
+    blob, and the reverse proxy sends the file itself with sendfile and
+    answers the Range request. byte_range is ignored in that mode.
+    """
+    chunk_size = 256 * 1024
+
+    def __init__(
+        self,
+        path: str,
+        stat_result: os.stat_result,
+        byte_range: Optional[Tuple[int, int]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        accel_redirect: Optional[str] = None,
+        **kwargs: Any
+    ) -> None:
+        headers = dict(headers or {})
+        headers.setdefault("Accept-Ranges", "bytes")
+        self.accel_redirect = accel_redirect
+        if accel_redirect is not None:
+            # The proxy replaces the empty body with the file
+            self.offset, self.count = 0, 0
+            headers["X-Accel-Redirect"] = accel_redirect
+        elif byte_range is None:
+            self.offset, self.count = 0, stat_result.st_size
+        else:
+            self.offset, self.count = byte_range[0], byte_range[1] - byte_range[0] + 1
+            headers["Content-Range"] = f"bytes {byte_range[0]}-{byte_range[1]}/{stat_result.st_size}"
+            kwargs["status_code"] = 206
+        headers["Content-Length"] = str(self.count)
+        super().__init__(path, headers=headers, stat_result=stat_result, **kwargs)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.send_header_only or self.accel_redirect is not None:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file.fileno(),
+                    "offset": self.offset,
+                    "count": self.count,
+                    "more_body": False
+                })
+        else:
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                await file.seek(self.offset)
+                remaining = self.count
+                while remaining > 0:
+                    chunk = await file.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+                if remaining > 0:
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+        if self.background is not None:
+            await self.background()
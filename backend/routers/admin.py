@@ -0,0 +1,42 @@
+"""
+Admin routes for SISMOBI 3.2.0
+"""
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+import asyncio
+import structlog
+
+from auth import get_current_admin_user
+from responses import ORJSONResponse
+from profiling import profile_store
+
+logger = structlog.get_logger(__name__)
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(get_current_admin_user)]
+)
+
+@router.get("/profiles", response_model=dict)
+async def list_profiles(
+    route: Optional[str] = Query(None, description="Route template, e.g. /api/v1/properties/{property_id}"),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """Stored request profiles, most recent first"""
+    profiles = await asyncio.to_thread(profile_store.list, route, limit)
+    return ORJSONResponse({"items": profiles, "total": len(profiles)})
+
+@router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_profile(profile_id: str):
+    """Collapsed stacks of one profile (feed to flamegraph.pl or speedscope)"""
+    path = profile_store.path_for(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+
+    def read() -> str:
+        with open(path) as f:
+            return f.read()
+
+    return PlainTextResponse(await asyncio.to_thread(read))
@@ -1,14 +1,16 @@
 # Alerts API Router - SISMOBI Backend v3.2.0
 
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
 from typing import List, Optional
 from datetime import datetime
-from motor.motor_asyncio import AsyncIOMotorDatabase
 
+from repository import Database
 from database import get_database
 from models import Alert, AlertCreate, AlertUpdate
-from utils import convert_objectid_to_str
+from utils import convert_objectid_to_str, get_collection_validators, sync_contract_expiring_alerts
 from auth import get_current_user
+from responses import ORJSONResponse, conditional_headers, is_not_modified, not_modified_response
+from anomaly_detection import detect_consumption_anomalies
 
 router = APIRouter(
     prefix="/alerts",
@@ -18,6 +20,7 @@ router = APIRouter(
 
 @router.get("/", response_model=dict)
 async def get_alerts(
+    request: Request,
     skip: int = Query(0, ge=0, description="Number of alerts to skip"),
     limit: int = Query(100, ge=1, le=100, description="Maximum number of alerts to return"),
     property_id: Optional[str] = Query(None, description="Filter by property ID"),
@@ -25,7 +28,7 @@ async def get_alerts(
     type: Optional[str] = Query(None, description="Filter by alert type"),
     priority: Optional[str] = Query(None, description="Filter by priority (low/medium/high/critical)"),
     resolved: Optional[bool] = Query(None, description="Filter by resolved status"),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """
     Get all alerts with optional filtering and pagination
@@ -44,6 +47,12 @@ async def get_alerts(
         if resolved is not None:
             filter_query["resolved"] = resolved
 
+        # Answer conditional requests before fetching the page
+        validators = await get_collection_validators(db.alerts, filter_query)
+        headers = conditional_headers(request, validators)
+        if is_not_modified(request, headers):
+            return not_modified_response(headers)
+
         # Get alerts with filters, sort by priority and creation date
         priority_order = {"critical": 1, "high": 2, "medium": 3, "low": 4}
         cursor = db.alerts.find(filter_query).skip(skip).limit(limit)
@@ -62,16 +71,16 @@ async def get_alerts(
             -(x.get("created_at", datetime.now()).timestamp() if isinstance(x.get("created_at"), datetime) else 0)  # Newer first
         ))
 
-        # Get total count for pagination
-        total = await db.alerts.count_documents(filter_query)
+        # Total count for pagination (already computed with the validators)
+        total = validators["total_count"]
 
-        return {
+        return ORJSONResponse({
             "items": alerts,
             "total": total,
             "skip": skip,
             "limit": limit,
             "has_more": skip + limit < total
-        }
+        }, headers=headers)
 
     except Exception as e:
         raise HTTPException(
@@ -82,7 +91,7 @@ async def get_alerts(
 @router.post("/", response_model=dict, status_code=201)
 async def create_alert(
     alert: AlertCreate,
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """
     Create a new alert
@@ -136,10 +145,55 @@ async def create_alert(
             detail=f"Error creating alert: {str(e)}"
         )
 
+@router.post("/detect-anomalies", response_model=dict)
+async def detect_anomalies(
+    window: int = Query(12, ge=2, le=60, description="Number of previous months in the rolling baseline"),
+    min_history: int = Query(3, ge=1, le=60, description="Minimum months of history before a property is scored"),
+    z_threshold: float = Query(3.0, gt=0, description="Z-score above which consumption is flagged"),
+    lookback_months: int = Query(3, ge=0, description="Only alert on months within this many recent months (0 for the whole history)"),
+    db: Database = Depends(get_database)
+):
+    """
+    Detect abnormally high energy/water consumption and create
+    high_energy_bill / high_water_bill alerts (deduplicated)
+    """
+    try:
+        return await detect_consumption_anomalies(
+            db,
+            window=window,
+            min_history=min_history,
+            z_threshold=z_threshold,
+            lookback_months=lookback_months or None
+        )
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error detecting consumption anomalies: {str(e)}"
+        )
+
+@router.post("/contract-expiring", response_model=dict)
+async def generate_contract_expiring_alerts(
+    days: int = Query(30, ge=1, le=365, description="Alert on contracts ending within this many days"),
+    db: Database = Depends(get_database)
+):
+    """
+    Create contract_expiring alerts for active tenants whose contract ends
+    within the given number of days (safe to call repeatedly)
+    """
+    try:
+        return await sync_contract_expiring_alerts(db, days_ahead=days)
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error generating contract expiring alerts: {str(e)}"
+        )
+
 @router.get("/{alert_id}", response_model=dict)
 async def get_alert(
     alert_id: str,
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """
     Get a specific alert by ID
@@ -150,7 +204,7 @@ async def get_alert(
         if not alert:
             raise HTTPException(status_code=404, detail="Alert not found")
 
-        return convert_objectid_to_str(alert)
+        return ORJSONResponse(convert_objectid_to_str(alert))
 
     except HTTPException:
         raise
@@ -164,7 +218,7 @@ async def get_alert(
 async def update_alert(
     alert_id: str,
     alert_update: AlertUpdate,
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """
     Update a specific alert
@@ -205,6 +259,8 @@ async def update_alert(
         elif "resolved" in update_data and not update_data["resolved"]:
             update_data["resolved_at"] = None
 
+        update_data["updated_at"] = datetime.now()
+
         # Update alert
         result = await db.alerts.update_one(
             {"id": alert_id},
@@ -229,7 +285,7 @@ async def update_alert(
 @router.delete("/{alert_id}", status_code=204)
 async def delete_alert(
     alert_id: str,
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """
     Delete a specific alert
@@ -253,7 +309,7 @@ async def delete_alert(
 @router.put("/{alert_id}/resolve", response_model=dict)
 async def resolve_alert(
     alert_id: str,
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """
     Mark an alert as resolved (convenience endpoint)
@@ -267,7 +323,8 @@ async def resolve_alert(
         # Update alert to resolved
         update_data = {
             "resolved": True,
-            "resolved_at": datetime.now()
+            "resolved_at": datetime.now(),
+            "updated_at": datetime.now()
         }
 
         result = await db.alerts.update_one(
@@ -4,9 +4,9 @@ Authentication routes for SISMOBI 3.2.0
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from motor.motor_asyncio import AsyncIOMotorDatabase
 import structlog
 
+from repository import Database
 from database import get_database
 from models import Token, User, UserCreate, UserResponse, MessageResponse
 from auth import authenticate_user, create_access_token, create_user, get_current_active_user
@@ -18,7 +18,7 @@ router = APIRouter(prefix="/auth", tags=["authentication"])
 @router.post("/login", response_model=Token)
 async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Login endpoint to get access token"""
     user = await authenticate_user(db, form_data.username, form_data.password)
@@ -40,7 +40,7 @@ async def login(
 @router.post("/register", response_model=MessageResponse)
 async def register(
     user_data: UserCreate,
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Register new user"""
     await create_user(db, user_data.email, user_data.password, user_data.full_name)
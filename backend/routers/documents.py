@@ -2,21 +2,33 @@
 Documents management routes for SISMOBI 3.2.0
 """
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response, UploadFile, File
 import structlog
+import asyncio
+import re
 import uuid
 import os
 from datetime import datetime
 
+from repository import Database
 from database import get_database
 from models import Document, DocumentCreate, DocumentUpdate, MessageResponse, User
-from auth import get_current_active_user
-from utils import get_paginated_results, convert_objectid_to_str
+from auth import get_current_active_user, get_current_admin_user
+from utils import WITHOUT_SEARCH_KEYWORDS, get_paginated_results, convert_objectid_to_str, search_keywords
+from responses import ORJSONResponse, BlobFileResponse, RangeNotSatisfiable, is_not_modified, not_modified_response, parse_range
+from storage import TEXT_SUFFIX, THUMBNAIL_SUFFIX, blob_store, delete_document_record, get_last_sweep, release_blobs, sweep_exclusively
+from document_processing import blob_text_keywords, document_keywords, schedule_processing
+from config import settings
 
 logger = structlog.get_logger(__name__)
 router = APIRouter(prefix="/documents", tags=["documents"])
 
+def _accel_redirect(relative_path: str) -> Optional[str]:
+    """Internal proxy URI for a stored file, or None to serve it in-process"""
+    if not settings.document_accel_redirect_prefix:
+        return None
+    return f"{settings.document_accel_redirect_prefix.rstrip('/')}/{relative_path}"
+
 @router.get("/", response_model=dict)
 async def get_documents(
     page: int = Query(1, ge=1),
@@ -24,12 +36,24 @@ async def get_documents(
     property_id: Optional[str] = Query(None),
     tenant_id: Optional[str] = Query(None),
     doc_type: Optional[str] = Query(None),
+    q: Optional[str] = Query(None, max_length=100, description="Start of words in the name or extracted text"),
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
-    """Get all documents with pagination and filters"""
+    """Get all documents with pagination and filters
+
+    Each word of `q` must start a word of the document's name or of the
+    beginning of its extracted text (case and accent insensitive), matched
+    as an anchored prefix on the search_keywords index.
+    """
     try:
         filter_dict = {}
+        if q:
+            words = search_keywords(q)
+            filter_dict["$and"] = [{"search_keywords": {"$regex": f"^{re.escape(word)}"}} for word in words] or [
+                # No words in q (only punctuation): match nothing, as the report lookups do
+                {"search_keywords": {"$in": []}}
+            ]
         if property_id:
             filter_dict["property_id"] = property_id
         if tenant_id:
@@ -38,31 +62,71 @@ async def get_documents(
             filter_dict["type"] = doc_type
             
         result = await get_paginated_results(
-            db.documents, filter_dict, page, page_size, "created_at", -1
+            db.documents, filter_dict, page, page_size, "created_at", -1,
+            projection=WITHOUT_SEARCH_KEYWORDS
         )
         
+        # Previews: clients fetch the thumbnail and text instead of the whole file
+        for item in result["items"]:
+            item["thumbnail_url"] = (
+                f"{settings.api_prefix}/documents/{item['id']}/thumbnail" if item.get("has_thumbnail") else None
+            )
+            item["text_url"] = (
+                f"{settings.api_prefix}/documents/{item['id']}/text" if item.get("text_extracted") else None
+            )
+        
         logger.info("Documents retrieved", count=len(result["items"]), user=current_user.email)
-        return result
+        return ORJSONResponse(result)
         
     except Exception as e:
         logger.error("Error retrieving documents", error=str(e), user=current_user.email)
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@router.get("/storage/sweep", response_model=dict)
+async def get_last_blob_sweep(
+    current_user: User = Depends(get_current_admin_user),
+    db: Database = Depends(get_database)
+):
+    """Result of the last blob sweep on any worker (empty until the first run)"""
+    return ORJSONResponse(await get_last_sweep(db))
+
+@router.post("/storage/sweep", response_model=dict)
+async def run_blob_sweep(
+    grace_minutes: Optional[int] = Query(None, ge=0, description="Override BLOB_SWEEP_GRACE_MINUTES"),
+    current_user: User = Depends(get_current_admin_user),
+    db: Database = Depends(get_database)
+):
+    """Remove unreferenced blobs now and report the bytes reclaimed
+
+    Answers 409 while another sweep (scheduled or manual, on any worker) runs.
+    """
+    try:
+        stats = await sweep_exclusively(db, grace_minutes=grace_minutes)
+        if stats is None:
+            raise HTTPException(status_code=409, detail="A blob sweep is already running")
+        logger.info("Blob sweep triggered", user=current_user.email, **stats)
+        return ORJSONResponse(stats)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error sweeping blobs", error=str(e))
+        raise HTTPException(status_code=500, detail="Internal server error")
+
 @router.get("/{document_id}", response_model=Document)
 async def get_document(
     document_id: str,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Get specific document by ID"""
     try:
-        document_doc = await db.documents.find_one({"id": document_id})
+        document_doc = await db.documents.find_one({"id": document_id}, WITHOUT_SEARCH_KEYWORDS)
         if not document_doc:
             raise HTTPException(status_code=404, detail="Document not found")
         
         document_data = convert_objectid_to_str(document_doc)
         logger.info("Document retrieved", document_id=document_id, user=current_user.email)
-        return Document(**document_data)
+        return ORJSONResponse(document_data)
         
     except HTTPException:
         raise
@@ -70,11 +134,163 @@ async def get_document(
         logger.error("Error retrieving document", document_id=document_id, error=str(e))
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@router.api_route("/{document_id}/content", methods=["GET", "HEAD"])
+async def get_document_content(
+    document_id: str,
+    request: Request,
+    download: bool = Query(False, description="Send as attachment instead of inline"),
+    current_user: User = Depends(get_current_active_user),
+    db: Database = Depends(get_database)
+):
+    """Download the stored file
+
+    Supports single byte ranges (resuming and partial reads, If-Range) and
+    conditional requests via a strong ETag derived from the content hash.
+    HEAD answers with the same headers and no body. With
+    DOCUMENT_ACCEL_REDIRECT_PREFIX set the proxy sends the file and applies
+    the range; If-Range requests stay in-process, since the proxy would check
+    them against its own validator instead of the content hash.
+    """
+    try:
+        document_doc = await db.documents.find_one(
+            {"id": document_id}, {"_id": 0, "name": 1, "mime_type": 1, "sha256": 1}
+        )
+        if not document_doc:
+            raise HTTPException(status_code=404, detail="Document not found")
+        if not document_doc.get("sha256"):
+            raise HTTPException(status_code=404, detail="Document has no stored content")
+        
+        path = blob_store.path_for(document_doc["sha256"])
+        try:
+            stat_result = await asyncio.to_thread(os.stat, path)
+        except FileNotFoundError:
+            logger.error("Document blob missing", document_id=document_id, sha256=document_doc["sha256"])
+            raise HTTPException(status_code=404, detail="Document content not found")
+        
+        # Content is immutable per hash, so the ETag is strong
+        headers = {"ETag": f'"{document_doc["sha256"]}"', "Cache-Control": "private, no-cache"}
+        if is_not_modified(request, headers):
+            return not_modified_response(headers)
+        
+        range_header = request.headers.get("range")
+        if_range = request.headers.get("if-range")
+        accel_redirect = None
+        if if_range is None:
+            accel_redirect = _accel_redirect(blob_store.relative_path(document_doc["sha256"]))
+        elif if_range != headers["ETag"]:
+            range_header = None
+        byte_range = None
+        if accel_redirect is None:
+            try:
+                byte_range = parse_range(range_header, stat_result.st_size)
+            except RangeNotSatisfiable:
+                return Response(status_code=416, headers={"Content-Range": f"bytes */{stat_result.st_size}"})
+        
+        return BlobFileResponse(
+            path,
+            stat_result,
+            byte_range=byte_range,
+            headers=headers,
+            accel_redirect=accel_redirect,
+            media_type=document_doc.get("mime_type") or "application/octet-stream",
+            filename=document_doc.get("name"),
+            method=request.method,
+            content_disposition_type="attachment" if download else "inline"
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error serving document content", document_id=document_id, error=str(e))
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.api_route("/{document_id}/thumbnail", methods=["GET", "HEAD"])
+async def get_document_thumbnail(
+    document_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: Database = Depends(get_database)
+):
+    """First-page thumbnail (PNG) generated by the processing pipeline"""
+    try:
+        document_doc = await db.documents.find_one(
+            {"id": document_id}, {"_id": 0, "sha256": 1, "has_thumbnail": 1}
+        )
+        if not document_doc:
+            raise HTTPException(status_code=404, detail="Document not found")
+        if not document_doc.get("has_thumbnail"):
+            raise HTTPException(status_code=404, detail="Thumbnail not available")
+        
+        path = blob_store.path_for(document_doc["sha256"]) + THUMBNAIL_SUFFIX
+        try:
+            stat_result = await asyncio.to_thread(os.stat, path)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Thumbnail not available")
+        
+        headers = {"ETag": f'"{document_doc["sha256"]}-thumb"', "Cache-Control": "private, max-age=86400"}
+        if is_not_modified(request, headers):
+            return not_modified_response(headers)
+        return BlobFileResponse(
+            path,
+            stat_result,
+            headers=headers,
+            accel_redirect=_accel_redirect(blob_store.relative_path(document_doc["sha256"]) + THUMBNAIL_SUFFIX),
+            media_type="image/png",
+            method=request.method
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error serving document thumbnail", document_id=document_id, error=str(e))
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.api_route("/{document_id}/text", methods=["GET", "HEAD"])
+async def get_document_text(
+    document_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: Database = Depends(get_database)
+):
+    """Plain text extracted by the processing pipeline (UTF-8, capped at DOCUMENT_TEXT_MAX_CHARS)"""
+    try:
+        document_doc = await db.documents.find_one(
+            {"id": document_id}, {"_id": 0, "sha256": 1, "text_extracted": 1}
+        )
+        if not document_doc:
+            raise HTTPException(status_code=404, detail="Document not found")
+        if not document_doc.get("text_extracted"):
+            raise HTTPException(status_code=404, detail="Text not available")
+        
+        path = blob_store.path_for(document_doc["sha256"]) + TEXT_SUFFIX
+        try:
+            stat_result = await asyncio.to_thread(os.stat, path)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Text not available")
+        
+        headers = {"ETag": f'"{document_doc["sha256"]}-text"', "Cache-Control": "private, max-age=86400"}
+        if is_not_modified(request, headers):
+            return not_modified_response(headers)
+        return BlobFileResponse(
+            path,
+            stat_result,
+            headers=headers,
+            accel_redirect=_accel_redirect(blob_store.relative_path(document_doc["sha256"]) + TEXT_SUFFIX),
+            media_type="text/plain",
+            method=request.method
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error serving document text", document_id=document_id, error=str(e))
+        raise HTTPException(status_code=500, detail="Internal server error")
+
 @router.post("/", response_model=Document)
 async def create_document(
     document_data: DocumentCreate,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Create new document"""
     try:
@@ -82,6 +298,7 @@ async def create_document(
         document_dict = document_data.dict()
         document_dict.update({
             "id": str(uuid.uuid4()),
+            "search_keywords": document_keywords(document_dict.get("name"), []),
             "created_at": datetime.now(),
             "updated_at": datetime.now()
         })
@@ -116,7 +333,7 @@ async def update_document(
     document_id: str,
     document_updates: DocumentUpdate,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Update existing document"""
     try:
@@ -129,6 +346,10 @@ async def update_document(
         update_data = {k: v for k, v in document_updates.dict().items() if v is not None}
         if update_data:
             update_data["updated_at"] = datetime.now()
+            if "name" in update_data:
+                update_data["search_keywords"] = document_keywords(
+                    update_data["name"], await blob_text_keywords(db, existing_document.get("sha256"))
+                )
             
             await db.documents.update_one(
                 {"id": document_id},
@@ -151,23 +372,15 @@ async def update_document(
 async def delete_document(
     document_id: str,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Delete document"""
     try:
-        # Check if document exists
-        existing_document = await db.documents.find_one({"id": document_id})
-        if not existing_document:
+        # Delete document from database; the blob is removed by the sweeper
+        # once no other document references it
+        if not await delete_document_record(db, {"id": document_id}):
             raise HTTPException(status_code=404, detail="Document not found")
         
-        # Delete document from database
-        await db.documents.delete_one({"id": document_id})
-        
-        # TODO: Delete actual file from storage
-        # file_path = existing_document.get("file_path")
-        # if file_path and os.path.exists(file_path):
-        #     os.remove(file_path)
-        
         logger.info("Document deleted", document_id=document_id, user=current_user.email)
         return {"message": "Document deleted successfully", "status": "success"}
         
@@ -185,13 +398,37 @@ async def upload_document(
     doc_type: str = "other",
     description: Optional[str] = None,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
-    """Upload document file (simulated - returns metadata only)"""
+    """Upload document file
+
+    The file is streamed to the content-addressed blob store in chunks while
+    its SHA-256 is computed; identical content is stored only once.
+    """
     try:
         # Validate file
         if not file.filename:
             raise HTTPException(status_code=400, detail="No file provided")
+        
+        # Verify references exist before writing anything to disk
+        if property_id:
+            property_doc = await db.properties.find_one({"id": property_id})
+            if not property_doc:
+                raise HTTPException(status_code=400, detail="Property not found")
+                
+        if tenant_id:
+            tenant_doc = await db.tenants.find_one({"id": tenant_id})
+            if not tenant_doc:
+                raise HTTPException(status_code=400, detail="Tenant not found")
+        
+        try:
+            sha256, file_size, deduplicated = await blob_store.save_upload(
+                file, max_bytes=settings.document_max_upload_mb * 1024 * 1024, db=db
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        if file_size == 0:
+            raise HTTPException(status_code=400, detail="Empty file")
             
         # Create document metadata
         document_dict = {
@@ -200,42 +437,41 @@ async def upload_document(
             "tenant_id": tenant_id,
             "name": file.filename,
             "type": doc_type,
-            "file_path": f"/documents/{file.filename}",  # Simulated path
-            "file_size": 0,  # Would be actual file size
+            "file_path": blob_store.relative_path(sha256),
+            "file_size": file_size,
+            "sha256": sha256,
             "mime_type": file.content_type or "application/octet-stream",
             "description": description,
+            "search_keywords": document_keywords(file.filename, []),
             "created_at": datetime.now(),
             "updated_at": datetime.now()
         }
         
-        # Verify references exist
-        if property_id:
-            property_doc = await db.properties.find_one({"id": property_id})
-            if not property_doc:
-                raise HTTPException(status_code=400, detail="Property not found")
-                
-        if tenant_id:
-            tenant_doc = await db.tenants.find_one({"id": tenant_id})
-            if not tenant_doc:
-                raise HTTPException(status_code=400, detail="Tenant not found")
-        
-        # TODO: Actually save file to storage
-        # file_content = await file.read()
-        # file_path = f"./uploads/{document_dict['id']}_{file.filename}"
-        # with open(file_path, "wb") as f:
-        #     f.write(file_content)
-        # document_dict["file_size"] = len(file_content)
-        
         # Save metadata to database
-        result = await db.documents.insert_one(document_dict)
+        try:
+            result = await db.documents.insert_one(document_dict)
+        except Exception:
+            await release_blobs(db, [sha256])
+            raise
+        
+        # Thumbnail/text extraction runs on the worker pool; content seen
+        # before already has its derived files
+        derived = await schedule_processing(db, sha256)
+        text_keywords = derived.pop("text_keywords")
+        if any(derived.values()):
+            derived["search_keywords"] = document_keywords(file.filename, text_keywords)
+            await db.documents.update_one({"_id": result.inserted_id}, {"$set": derived})
         created_document = await db.documents.find_one({"_id": result.inserted_id})
         
         document_response = convert_objectid_to_str(created_document)
-        logger.info("Document uploaded", document_id=document_response["id"], filename=file.filename, user=current_user.email)
+        logger.info(
+            "Document uploaded", document_id=document_response["id"], filename=file.filename,
+            size=file_size, deduplicated=deduplicated, user=current_user.email
+        )
         return Document(**document_response)
         
     except HTTPException:
         raise
     except Exception as e:
         logger.error("Error uploading document", filename=file.filename if file else "unknown", error=str(e))
-        raise HTTPException(status_code=500, detail="Internal server error")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Internal server error")
@@ -2,22 +2,24 @@
 Energy Bills management routes for SISMOBI 3.2.0
 """
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
 import structlog
 import uuid
 from datetime import datetime
 
+from repository import Database
 from database import get_database
 from models import EnergyBill, EnergyBillCreate, EnergyBillUpdate, MessageResponse, User
 from auth import get_current_active_user
-from utils import get_paginated_results, convert_objectid_to_str
+from utils import get_paginated_results, get_collection_validators, convert_objectid_to_str, get_bill_group_summary
+from responses import ORJSONResponse, conditional_headers, is_not_modified, not_modified_response
 
 logger = structlog.get_logger(__name__)
 router = APIRouter(prefix="/energy-bills", tags=["energy-bills"])
 
 @router.get("/", response_model=dict)
 async def get_energy_bills(
+    request: Request,
     page: int = Query(1, ge=1),
     page_size: int = Query(50, ge=1, le=100),
     property_id: Optional[str] = Query(None),
@@ -25,7 +27,7 @@ async def get_energy_bills(
     year: Optional[int] = Query(None, ge=2000, le=3000),
     month: Optional[int] = Query(None, ge=1, le=12),
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Get all energy bills with pagination and filters"""
     try:
@@ -39,12 +41,18 @@ async def get_energy_bills(
         if month:
             filter_dict["month"] = month
             
+        validators = await get_collection_validators(db.energy_bills, filter_dict)
+        headers = conditional_headers(request, validators)
+        if is_not_modified(request, headers):
+            return not_modified_response(headers)
+        
         result = await get_paginated_results(
-            db.energy_bills, filter_dict, page, page_size, "reading_date", -1
+            db.energy_bills, filter_dict, page, page_size, "reading_date", -1,
+            total_count=validators["total_count"]
         )
         
         logger.info("Energy bills retrieved", count=len(result["items"]), user=current_user.email)
-        return result
+        return ORJSONResponse(result, headers=headers)
         
     except Exception as e:
         logger.error("Error retrieving energy bills", error=str(e), user=current_user.email)
@@ -54,7 +62,7 @@ async def get_energy_bills(
 async def get_energy_bill(
     bill_id: str,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Get specific energy bill by ID"""
     try:
@@ -64,7 +72,7 @@ async def get_energy_bill(
         
         bill_data = convert_objectid_to_str(bill_doc)
         logger.info("Energy bill retrieved", bill_id=bill_id, user=current_user.email)
-        return EnergyBill(**bill_data)
+        return ORJSONResponse(bill_data)
         
     except HTTPException:
         raise
@@ -76,7 +84,7 @@ async def get_energy_bill(
 async def create_energy_bill(
     bill_data: EnergyBillCreate,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Create new energy bill"""
     try:
@@ -111,7 +119,7 @@ async def update_energy_bill(
     bill_id: str,
     bill_updates: EnergyBillUpdate,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Update existing energy bill"""
     try:
@@ -146,7 +154,7 @@ async def update_energy_bill(
 async def delete_energy_bill(
     bill_id: str,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Delete energy bill"""
     try:
@@ -171,46 +179,42 @@ async def delete_energy_bill(
 async def get_group_summary(
     group_id: str,
     year: Optional[int] = Query(None, ge=2000, le=3000),
+    include_bills: bool = Query(False),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=100),
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
-    """Get summary for energy bill group"""
+    """Get aggregated summary for energy bill group
+
+    Totals, averages and the per-month series are computed by MongoDB.
+    The bills themselves are only listed (paginated) when include_bills is set.
+    """
     try:
-        filter_dict = {"group_id": group_id}
-        if year:
-            filter_dict["year"] = year
-            
-        cursor = db.energy_bills.find(filter_dict)
-        bills = []
-        async for bill in cursor:
-            bills.append(convert_objectid_to_str(bill))
-        
-        if not bills:
-            return {
-                "group_id": group_id,
-                "total_bills": 0,
-                "total_amount": 0,
-                "total_kwh": 0,
-                "average_amount": 0,
-                "average_kwh": 0,
-                "bills": []
-            }
-        
-        total_amount = sum(bill["total_amount"] for bill in bills)
-        total_kwh = sum(bill["total_kwh"] for bill in bills)
+        aggregated = await get_bill_group_summary(
+            db.energy_bills, group_id, "total_kwh", year
+        )
         
         summary = {
             "group_id": group_id,
-            "total_bills": len(bills),
-            "total_amount": total_amount,
-            "total_kwh": total_kwh,
-            "average_amount": total_amount / len(bills),
-            "average_kwh": total_kwh / len(bills),
-            "bills": bills
+            "total_bills": aggregated["total_bills"],
+            "total_amount": aggregated["total_amount"],
+            "total_kwh": aggregated["total_quantity"],
+            "average_amount": aggregated["average_amount"],
+            "average_kwh": aggregated["average_quantity"],
+            "monthly": aggregated["monthly"]
         }
         
+        if include_bills:
+            filter_dict = {"group_id": group_id}
+            if year:
+                filter_dict["year"] = year
+            summary["bills"] = await get_paginated_results(
+                db.energy_bills, filter_dict, page, page_size, "reading_date", -1
+            )
+        
         logger.info("Energy bill group summary retrieved", group_id=group_id, user=current_user.email)
-        return summary
+        return ORJSONResponse(summary)
         
     except Exception as e:
         logger.error("Error retrieving group summary", group_id=group_id, error=str(e))
@@ -2,20 +2,27 @@
 Property management routes for SISMOBI 3.2.0
 """
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
 import structlog
 
+from repository import Database
 from database import get_database
 from models import Property, PropertyCreate, PropertyUpdate, MessageResponse, User
 from auth import get_current_active_user
-from utils import get_paginated_results, convert_objectid_to_str, create_property_filter
+from utils import (
+    WITHOUT_SEARCH_KEYWORDS, get_paginated_results, get_collection_validators, convert_objectid_to_str,
+    create_property_filter, search_keywords_update
+)
+from cache import invalidate_collections
+from storage import delete_documents
+from responses import ORJSONResponse, conditional_headers, is_not_modified, not_modified_response
 
 logger = structlog.get_logger(__name__)
 router = APIRouter(prefix="/properties", tags=["properties"])
 
 @router.get("/", response_model=dict)
 async def get_properties(
+    request: Request,
     page: int = Query(1, ge=1),
     page_size: int = Query(50, ge=1, le=100),
     status: Optional[str] = Query(None),
@@ -23,17 +30,23 @@ async def get_properties(
     max_rent: Optional[float] = Query(None, ge=0),
     property_type: Optional[str] = Query(None),
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Get all properties with pagination and filters"""
     try:
         filter_dict = create_property_filter(status, min_rent, max_rent, property_type)
+        validators = await get_collection_validators(db.properties, filter_dict)
+        headers = conditional_headers(request, validators)
+        if is_not_modified(request, headers):
+            return not_modified_response(headers)
+        
         result = await get_paginated_results(
-            db.properties, filter_dict, page, page_size, "created_at", -1
+            db.properties, filter_dict, page, page_size, "created_at", -1,
+            total_count=validators["total_count"], projection=WITHOUT_SEARCH_KEYWORDS
         )
         
         logger.info("Properties retrieved", count=len(result["items"]), user=current_user.email)
-        return result
+        return ORJSONResponse(result, headers=headers)
         
     except Exception as e:
         logger.error("Error retrieving properties", error=str(e), user=current_user.email)
@@ -43,17 +56,17 @@ async def get_properties(
 async def get_property(
     property_id: str,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Get specific property by ID"""
     try:
-        property_doc = await db.properties.find_one({"id": property_id})
+        property_doc = await db.properties.find_one({"id": property_id}, WITHOUT_SEARCH_KEYWORDS)
         if not property_doc:
             raise HTTPException(status_code=404, detail="Property not found")
         
         property_data = convert_objectid_to_str(property_doc)
         logger.info("Property retrieved", property_id=property_id, user=current_user.email)
-        return Property(**property_data)
+        return ORJSONResponse(property_data)
         
     except HTTPException:
         raise
@@ -65,7 +78,7 @@ async def get_property(
 async def create_property(
     property_data: PropertyCreate,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Create new property"""
     try:
@@ -80,8 +93,10 @@ async def create_property(
             "updated_at": datetime.now(),
             "tenant_id": None
         })
+        property_dict.update(search_keywords_update("properties", property_dict))
         
         result = await db.properties.insert_one(property_dict)
+        invalidate_collections("properties")
         created_property = await db.properties.find_one({"_id": result.inserted_id})
         
         property_response = convert_objectid_to_str(created_property)
@@ -97,7 +112,7 @@ async def update_property(
     property_id: str,
     property_updates: PropertyUpdate,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Update existing property"""
     try:
@@ -111,11 +126,13 @@ async def update_property(
         if update_data:
             from datetime import datetime
             update_data["updated_at"] = datetime.now()
+            update_data.update(search_keywords_update("properties", {**existing_property, **update_data}))
             
             await db.properties.update_one(
                 {"id": property_id},
                 {"$set": update_data}
             )
+            invalidate_collections("properties")
         
         updated_property = await db.properties.find_one({"id": property_id})
         property_response = convert_objectid_to_str(updated_property)
@@ -133,7 +150,7 @@ async def update_property(
 async def delete_property(
     property_id: str,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Delete property and related data"""
     try:
@@ -145,12 +162,13 @@ async def delete_property(
         # Delete related data
         await db.transactions.delete_many({"property_id": property_id})
         await db.alerts.delete_many({"property_id": property_id})
-        await db.documents.delete_many({"property_id": property_id})
+        await delete_documents(db, {"property_id": property_id})
         await db.energy_bills.delete_many({"property_id": property_id})
         await db.water_bills.delete_many({"property_id": property_id})
         
         # Delete property
         await db.properties.delete_one({"id": property_id})
+        invalidate_collections("properties")
         
         logger.info("Property deleted", property_id=property_id, user=current_user.email)
         return {"message": "Property deleted successfully", "status": "success"}
@@ -4,27 +4,52 @@ Autor: E1 Agent
 Data: 2025-01-07
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
+from fastapi.responses import FileResponse, StreamingResponse
 from datetime import datetime, timedelta
 from typing import Optional, List
 import io
+import os
+import re
+import tempfile
+import time
 
 from auth import get_current_user
+from config import settings
 from models import User
 from reports import PDFReportGenerator
+from cache import cached
+from utils import search_keywords
+from report_history import record_report_generation, get_reports_history, get_latency_summary
 
 router = APIRouter(prefix="/reports", tags=["reports"])
 
 # Instância do gerador de relatórios
 report_generator = PDFReportGenerator()
 
+async def _render_to_tempfile(generate, background_tasks: BackgroundTasks, **kwargs) -> str:
+    """Executa um gerador em modo streaming num arquivo temporário
+
+    O arquivo é removido por background task depois que a resposta é enviada.
+    """
+    fd, path = tempfile.mkstemp(prefix="sismobi_report_", suffix=".pdf")
+    os.close(fd)
+    try:
+        await generate(path, **kwargs)
+    except Exception:
+        os.unlink(path)
+        raise
+    background_tasks.add_task(os.unlink, path)
+    return path
+
 @router.get("/financial", response_class=StreamingResponse)
 async def generate_financial_report(
+    background_tasks: BackgroundTasks,
     start_date: Optional[str] = Query(None, description="Data início (YYYY-MM-DD)"),
     end_date: Optional[str] = Query(None, description="Data fim (YYYY-MM-DD)"),
     property_id: Optional[str] = Query(None, description="Filtrar por propriedade"),
     tenant_id: Optional[str] = Query(None, description="Filtrar por inquilino"),
+    stream: bool = Query(False, description="Incluir todos os lançamentos, gerando o PDF em lotes"),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -35,6 +60,8 @@ async def generate_financial_report(
     - **end_date**: Data de fim (formato YYYY-MM-DD)  
     - **property_id**: UUID da propriedade específica
     - **tenant_id**: UUID do inquilino específico
+    - **stream**: Lista todos os lançamentos; o PDF é gerado lote a lote
+      em arquivo temporário, com memória limitada qualquer que seja o volume
     
     **Retorna:** PDF com resumo financeiro, transações por categoria e análises
     """
@@ -43,17 +70,40 @@ async def generate_financial_report(
         start_dt = datetime.fromisoformat(start_date) if start_date else None
         end_dt = datetime.fromisoformat(end_date) if end_date else None
         
+        # Criar filename com timestamp
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"relatorio_financeiro_{timestamp}.pdf"
+        filters = {"start_date": start_date, "end_date": end_date, "property_id": property_id, "tenant_id": tenant_id}
+        
         # Gerar relatório PDF
+        metrics = {}
+        started = time.perf_counter()
+        if stream:
+            path = await _render_to_tempfile(
+                report_generator.generate_financial_report_stream, background_tasks,
+                start_date=start_dt,
+                end_date=end_dt,
+                property_id=property_id,
+                tenant_id=tenant_id,
+                metrics=metrics
+            )
+            background_tasks.add_task(
+                record_report_generation, "financial", {**filters, "stream": True},
+                current_user.email, metrics, time.perf_counter() - started
+            )
+            return FileResponse(path, media_type="application/pdf", filename=filename)
+        
         pdf_bytes = await report_generator.generate_financial_report(
             start_date=start_dt,
             end_date=end_dt,
             property_id=property_id,
-            tenant_id=tenant_id
+            tenant_id=tenant_id,
+            metrics=metrics
+        )
+        background_tasks.add_task(
+            record_report_generation, "financial", filters,
+            current_user.email, metrics, time.perf_counter() - started
         )
-        
-        # Criar filename com timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"relatorio_financeiro_{timestamp}.pdf"
         
         # Retornar como stream
         return StreamingResponse(
@@ -70,6 +120,7 @@ async def generate_financial_report(
 
 @router.get("/properties", response_class=StreamingResponse)
 async def generate_properties_report(
+    background_tasks: BackgroundTasks,
     status: Optional[str] = Query(None, description="Filtrar por status (available, occupied, maintenance, unavailable)"),
     property_type: Optional[str] = Query(None, description="Filtrar por tipo de propriedade"),
     current_user: User = Depends(get_current_user)
@@ -85,9 +136,16 @@ async def generate_properties_report(
     """
     try:
         # Gerar relatório PDF
+        metrics = {}
+        started = time.perf_counter()
         pdf_bytes = await report_generator.generate_properties_report(
             status_filter=status,
-            property_type=property_type
+            property_type=property_type,
+            metrics=metrics
+        )
+        background_tasks.add_task(
+            record_report_generation, "properties", {"status": status, "property_type": property_type},
+            current_user.email, metrics, time.perf_counter() - started
         )
         
         # Criar filename com timestamp
@@ -107,8 +165,10 @@ async def generate_properties_report(
 
 @router.get("/tenants", response_class=StreamingResponse)
 async def generate_tenants_report(
+    background_tasks: BackgroundTasks,
     property_id: Optional[str] = Query(None, description="Filtrar por propriedade"),
     status: Optional[str] = Query(None, description="Filtrar por status (active, inactive)"),
+    stream: bool = Query(False, description="Incluir todos os inquilinos, gerando o PDF em lotes"),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -117,14 +177,37 @@ async def generate_tenants_report(
     **Filtros disponíveis:**
     - **property_id**: UUID da propriedade específica
     - **status**: Status do inquilino (active, inactive)
+    - **stream**: Lista todos os inquilinos; o PDF é gerado lote a lote
+      em arquivo temporário
     
     **Retorna:** PDF com resumo de inquilinos, lista detalhada com informações de contato
     """
     try:
         # Gerar relatório PDF
+        metrics = {}
+        started = time.perf_counter()
+        if stream:
+            path = await _render_to_tempfile(
+                report_generator.generate_tenants_report_stream, background_tasks,
+                property_id=property_id,
+                status_filter=status,
+                metrics=metrics
+            )
+            background_tasks.add_task(
+                record_report_generation, "tenants", {"property_id": property_id, "status": status, "stream": True},
+                current_user.email, metrics, time.perf_counter() - started
+            )
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            return FileResponse(path, media_type="application/pdf", filename=f"relatorio_inquilinos_{timestamp}.pdf")
+        
         pdf_bytes = await report_generator.generate_tenants_report(
             property_id=property_id,
-            status_filter=status
+            status_filter=status,
+            metrics=metrics
+        )
+        background_tasks.add_task(
+            record_report_generation, "tenants", {"property_id": property_id, "status": status},
+            current_user.email, metrics, time.perf_counter() - started
         )
         
         # Criar filename com timestamp
@@ -144,6 +227,7 @@ async def generate_tenants_report(
 
 @router.get("/comprehensive", response_class=StreamingResponse)
 async def generate_comprehensive_report(
+    background_tasks: BackgroundTasks,
     start_date: Optional[str] = Query(None, description="Data início para análise financeira (YYYY-MM-DD)"),
     end_date: Optional[str] = Query(None, description="Data fim para análise financeira (YYYY-MM-DD)"),
     current_user: User = Depends(get_current_user)
@@ -170,9 +254,16 @@ async def generate_comprehensive_report(
         end_dt = datetime.fromisoformat(end_date) if end_date else None
         
         # Gerar relatório PDF
+        metrics = {}
+        started = time.perf_counter()
         pdf_bytes = await report_generator.generate_comprehensive_report(
             start_date=start_dt,
-            end_date=end_dt
+            end_date=end_dt,
+            metrics=metrics
+        )
+        background_tasks.add_task(
+            record_report_generation, "comprehensive", {"start_date": start_date, "end_date": end_date},
+            current_user.email, metrics, time.perf_counter() - started
         )
         
         # Criar filename com timestamp
@@ -194,6 +285,7 @@ async def generate_comprehensive_report(
 
 @router.get("/quick-financial", response_class=StreamingResponse)
 async def generate_quick_financial_report(
+    background_tasks: BackgroundTasks,
     period: str = Query("current_month", description="Período pré-definido (current_month, last_month, current_year, last_30_days)"),
     current_user: User = Depends(get_current_user)
 ):
@@ -235,9 +327,16 @@ async def generate_quick_financial_report(
             raise HTTPException(status_code=400, detail="Período inválido")
         
         # Gerar relatório PDF
+        metrics = {}
+        started = time.perf_counter()
         pdf_bytes = await report_generator.generate_financial_report(
             start_date=start_dt,
-            end_date=end_dt
+            end_date=end_dt,
+            metrics=metrics
+        )
+        background_tasks.add_task(
+            record_report_generation, "quick_financial", {"period": period},
+            current_user.email, metrics, time.perf_counter() - started
         )
         
         # Criar filename com timestamp e período
@@ -257,6 +356,105 @@ async def generate_quick_financial_report(
         raise HTTPException(status_code=500, detail=f"Erro ao gerar relatório: {str(e)}")
 
 
+QUICK_PERIODS = [
+    {"key": "current_month", "label": "Mês Atual"},
+    {"key": "last_month", "label": "Mês Anterior"},
+    {"key": "current_year", "label": "Ano Atual"},
+    {"key": "last_30_days", "label": "Últimos 30 Dias"},
+    {"key": "last_90_days", "label": "Últimos 90 Dias"}
+]
+
+
+async def _lookup(
+    collection_name: str,
+    sort_field: str,
+    projection: List[str],
+    q: Optional[str],
+    status: Optional[str],
+    skip: int,
+    limit: int
+) -> dict:
+    """Busca paginada (typeahead) com projeção mínima, em cache até a próxima escrita
+
+    Cada palavra de `q` precisa iniciar alguma palavra dos campos de busca
+    (sem diferenciar maiúsculas nem acentos). A busca é um prefixo ancorado
+    no índice de search_keywords (ver utils.SEARCH_FIELDS), sem varrer a coleção.
+    """
+    from database import get_collection
+
+    async def load():
+        query = {}
+        if q:
+            words = search_keywords(q)
+            if not words:
+                return {"items": [], "skip": skip, "limit": limit, "has_more": False}
+            query["$and"] = [{"search_keywords": {"$regex": f"^{re.escape(word)}"}} for word in words]
+        if status:
+            query["status"] = status
+
+        cursor = (
+            get_collection(collection_name)
+            .find(query, {"_id": 0, **{field: 1 for field in projection}})
+            .sort(sort_field, 1)
+            .skip(skip)
+            .limit(limit + 1)
+        )
+        items = await cursor.to_list(limit + 1)
+        return {
+            "items": items[:limit],
+            "skip": skip,
+            "limit": limit,
+            "has_more": len(items) > limit
+        }
+
+    key = ("lookup", collection_name, q or "", status or "", skip, limit)
+    return await cached(key, [collection_name], load)
+
+
+@router.get("/lookup/properties")
+async def lookup_properties(
+    q: Optional[str] = Query(None, max_length=100, description="Início das palavras do nome ou endereço"),
+    status: Optional[str] = Query(None, description="Filtrar por status"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Busca propriedades para os filtros de relatório (typeahead)
+    
+    **Retorna:** Página de propriedades com id, nome, endereço, tipo e status
+    """
+    try:
+        return await _lookup(
+            "properties", "name", ["id", "name", "address", "type", "status"],
+            q, status, skip, limit
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar propriedades: {str(e)}")
+
+
+@router.get("/lookup/tenants")
+async def lookup_tenants(
+    q: Optional[str] = Query(None, max_length=100, description="Início das palavras do nome ou email"),
+    status: Optional[str] = Query(None, description="Filtrar por status"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Busca inquilinos para os filtros de relatório (typeahead)
+    
+    **Retorna:** Página de inquilinos com id, nome, email e status
+    """
+    try:
+        return await _lookup(
+            "tenants", "name", ["id", "name", "email", "status"],
+            q, status, skip, limit
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar inquilinos: {str(e)}")
+
+
 @router.get("/available-filters")
 async def get_available_filters(
     current_user: User = Depends(get_current_user)
@@ -265,75 +463,76 @@ async def get_available_filters(
     Retorna os filtros disponíveis para os relatórios
     
     **Retorna:**
-    - Propriedades disponíveis (para filtros por propriedade)
-    - Inquilinos disponíveis (para filtros por inquilino)
-    - Status disponíveis
+    - Status disponíveis (propriedades e inquilinos)
     - Tipos de propriedade disponíveis
+    - Períodos pré-definidos
+    
+    Propriedades e inquilinos são buscados sob demanda em
+    `/reports/lookup/properties` e `/reports/lookup/tenants`.
     """
     try:
         from database import get_collection
-        from utils import convert_objectid_to_str
-        
-        # Buscar propriedades para filtros
-        properties_collection = get_collection("properties")
-        properties_cursor = properties_collection.find({}, {"id": 1, "address": 1, "type": 1, "status": 1})
-        properties = [convert_objectid_to_str(doc) async for doc in properties_cursor]
-        
-        # Buscar inquilinos para filtros
-        tenants_collection = get_collection("tenants")
-        tenants_cursor = tenants_collection.find({}, {"id": 1, "name": 1, "email": 1, "status": 1})
-        tenants = [convert_objectid_to_str(doc) async for doc in tenants_cursor]
-        
-        # Status disponíveis
-        property_status = ["available", "occupied", "maintenance", "unavailable"]
-        tenant_status = ["active", "inactive"]
-        
-        # Tipos de propriedade únicos
-        property_types = list(set([p.get("type", "") for p in properties if p.get("type")]))
-        
-        return {
-            "properties": [
-                {"id": p["id"], "address": p.get("address", ""), "type": p.get("type", ""), "status": p.get("status", "")}
-                for p in properties
-            ],
-            "tenants": [
-                {"id": t["id"], "name": t.get("name", ""), "email": t.get("email", ""), "status": t.get("status", "")}
-                for t in tenants
-            ],
-            "property_status": property_status,
-            "tenant_status": tenant_status,
-            "property_types": property_types,
-            "quick_periods": [
-                {"key": "current_month", "label": "Mês Atual"},
-                {"key": "last_month", "label": "Mês Anterior"},
-                {"key": "current_year", "label": "Ano Atual"},
-                {"key": "last_30_days", "label": "Últimos 30 Dias"},
-                {"key": "last_90_days", "label": "Últimos 90 Dias"}
-            ]
-        }
+
+        async def load():
+            properties = get_collection("properties")
+            tenants = get_collection("tenants")
+            return {
+                "property_status": sorted(await properties.distinct("status")),
+                "tenant_status": sorted(await tenants.distinct("status")),
+                "property_types": sorted(t for t in await properties.distinct("type") if t),
+                "quick_periods": QUICK_PERIODS
+            }
+
+        return await cached(("available-filters",), ["properties", "tenants"], load)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao buscar filtros disponíveis: {str(e)}")
 
 
+async def preload_caches():
+    """Preenche o cache de filtros e a primeira página dos lookups (warmup do startup)"""
+    await get_available_filters(current_user=None)
+    await lookup_properties(q=None, status=None, skip=0, limit=20, current_user=None)
+    await lookup_tenants(q=None, status=None, skip=0, limit=20, current_user=None)
+
+
 @router.get("/history")
-async def get_reports_history(
-    limit: int = Query(20, description="Número máximo de registros"),
+async def get_reports_history_endpoint(
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100, description="Número de registros por página"),
+    report_type: Optional[str] = Query(None, description="Filtrar por tipo (financial, properties, tenants, comprehensive, quick_financial)"),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Retorna histórico de relatórios gerados (funcionalidade futura)
+    Retorna o histórico de relatórios gerados, mais recentes primeiro
     
-    **Parâmetros:**
-    - **limit**: Número máximo de registros a retornar
+    **Cada registro inclui:** tipo, filtros, usuário, número de linhas,
+    tempo de consulta, tempo de renderização, tempo total, tamanho do PDF e
+    cache hit/miss
+    """
+    try:
+        return await get_reports_history(page, page_size, report_type)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar histórico de relatórios: {str(e)}")
+
+
+@router.get("/history/summary")
+async def get_reports_latency_summary(
+    days: int = Query(30, ge=1, le=365, description="Janela de análise em dias"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Percentis de latência (p50/p95/p99) por tipo de relatório
     
-    **Nota:** Esta funcionalidade será implementada para tracking de relatórios gerados
+    Indica quais relatórios precisam de pré-computação. Considera no máximo
+    os settings.report_summary_max_records registros mais recentes da janela
+    de cada tipo.
     """
-    # Por enquanto, retorna uma mensagem informativa
-    # Em uma implementação futura, esto seria conectado a uma collection de histórico
-    return {
-        "message": "Histórico de relatórios - funcionalidade será implementada",
-        "reports": [],
-        "total": 0,
-        "note": "Para implementar: criar collection 'reports_history' e registrar cada geração"
-    }
\ No newline at end of file
+    try:
+        return {
+            "days": days,
+            "max_records": settings.report_summary_max_records,
+            "report_types": await get_latency_summary(days)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao calcular resumo de latência: {str(e)}")
@@ -3,27 +3,34 @@ Tenant management routes for SISMOBI 3.2.0
 """
 from typing import List, Optional
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
 import structlog
 import uuid
 
+from repository import Database
 from database import get_database
-from models import Tenant, TenantCreate, TenantUpdate, MessageResponse, User
+from models import Tenant, TenantCreate, TenantUpdate, MessageResponse, User, check_contract_dates
 from auth import get_current_active_user
-from utils import get_paginated_results, convert_objectid_to_str, validate_property_exists
+from utils import (
+    WITHOUT_SEARCH_KEYWORDS, get_paginated_results, get_collection_validators, convert_objectid_to_str,
+    search_keywords_update, validate_property_exists
+)
+from cache import invalidate_collections
+from storage import delete_documents
+from responses import ORJSONResponse, conditional_headers, is_not_modified, not_modified_response
 
 logger = structlog.get_logger(__name__)
 router = APIRouter(prefix="/tenants", tags=["tenants"])
 
 @router.get("/", response_model=dict)
 async def get_tenants(
+    request: Request,
     page: int = Query(1, ge=1),
     page_size: int = Query(50, ge=1, le=100),
     status: Optional[str] = Query(None),
     property_id: Optional[str] = Query(None),
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Get all tenants with pagination and filters"""
     try:
@@ -33,12 +40,18 @@ async def get_tenants(
         if property_id:
             filter_dict["property_id"] = property_id
             
+        validators = await get_collection_validators(db.tenants, filter_dict)
+        headers = conditional_headers(request, validators)
+        if is_not_modified(request, headers):
+            return not_modified_response(headers)
+        
         result = await get_paginated_results(
-            db.tenants, filter_dict, page, page_size, "created_at", -1
+            db.tenants, filter_dict, page, page_size, "created_at", -1,
+            total_count=validators["total_count"], projection=WITHOUT_SEARCH_KEYWORDS
         )
         
         logger.info("Tenants retrieved", count=len(result["items"]), user=current_user.email)
-        return result
+        return ORJSONResponse(result, headers=headers)
         
     except Exception as e:
         logger.error("Error retrieving tenants", error=str(e), user=current_user.email)
@@ -48,17 +61,17 @@ async def get_tenants(
 async def get_tenant(
     tenant_id: str,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Get specific tenant by ID"""
     try:
-        tenant_doc = await db.tenants.find_one({"id": tenant_id})
+        tenant_doc = await db.tenants.find_one({"id": tenant_id}, WITHOUT_SEARCH_KEYWORDS)
         if not tenant_doc:
             raise HTTPException(status_code=404, detail="Tenant not found")
         
         tenant_data = convert_objectid_to_str(tenant_doc)
         logger.info("Tenant retrieved", tenant_id=tenant_id, user=current_user.email)
-        return Tenant(**tenant_data)
+        return ORJSONResponse(tenant_data)
         
     except HTTPException:
         raise
@@ -70,7 +83,7 @@ async def get_tenant(
 async def create_tenant(
     tenant_data: TenantCreate,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Create new tenant"""
     try:
@@ -92,6 +105,7 @@ async def create_tenant(
             "created_at": datetime.now(),
             "updated_at": datetime.now()
         })
+        tenant_dict.update(search_keywords_update("tenants", tenant_dict))
         
         result = await db.tenants.insert_one(tenant_dict)
         created_tenant = await db.tenants.find_one({"_id": result.inserted_id})
@@ -103,6 +117,8 @@ async def create_tenant(
                 {"$set": {"status": "rented", "tenant_id": tenant_dict["id"], "updated_at": datetime.now()}}
             )
         
+        invalidate_collections("tenants", "properties")
+        
         tenant_response = convert_objectid_to_str(created_tenant)
         logger.info("Tenant created", tenant_id=tenant_response["id"], user=current_user.email)
         return Tenant(**tenant_response)
@@ -118,7 +134,7 @@ async def update_tenant(
     tenant_id: str,
     tenant_updates: TenantUpdate,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Update existing tenant"""
     try:
@@ -135,8 +151,16 @@ async def update_tenant(
         
         # Prepare update data
         update_data = {k: v for k, v in tenant_updates.dict().items() if v is not None}
+        try:
+            check_contract_dates(
+                update_data.get("contract_start_date", existing_tenant.get("contract_start_date")),
+                update_data.get("contract_end_date", existing_tenant.get("contract_end_date"))
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         if update_data:
             update_data["updated_at"] = datetime.now()
+            update_data.update(search_keywords_update("tenants", {**existing_tenant, **update_data}))
             
             await db.tenants.update_one(
                 {"id": tenant_id},
@@ -162,6 +186,8 @@ async def update_tenant(
                     {"$set": {"status": "rented", "tenant_id": tenant_id, "updated_at": datetime.now()}}
                 )
         
+        invalidate_collections("tenants", "properties")
+        
         updated_tenant = await db.tenants.find_one({"id": tenant_id})
         tenant_response = convert_objectid_to_str(updated_tenant)
         
@@ -178,7 +204,7 @@ async def update_tenant(
 async def delete_tenant(
     tenant_id: str,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Delete tenant and update related data"""
     try:
@@ -197,10 +223,11 @@ async def delete_tenant(
         # Delete related data
         await db.transactions.delete_many({"tenant_id": tenant_id})
         await db.alerts.delete_many({"tenant_id": tenant_id})
-        await db.documents.delete_many({"tenant_id": tenant_id})
+        await delete_documents(db, {"tenant_id": tenant_id})
         
         # Delete tenant
         await db.tenants.delete_one({"id": tenant_id})
+        invalidate_collections("tenants", "properties")
         
         logger.info("Tenant deleted", tenant_id=tenant_id, user=current_user.email)
         return {"message": "Tenant deleted successfully", "status": "success"}
@@ -1,13 +1,15 @@
 # Transactions API Router - SISMOBI Backend v3.2.0
 
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
 from typing import List, Optional
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from datetime import datetime
 
+from repository import Database
 from database import get_database
 from models import Transaction, TransactionCreate, TransactionUpdate
-from utils import convert_objectid_to_str
+from utils import convert_objectid_to_str, get_collection_validators
 from auth import get_current_user
+from responses import ORJSONResponse, conditional_headers, is_not_modified, not_modified_response
 
 router = APIRouter(
     prefix="/transactions",
@@ -17,12 +19,13 @@ router = APIRouter(
 
 @router.get("/", response_model=dict)
 async def get_transactions(
+    request: Request,
     skip: int = Query(0, ge=0, description="Number of transactions to skip"),
     limit: int = Query(100, ge=1, le=100, description="Maximum number of transactions to return"),
     property_id: Optional[str] = Query(None, description="Filter by property ID"),
     tenant_id: Optional[str] = Query(None, description="Filter by tenant ID"),
     type: Optional[str] = Query(None, description="Filter by transaction type (income/expense)"),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """
     Get all transactions with optional filtering and pagination
@@ -37,6 +40,12 @@ async def get_transactions(
         if type:
             filter_query["type"] = type
 
+        # Answer conditional requests before fetching the page
+        validators = await get_collection_validators(db.transactions, filter_query)
+        headers = conditional_headers(request, validators)
+        if is_not_modified(request, headers):
+            return not_modified_response(headers)
+
         # Get transactions with filters
         cursor = db.transactions.find(filter_query).skip(skip).limit(limit).sort("date", -1)
         transactions = []
@@ -45,16 +54,16 @@ async def get_transactions(
             clean_transaction = convert_objectid_to_str(transaction)
             transactions.append(clean_transaction)
 
-        # Get total count for pagination
-        total = await db.transactions.count_documents(filter_query)
+        # Total count for pagination (already computed with the validators)
+        total = validators["total_count"]
 
-        return {
+        return ORJSONResponse({
             "items": transactions,
             "total": total,
             "skip": skip,
             "limit": limit,
             "has_more": skip + limit < total
-        }
+        }, headers=headers)
 
     except Exception as e:
         raise HTTPException(
@@ -65,7 +74,7 @@ async def get_transactions(
 @router.post("/", response_model=dict, status_code=201)
 async def create_transaction(
     transaction: TransactionCreate,
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """
     Create a new transaction
@@ -117,7 +126,7 @@ async def create_transaction(
 @router.get("/{transaction_id}", response_model=dict)
 async def get_transaction(
     transaction_id: str,
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """
     Get a specific transaction by ID
@@ -128,7 +137,7 @@ async def get_transaction(
         if not transaction:
             raise HTTPException(status_code=404, detail="Transaction not found")
 
-        return convert_objectid_to_str(transaction)
+        return ORJSONResponse(convert_objectid_to_str(transaction))
 
     except HTTPException:
         raise
@@ -142,7 +151,7 @@ async def get_transaction(
 async def update_transaction(
     transaction_id: str,
     transaction_update: TransactionUpdate,
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """
     Update a specific transaction
@@ -171,6 +180,8 @@ async def update_transaction(
             if not tenant_doc:
                 raise HTTPException(status_code=400, detail="Tenant not found")
 
+        update_data["updated_at"] = datetime.now()
+
         # Update transaction
         result = await db.transactions.update_one(
             {"id": transaction_id},
@@ -195,7 +206,7 @@ async def update_transaction(
 @router.delete("/{transaction_id}", status_code=204)
 async def delete_transaction(
     transaction_id: str,
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """
     Delete a specific transaction
@@ -2,22 +2,24 @@
 Water Bills management routes for SISMOBI 3.2.0
 """
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
 import structlog
 import uuid
 from datetime import datetime
 
+from repository import Database
 from database import get_database
 from models import WaterBill, WaterBillCreate, WaterBillUpdate, MessageResponse, User
 from auth import get_current_active_user
-from utils import get_paginated_results, convert_objectid_to_str
+from utils import get_paginated_results, get_collection_validators, convert_objectid_to_str, get_bill_group_summary
+from responses import ORJSONResponse, conditional_headers, is_not_modified, not_modified_response
 
 logger = structlog.get_logger(__name__)
 router = APIRouter(prefix="/water-bills", tags=["water-bills"])
 
 @router.get("/", response_model=dict)
 async def get_water_bills(
+    request: Request,
     page: int = Query(1, ge=1),
     page_size: int = Query(50, ge=1, le=100),
     property_id: Optional[str] = Query(None),
@@ -25,7 +27,7 @@ async def get_water_bills(
     year: Optional[int] = Query(None, ge=2000, le=3000),
     month: Optional[int] = Query(None, ge=1, le=12),
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Get all water bills with pagination and filters"""
     try:
@@ -39,12 +41,18 @@ async def get_water_bills(
         if month:
             filter_dict["month"] = month
             
+        validators = await get_collection_validators(db.water_bills, filter_dict)
+        headers = conditional_headers(request, validators)
+        if is_not_modified(request, headers):
+            return not_modified_response(headers)
+        
         result = await get_paginated_results(
-            db.water_bills, filter_dict, page, page_size, "reading_date", -1
+            db.water_bills, filter_dict, page, page_size, "reading_date", -1,
+            total_count=validators["total_count"]
         )
         
         logger.info("Water bills retrieved", count=len(result["items"]), user=current_user.email)
-        return result
+        return ORJSONResponse(result, headers=headers)
         
     except Exception as e:
         logger.error("Error retrieving water bills", error=str(e), user=current_user.email)
@@ -54,7 +62,7 @@ async def get_water_bills(
 async def get_water_bill(
     bill_id: str,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Get specific water bill by ID"""
     try:
@@ -64,7 +72,7 @@ async def get_water_bill(
         
         bill_data = convert_objectid_to_str(bill_doc)
         logger.info("Water bill retrieved", bill_id=bill_id, user=current_user.email)
-        return WaterBill(**bill_data)
+        return ORJSONResponse(bill_data)
         
     except HTTPException:
         raise
@@ -76,7 +84,7 @@ async def get_water_bill(
 async def create_water_bill(
     bill_data: WaterBillCreate,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Create new water bill"""
     try:
@@ -111,7 +119,7 @@ async def update_water_bill(
     bill_id: str,
     bill_updates: WaterBillUpdate,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Update existing water bill"""
     try:
@@ -146,7 +154,7 @@ async def update_water_bill(
 async def delete_water_bill(
     bill_id: str,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Delete water bill"""
     try:
@@ -171,46 +179,42 @@ async def delete_water_bill(
 async def get_group_summary(
     group_id: str,
     year: Optional[int] = Query(None, ge=2000, le=3000),
+    include_bills: bool = Query(False),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=100),
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
-    """Get summary for water bill group"""
+    """Get aggregated summary for water bill group
+
+    Totals, averages and the per-month series are computed by MongoDB.
+    The bills themselves are only listed (paginated) when include_bills is set.
+    """
     try:
-        filter_dict = {"group_id": group_id}
-        if year:
-            filter_dict["year"] = year
-            
-        cursor = db.water_bills.find(filter_dict)
-        bills = []
-        async for bill in cursor:
-            bills.append(convert_objectid_to_str(bill))
-        
-        if not bills:
-            return {
-                "group_id": group_id,
-                "total_bills": 0,
-                "total_amount": 0,
-                "total_liters": 0,
-                "average_amount": 0,
-                "average_liters": 0,
-                "bills": []
-            }
-        
-        total_amount = sum(bill["total_amount"] for bill in bills)
-        total_liters = sum(bill["total_liters"] for bill in bills)
+        aggregated = await get_bill_group_summary(
+            db.water_bills, group_id, "total_liters", year
+        )
         
         summary = {
             "group_id": group_id,
-            "total_bills": len(bills),
-            "total_amount": total_amount,
-            "total_liters": total_liters,
-            "average_amount": total_amount / len(bills),
-            "average_liters": total_liters / len(bills),
-            "bills": bills
+            "total_bills": aggregated["total_bills"],
+            "total_amount": aggregated["total_amount"],
+            "total_liters": aggregated["total_quantity"],
+            "average_amount": aggregated["average_amount"],
+            "average_liters": aggregated["average_quantity"],
+            "monthly": aggregated["monthly"]
         }
         
+        if include_bills:
+            filter_dict = {"group_id": group_id}
+            if year:
+                filter_dict["year"] = year
+            summary["bills"] = await get_paginated_results(
+                db.water_bills, filter_dict, page, page_size, "reading_date", -1
+            )
+        
         logger.info("Water bill group summary retrieved", group_id=group_id, user=current_user.email)
-        return summary
+        return ORJSONResponse(summary)
         
     except Exception as e:
         logger.error("Error retrieving group summary", group_id=group_id, error=str(e))
@@ -2,20 +2,32 @@
 SISMOBI Backend 3.2.0 - Sistema de Gestão Imobiliária
 Complete FastAPI server with full functionality
 """
+import asyncio
+import json
 import uuid
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, WebSocket, WebSocketDisconnect, status
 from fastapi.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorDatabase
 from datetime import datetime
 import structlog
 
 # Import configurations and database
+from repository import Database
 from config import settings
 from database import connect_to_mongo, close_mongo_connection, get_database
 from models import DashboardSummary, HealthResponse, MessageResponse, User
-from auth import get_current_active_user, create_user
-from utils import calculate_dashboard_summary
+from auth import get_current_active_user, get_user_from_token, create_user
+from utils import calculate_dashboard_summary, run_search_keywords_backfill, search_keywords_update
+from cache import invalidate_collections
+from responses import ORJSONResponse, SelectiveGZipMiddleware, dumps
+from storage import run_blob_sweeper, sweeper_lease
+from document_processing import document_pipeline
+from metrics import MetricsMiddleware, metrics_endpoint
+from metrics_sync import metrics_sync
+from profiling import ProfilingMiddleware
+from warmup import readiness
+from cache_sync import cache_sync
+from dashboard_stream import dashboard_hub
 
 # Import routers
 from routers.auth import router as auth_router
@@ -23,10 +35,11 @@ from routers.properties import router as properties_router
 from routers.tenants import router as tenants_router  
 from routers.transactions import router as transactions_router
 from routers.alerts import router as alerts_router
-# from routers.reports import router as reports_router  # Temporarily disabled due to matplotlib deps
+from routers.reports import router as reports_router
 from routers.documents import router as documents_router
 from routers.energy_bills import router as energy_bills_router
 from routers.water_bills import router as water_bills_router
+from routers.admin import router as admin_router
 
 logger = structlog.get_logger(__name__)
 
@@ -48,8 +61,35 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             logger.warning("Could not create default admin user", error=str(e))
             
+        # Drop other workers' cache entries when this one writes, and vice versa
+        await cache_sync.start(get_database())
+        # Answer /metrics for every worker, not just the one scraped
+        await metrics_sync.start()
+        # Periodic removal of unreferenced document blobs, off the request path
+        sweeper = asyncio.create_task(run_blob_sweeper(get_database()))
+        # One-off: search_keywords for data written before the lookup index
+        backfill = asyncio.create_task(run_search_keywords_backfill(get_database()))
+        # Thumbnail and text extraction for uploaded documents
+        await document_pipeline.start(get_database())
+        # Pool, index and cache warmup; /readyz reports ready once it is done
+        readiness.reset()
+        warmup = asyncio.create_task(readiness.run_warmup(get_database()))
+        
         logger.info("Backend started successfully")
-        yield
+        try:
+            yield
+        finally:
+            readiness.draining = True
+            warmup.cancel()
+            sweeper.cancel()
+            backfill.cancel()
+            await asyncio.gather(sweeper, backfill, return_exceptions=True)
+            # Let another worker take the scheduled jobs over right away
+            await sweeper_lease.release(get_database())
+            await dashboard_hub.stop()
+            await document_pipeline.stop()
+            await cache_sync.stop()
+            await metrics_sync.stop()
         
     except Exception as e:
         logger.error("Failed to start backend", error=str(e))
@@ -64,7 +104,8 @@ app = FastAPI(
     title="SISMOBI API",
     description="Sistema de Gestão Imobiliária - Backend API v3.2.0",
     version="3.2.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # CORS configuration
@@ -74,18 +115,36 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified", "Accept-Ranges", "Content-Range"],
+)
+
+# Compress responses above the configured size (small payloads, 304s and
+# already-compressed media such as PDFs and images pass through)
+app.add_middleware(
+    SelectiveGZipMiddleware,
+    minimum_size=settings.gzip_minimum_size,
+    compresslevel=settings.gzip_compress_level
 )
 
+# Opt-in request profiling (PROFILING_ROUTES, X-Profile header, 1-in-N sampling)
+app.add_middleware(ProfilingMiddleware)
+
+# Outermost: per-route latency histograms, in-flight gauge, error counters
+# and the request log
+app.add_middleware(MetricsMiddleware)
+app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
+
 # Include routers
 app.include_router(auth_router, prefix=settings.api_prefix)
 app.include_router(properties_router, prefix=settings.api_prefix)
 app.include_router(tenants_router, prefix=settings.api_prefix)
 app.include_router(transactions_router, prefix=settings.api_prefix)
 app.include_router(alerts_router, prefix=settings.api_prefix)
-# app.include_router(reports_router, prefix=settings.api_prefix)  # Temporarily disabled due to matplotlib deps
+app.include_router(reports_router, prefix=settings.api_prefix)
 app.include_router(documents_router, prefix=settings.api_prefix)
 app.include_router(energy_bills_router, prefix=settings.api_prefix)
 app.include_router(water_bills_router, prefix=settings.api_prefix)
+app.include_router(admin_router, prefix=settings.api_prefix)
 
 # Root endpoint
 @app.get("/")
@@ -98,16 +157,22 @@ async def root():
         "documentation": "/docs"
     }
 
+@app.get("/livez", include_in_schema=False)
+async def liveness():
+    """Liveness probe: the event loop is serving requests (no I/O)"""
+    return {"status": "alive"}
+
+@app.get("/readyz", include_in_schema=False)
+async def readiness_probe(db: Database = Depends(get_database)):
+    """Readiness probe: warmed up, not shutting down, database reachable"""
+    probe = await readiness.status(db)
+    return ORJSONResponse(probe, status_code=200 if probe["ready"] else 503)
+
 @app.get("/api/health", response_model=HealthResponse)
-async def health_check(db: AsyncIOMotorDatabase = Depends(get_database)):
+async def health_check(db: Database = Depends(get_database)):
     """Health check endpoint"""
-    try:
-        # Test database connection
-        await db.command('ping')
-        database_status = "connected"
-    except Exception as e:
-        logger.error("Database health check failed", error=str(e))
-        database_status = "disconnected"
+    # Database check shared with /readyz (cached for READINESS_CACHE_SECONDS)
+    database_status = "connected" if await readiness.database_ok(db) else "disconnected"
         
     return HealthResponse(
         status="healthy" if database_status == "connected" else "degraded",
@@ -117,7 +182,7 @@ async def health_check(db: AsyncIOMotorDatabase = Depends(get_database)):
 @app.get("/api/v1/dashboard/summary", response_model=DashboardSummary)
 async def get_dashboard_summary(
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Get comprehensive dashboard summary"""
     try:
@@ -129,11 +194,60 @@ async def get_dashboard_summary(
         logger.error("Error retrieving dashboard summary", error=str(e), user=current_user.email)
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@app.websocket("/api/v1/dashboard/ws")
+async def dashboard_updates(websocket: WebSocket):
+    """Dashboard summary and alert changes pushed as they happen (see dashboard_stream.py)
+
+    Browsers cannot set headers on WebSocket requests, and a token in the URL
+    would end up in access logs, so the client authenticates with its first
+    message: {"type": "auth", "token": "<access token>"}.
+    """
+    db = get_database()
+    await websocket.accept()
+    try:
+        message = json.loads(await asyncio.wait_for(
+            websocket.receive_text(), settings.dashboard_auth_timeout_seconds
+        ))
+        if not isinstance(message, dict) or message.get("type") != "auth" or not message.get("token"):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Expected an auth message")
+        current_user = await get_user_from_token(db, message["token"])
+    except WebSocketDisconnect:
+        return
+    except (asyncio.TimeoutError, KeyError, ValueError):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Expected an auth message")
+        return
+    except HTTPException as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+        return
+    
+    queue = await dashboard_hub.subscribe(db)
+    logger.info("Dashboard stream opened", user=current_user.email, source=dashboard_hub.source)
+    # Clients only listen; reading is how a disconnect is noticed between pushes
+    incoming = asyncio.create_task(websocket.receive())
+    message = asyncio.create_task(queue.get())
+    try:
+        while True:
+            await asyncio.wait({message, incoming}, return_when=asyncio.FIRST_COMPLETED)
+            if incoming.done():
+                if incoming.result()["type"] == "websocket.disconnect":
+                    break
+                incoming = asyncio.create_task(websocket.receive())
+            if message.done():
+                await websocket.send_text(dumps(message.result()).decode())
+                message = asyncio.create_task(queue.get())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        incoming.cancel()
+        message.cancel()
+        dashboard_hub.unsubscribe(queue)
+        logger.info("Dashboard stream closed", user=current_user.email)
+
 # Initialize endpoint for testing
 @app.post("/api/v1/init", response_model=MessageResponse) 
 async def initialize_system(
     current_user: User = Depends(get_current_active_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: Database = Depends(get_database)
 ):
     """Initialize system with sample data (for testing)"""
     try:
@@ -174,7 +288,10 @@ async def initialize_system(
         # Insert properties if they don't exist
         existing_properties = await db.properties.count_documents({})
         if existing_properties == 0:
+            for sample in sample_properties:
+                sample.update(search_keywords_update("properties", sample))
             await db.properties.insert_many(sample_properties)
+            invalidate_collections("properties")
             logger.info("Sample properties created")
         
         return {"message": "System initialized successfully", "status": "success"}
@@ -184,5 +301,15 @@ async def initialize_system(
         raise HTTPException(status_code=500, detail="Failed to initialize system")
 
 if __name__ == "__main__":
+    # Development entry point; production runs gunicorn -c gunicorn_conf.py
+    # (graceful reloads on HUP, worker recycling)
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    if settings.web_workers > 1 and settings.database_engine == "memory":
+        raise SystemExit("WEB_WORKERS > 1 needs DATABASE_ENGINE=mongo: each worker would get its own in-memory database")
+    uvicorn.run(
+        "server_complex:app" if settings.web_workers > 1 else app,
+        host=settings.web_host,
+        port=settings.web_port,
+        workers=settings.web_workers,
+        timeout_graceful_shutdown=settings.web_graceful_timeout_seconds
+    )
\ No newline at end of file
@@ -0,0 +1,351 @@
+"""
+Content-addressed document storage for SISMOBI 3.2.0
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+import structlog
+from fastapi import UploadFile
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from repository import Database
+from config import settings
+from leases import JOBS_COLLECTION, Lease, worker_id
+
+logger = structlog.get_logger(__name__)
+
+class BlobStore:
+    """Local blob store keyed by the SHA-256 of the content
+
+    Blobs live at <root>/blobs/<first two hex chars>/<sha256>; uploads are
+    written to <root>/tmp first and renamed into place once the hash is known,
+    so identical files uploaded for different properties or tenants share one
+    blob on disk.
+    """
+
+    def __init__(self, root: str, chunk_size: int = 1024 * 1024):
+        self.root = os.path.abspath(root)
+        self.chunk_size = chunk_size
+        self.blob_dir = os.path.join(self.root, "blobs")
+        self.tmp_dir = os.path.join(self.root, "tmp")
+
+    def path_for(self, sha256: str) -> str:
+        """Absolute path of the blob with the given hash"""
+        return os.path.join(self.blob_dir, sha256[:2], sha256)
+
+    def relative_path(self, sha256: str) -> str:
+        """Path stored in document records, relative to the storage root"""
+        return os.path.join("blobs", sha256[:2], sha256)
+
+    def exists(self, sha256: str) -> bool:
+        return os.path.exists(self.path_for(sha256))
+
+    async def save_upload(
+        self,
+        upload: UploadFile,
+        max_bytes: Optional[int] = None,
+        db: Optional[Database] = None
+    ) -> Tuple[str, int, bool]:
+        """Stream an upload to disk while hashing it
+
+        Returns (sha256, size, deduplicated). Only one chunk is held in memory
+        at a time and disk writes run in a worker thread. Empty uploads are
+        not stored. Raises ValueError if the upload exceeds max_bytes.
+
+        With `db`, the blob's reference count is incremented before the file
+        is moved into place, so the sweeper never removes content that a
+        concurrent upload is about to reuse; if a sweep is already removing
+        it, the reference waits for that and the file is written again. The
+        reference is dropped again if the file cannot be moved into place.
+        """
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        tmp_path = os.path.join(self.tmp_dir, f"{uuid.uuid4().hex}.part")
+        digest = hashlib.sha256()
+        size = 0
+        retained = False
+
+        try:
+            with open(tmp_path, "wb") as tmp:
+                while True:
+                    chunk = await upload.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise ValueError(f"File exceeds {max_bytes} bytes")
+                    digest.update(chunk)
+                    await asyncio.to_thread(tmp.write, chunk)
+                await asyncio.to_thread(os.fsync, tmp.fileno())
+
+            sha256 = digest.hexdigest()
+            if size == 0:
+                # Nothing worth keeping; the caller rejects empty uploads
+                os.unlink(tmp_path)
+                return sha256, 0, False
+            if db is not None:
+                await retain_blob(db, sha256, size)
+                retained = True
+            deduplicated = await asyncio.to_thread(self._commit, tmp_path, sha256)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            if retained:
+                # No file was put in place for this reference
+                await release_blobs(db, [sha256])
+            raise
+
+        logger.debug("Blob stored", sha256=sha256, size=size, deduplicated=deduplicated)
+        return sha256, size, deduplicated
+
+    def _commit(self, tmp_path: str, sha256: str) -> bool:
+        """Move a finished upload into place; returns True if the blob already existed"""
+        final_path = self.path_for(sha256)
+        if os.path.exists(final_path):
+            os.unlink(tmp_path)
+            return True
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(tmp_path, final_path)
+        return False
+
+    def remove(self, sha256: str) -> int:
+        """Delete a blob and its derived files; returns the bytes freed"""
+        freed = 0
+        path = self.path_for(sha256)
+        for candidate in [path] + [path + suffix for suffix in DERIVED_SUFFIXES]:
+            try:
+                freed += os.path.getsize(candidate)
+                os.unlink(candidate)
+            except FileNotFoundError:
+                pass
+        return freed
+
+    def remove_stale_parts(self, older_than: float) -> int:
+        """Delete temp files left by interrupted uploads; returns the bytes freed"""
+        freed = 0
+        if not os.path.isdir(self.tmp_dir):
+            return freed
+        for entry in os.scandir(self.tmp_dir):
+            try:
+                stat_result = entry.stat()
+                if stat_result.st_mtime < older_than:
+                    os.unlink(entry.path)
+                    freed += stat_result.st_size
+            except FileNotFoundError:
+                pass
+        return freed
+
+# Files derived from a blob (see document_processing), stored next to it
+THUMBNAIL_SUFFIX = ".thumb.png"
+TEXT_SUFFIX = ".txt"
+DERIVED_SUFFIXES = (THUMBNAIL_SUFFIX, TEXT_SUFFIX)
+
+# Global blob store instance
+blob_store = BlobStore(settings.document_storage_path, settings.document_upload_chunk_size)
+
+# Reference counting
+
+BLOBS_COLLECTION = "blobs"
+
+# A sweeper claim older than this is considered abandoned (worker died
+# between claiming a blob and deleting its record)
+CLAIM_TIMEOUT = timedelta(minutes=10)
+CLAIM_RETRY_SECONDS = 0.05
+
+def _unclaimed(now: datetime) -> Dict[str, Any]:
+    """Filter for blob records not being deleted by a live sweep"""
+    return {"$or": [{"deleting": {"$ne": True}}, {"deleting_at": {"$lt": now - CLAIM_TIMEOUT}}]}
+
+async def retain_blob(db: Database, sha256: str, size: int):
+    """Record one more document pointing at a blob
+
+    A record claimed by the sweeper counts as absent: this waits until the
+    sweeper has unlinked the file and dropped the record, then starts a new
+    record, and the caller writes the file again.
+    """
+    while True:
+        now = datetime.now()
+        try:
+            await db[BLOBS_COLLECTION].update_one(
+                {"sha256": sha256, "deleting": {"$ne": True}},
+                {
+                    "$inc": {"refcount": 1},
+                    "$set": {"updated_at": now, "unreferenced_at": None},
+                    "$setOnInsert": {"size": size, "created_at": now}
+                },
+                upsert=True
+            )
+            return
+        except DuplicateKeyError:
+            # The upsert collided with a claimed record on the sha256 index;
+            # drop the claim if its sweep died, else give the sweep time to finish
+            await db[BLOBS_COLLECTION].delete_one(
+                {"sha256": sha256, "deleting": True, "deleting_at": {"$lt": now - CLAIM_TIMEOUT}}
+            )
+            await asyncio.sleep(CLAIM_RETRY_SECONDS)
+
+async def release_blobs(db: Database, hashes: Iterable[Optional[str]]) -> int:
+    """Drop one reference per occurrence of each hash
+
+    Blobs whose count reaches zero are stamped with unreferenced_at and left
+    for the sweeper. Returns the number of blobs that became unreferenced.
+    """
+    counts = Counter(sha256 for sha256 in hashes if sha256)
+    if not counts:
+        return 0
+    now = datetime.now()
+    await db[BLOBS_COLLECTION].bulk_write(
+        [
+            UpdateOne({"sha256": sha256}, {"$inc": {"refcount": -count}, "$set": {"updated_at": now}})
+            for sha256, count in counts.items()
+        ],
+        ordered=False
+    )
+    result = await db[BLOBS_COLLECTION].update_many(
+        {"sha256": {"$in": list(counts)}, "refcount": {"$lte": 0}, "unreferenced_at": None},
+        {"$set": {"unreferenced_at": now}}
+    )
+    return result.modified_count
+
+async def delete_document_record(db: Database, filter_dict: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Delete one document record and release its blob; returns it, or None if nothing matched"""
+    document = await db.documents.find_one_and_delete(filter_dict)
+    if document is not None:
+        await release_blobs(db, [document.get("sha256")])
+    return document
+
+async def delete_documents(db: Database, filter_dict: Dict[str, Any]) -> int:
+    """Delete document records and release their blobs; returns the number deleted
+
+    Only the records found here are deleted (by _id), one delete per blob, so
+    each blob loses exactly as many references as records were removed: one
+    that starts matching meanwhile is left alone, and one deleted concurrently
+    by another request is released by that request only.
+    """
+    ids_by_hash: Dict[Optional[str], List[Any]] = defaultdict(list)
+    async for doc in db.documents.find(filter_dict, {"_id": 1, "sha256": 1}):
+        ids_by_hash[doc.get("sha256") or None].append(doc["_id"])
+    deleted = 0
+    released: List[str] = []
+    for sha256, ids in ids_by_hash.items():
+        result = await db.documents.delete_many({"_id": {"$in": ids}})
+        deleted += result.deleted_count
+        if sha256:
+            released.extend([sha256] * result.deleted_count)
+    await release_blobs(db, released)
+    return deleted
+
+# Sweeper
+
+async def sweep_unreferenced_blobs(
+    db: Database,
+    grace_minutes: Optional[int] = None,
+    batch_size: Optional[int] = None
+) -> Dict[str, Any]:
+    """Remove blobs that have had no references for longer than the grace period
+
+    Each blob record is first claimed (marked deleting) while its count is
+    still zero, then the files are unlinked in a worker thread and the record
+    is deleted last, so an upload of the same content meanwhile waits for the
+    record to go and writes the file again (see retain_blob). Runs in batches
+    of batch_size until nothing is left to sweep.
+    """
+    grace_minutes = settings.blob_sweep_grace_minutes if grace_minutes is None else grace_minutes
+    batch_size = batch_size or settings.blob_sweep_batch_size
+    cutoff = datetime.now() - timedelta(minutes=grace_minutes)
+    started = time.perf_counter()
+    collection = db[BLOBS_COLLECTION]
+    removed = 0
+    bytes_reclaimed = 0
+
+    while True:
+        candidates = await collection.find(
+            {"refcount": {"$lte": 0}, "unreferenced_at": {"$ne": None, "$lte": cutoff}, **_unclaimed(datetime.now())},
+            {"_id": 0, "sha256": 1}
+        ).limit(batch_size).to_list(length=batch_size)
+        if not candidates:
+            break
+
+        claimed = []
+        for candidate in candidates:
+            # Skip blobs re-referenced or claimed by another sweep since the query
+            now = datetime.now()
+            claim_id = uuid.uuid4().hex
+            result = await collection.update_one(
+                {"sha256": candidate["sha256"], "refcount": {"$lte": 0}, **_unclaimed(now)},
+                {"$set": {"deleting": True, "deleting_at": now, "claim_id": claim_id}}
+            )
+            if result.modified_count:
+                claimed.append((candidate["sha256"], claim_id))
+        bytes_reclaimed += await asyncio.to_thread(lambda: sum(blob_store.remove(sha256) for sha256, _ in claimed))
+        for sha256, claim_id in claimed:
+            await collection.delete_one({"sha256": sha256, "claim_id": claim_id})
+        removed += len(claimed)
+        if len(candidates) < batch_size:
+            break
+
+    # Uploads in progress keep writing their .part file; never treat one as
+    # stale before an hour has passed, whatever the grace period
+    parts_cutoff = min(cutoff, datetime.now() - timedelta(hours=1))
+    bytes_reclaimed += await asyncio.to_thread(blob_store.remove_stale_parts, parts_cutoff.timestamp())
+    stats = {
+        "blobs_removed": removed,
+        "bytes_reclaimed": bytes_reclaimed,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+        "finished_at": datetime.now()
+    }
+    logger.info("Blob sweep finished", **stats)
+    return stats
+
+# Sweeps are coordinated through the database so every worker sees the same
+# state: sweeper_lease elects the worker running the periodic sweep, a
+# per-run lease keeps a manual sweep from overlapping another one, and the
+# last result is stored for GET /documents/storage/sweep
+sweeper_lease = Lease("blob-sweeper", ttl_seconds=settings.blob_sweep_interval_minutes * 60 * 2)
+SWEEP_RUN_LEASE = "blob-sweep-run"
+LAST_SWEEP_ID = "blob-sweep"
+
+async def sweep_exclusively(db: Database, grace_minutes: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """Sweep and record the result, or return None while another sweep runs"""
+    # A distinct owner per run, so two sweeps in the same worker exclude each other too
+    run_lease = Lease(
+        SWEEP_RUN_LEASE,
+        ttl_seconds=settings.blob_sweep_interval_minutes * 60,
+        owner=f"{worker_id()}:{uuid.uuid4().hex[:6]}"
+    )
+    if not await run_lease.acquire(db):
+        return None
+    try:
+        stats = await sweep_unreferenced_blobs(db, grace_minutes=grace_minutes)
+        await db[JOBS_COLLECTION].replace_one(
+            {"_id": LAST_SWEEP_ID}, {**stats, "worker": worker_id()}, upsert=True
+        )
+        return stats
+    finally:
+        await run_lease.release(db)
+
+async def get_last_sweep(db: Database) -> Dict[str, Any]:
+    """Result of the last sweep by any worker (empty until the first one)"""
+    return await db[JOBS_COLLECTION].find_one({"_id": LAST_SWEEP_ID}, {"_id": 0}) or {}
+
+async def run_blob_sweeper(db: Database):
+    """Sweep periodically until cancelled (started from the app lifespan)
+
+    Every worker runs this loop; sweeper_lease makes only one of them sweep.
+    The lifespan releases it on shutdown so another worker takes over
+    without waiting for it to expire.
+    """
+    interval = settings.blob_sweep_interval_minutes * 60
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if not await sweeper_lease.acquire(db):
+                continue
+            await sweep_exclusively(db)
+        except Exception as e:
+            logger.warning("Blob sweep failed", error=str(e))
@@ -0,0 +1,103 @@
+"""
+Test fixtures for SISMOBI 3.2.0
+
+The suite runs against the in-memory engine (DATABASE_ENGINE=memory, see
+repository.py), so it needs no MongoDB. Settings are read from the
+environment at import time, hence the defaults below come before any
+backend import.
+"""
+import os
+import sys
+import tempfile
+import uuid
+from datetime import datetime
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+_TMP_DIR = tempfile.mkdtemp(prefix="sismobi-tests-")
+for _name, _value in {
+    "DATABASE_ENGINE": "memory",
+    "DATABASE_NAME": "sismobi_test",
+    "CACHE_SYNC": "off",
+    "WARMUP_ENABLED": "false",
+    "DOCUMENT_STORAGE_PATH": os.path.join(_TMP_DIR, "uploads"),
+    "PROFILING_DIR": os.path.join(_TMP_DIR, "profiles"),
+    "DASHBOARD_POLL_SECONDS": "0.2",
+    "DASHBOARD_PUSH_INTERVAL_MS": "50",
+}.items():
+    os.environ.setdefault(_name, _value)
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from auth import create_access_token  # noqa: E402
+from cache import query_cache  # noqa: E402
+from database import ensure_indexes, get_database  # noqa: E402
+from repository import create_client  # noqa: E402
+
+TEST_USER_EMAIL = "tester@sismobi.com"
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+async def db():
+    """Empty in-memory database with the production indexes"""
+    database = create_client("memory")[f"sismobi_{uuid.uuid4().hex[:8]}"]
+    await ensure_indexes(database)
+    yield database
+
+@pytest.fixture
+def app():
+    from server_complex import app
+    return app
+
+@pytest.fixture
+def client(app):
+    """TestClient running the full lifespan on a fresh in-memory database,
+    authenticated as an active test user"""
+    query_cache.clear()
+    with TestClient(app) as test_client:
+        test_client.portal.call(get_database().users.insert_one, {
+            "id": str(uuid.uuid4()),
+            "email": TEST_USER_EMAIL,
+            "full_name": "Test User",
+            "hashed_password": "not-used",
+            "is_active": True,
+            "created_at": datetime.now(),
+            "updated_at": datetime.now()
+        })
+        token = create_access_token({"sub": TEST_USER_EMAIL})
+        test_client.headers["Authorization"] = f"Bearer {token}"
+        test_client.token = token
+        yield test_client
+    query_cache.clear()
+
+@pytest.fixture
+def app_db(client):
+    """The database behind `client`"""
+    return get_database()
+
+@pytest.fixture
+def call(client):
+    """Run an async database call from a sync test on the client's event loop"""
+    def call(coroutine_function, *args, **kwargs):
+        return client.portal.call(lambda: coroutine_function(*args, **kwargs))
+    return call
+
+@pytest.fixture
+def property_id(client):
+    """A vacant property created through the API"""
+    response = client.post("/api/v1/properties/", json={
+        "name": "Apartamento Centro",
+        "address": "Rua das Flores, 123",
+        "type": "Apartamento",
+        "size": 75.0,
+        "rooms": 2,
+        "rent_value": 1500.0
+    })
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
@@ -0,0 +1,135 @@
+"""
+Generated alerts: consumption anomalies and expiring contracts
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from anomaly_detection import MIN_RELATIVE_STD, score_rolling_zscores
+
+def months_back(count):
+    """(year, month) of the last `count` months, oldest first, ending with the current one"""
+    now = datetime.now()
+    period = now.year * 12 + now.month - 1
+    return [divmod(p, 12) for p in range(period - count + 1, period + 1)]
+
+def test_rolling_zscores_match_a_naive_window():
+    groups = np.array([0, 0, 0, 0, 0, 1, 1, 1])
+    # Group 0 has no bills for two months before its last one
+    periods = np.array([100, 101, 102, 103, 106, 100, 101, 102])
+    values = np.array([10.0, 12.0, 11.0, 13.0, 40.0, 5.0, 5.0, 9.0])
+    scores = score_rolling_zscores(groups, periods, values, window=3)
+    for i, (group, period, value) in enumerate(zip(groups, periods, values)):
+        previous = [values[j] for j in range(i) if groups[j] == group and period - periods[j] <= 3]
+        assert scores["count"][i] == len(previous)
+        if previous:
+            scale = max(np.std(previous), MIN_RELATIVE_STD * abs(np.mean(previous)))
+            assert np.isclose(scores["zscores"][i], (value - np.mean(previous)) / scale)
+        else:
+            assert scores["zscores"][i] == 0
+
+def test_rolling_zscores_are_stable_next_to_large_groups():
+    rng = np.random.default_rng(0)
+    large = rng.uniform(1e7, 1e8, 200_000)
+    small = rng.normal(10.0, 0.5, 12)
+    groups = np.concatenate((np.zeros(len(large), dtype=int), np.ones(len(small), dtype=int)))
+    periods = np.concatenate((np.arange(len(large)), np.arange(len(small))))
+    scores = score_rolling_zscores(groups, periods, np.concatenate((large, small)), window=6)
+    for i in range(1, len(small)):
+        previous = small[max(0, i - 6):i]
+        assert np.isclose(scores["std"][len(large) + i], np.std(previous))
+        assert np.isclose(scores["mean"][len(large) + i], np.mean(previous))
+
+def test_spike_after_a_flat_history_is_scored():
+    scores = score_rolling_zscores(
+        np.zeros(5, dtype=int), np.arange(5), np.array([100.0, 100.0, 100.0, 100.0, 10000.0]), window=12
+    )
+    assert scores["std"][4] == 0
+    assert scores["zscores"][4] > 3
+    assert list(scores["zscores"][:4]) == [0, 0, 0, 0]
+
+def test_metering_noise_after_a_flat_history_is_not_scored_high():
+    values = np.array([100.0] * 6 + [104.0])
+    scores = score_rolling_zscores(np.zeros(len(values), dtype=int), np.arange(len(values)), values, window=12)
+    assert 0 < scores["zscores"][-1] < 3
+
+def test_window_counts_months_not_bills():
+    # Bills two years apart: the old one is outside a 12-month window
+    scores = score_rolling_zscores(np.zeros(3, dtype=int), np.array([0, 24, 25]), np.array([5.0, 100.0, 100.0]), window=12)
+    assert list(scores["count"]) == [0, 0, 1]
+    assert scores["mean"][2] == 100.0
+
+def test_detect_anomalies_flags_spikes_once(client, app_db, call, property_id):
+    bills = []
+    for index, (year, month) in enumerate(months_back(8)):
+        kwh = 1000.0 if index == 7 else 100.0 + index % 3 * 5
+        bills.append({"property_id": property_id, "group_id": "g", "year": year, "month": month + 1, "total_kwh": kwh, "total_amount": kwh})
+    call(app_db.energy_bills.insert_many, bills)
+
+    result = client.post("/api/v1/alerts/detect-anomalies").json()
+    assert result["high_energy_bill"]["flagged"] == 1
+    assert result["high_energy_bill"]["inserted"] == 1
+    assert result["high_water_bill"] == {"scored": 0, "flagged": 0, "inserted": 0}
+
+    alerts = client.get("/api/v1/alerts/", params={"type": "high_energy_bill"}).json()["items"]
+    assert [alert["property_id"] for alert in alerts] == [property_id]
+
+    # Re-running is idempotent
+    again = client.post("/api/v1/alerts/detect-anomalies").json()
+    assert again["high_energy_bill"] == {"scored": 8, "flagged": 1, "inserted": 0}
+
+def test_detect_anomalies_over_the_whole_history(client, app_db, call, property_id):
+    bills = []
+    for index, (year, month) in enumerate(months_back(12)):
+        kwh = 1000.0 if index == 5 else 100.0 + index % 3 * 5
+        bills.append({"property_id": property_id, "group_id": "g", "year": year, "month": month + 1, "total_kwh": kwh, "total_amount": kwh})
+    call(app_db.energy_bills.insert_many, bills)
+
+    # The spike is older than the default three-month lookback
+    assert client.post("/api/v1/alerts/detect-anomalies").json()["high_energy_bill"]["flagged"] == 0
+    result = client.post("/api/v1/alerts/detect-anomalies", params={"lookback_months": 0}).json()
+    assert result["high_energy_bill"]["flagged"] == 1
+
+def test_contract_expiring_alerts(client, property_id):
+    today = datetime.now().replace(microsecond=0)
+    tenant = {
+        "name": "Maria Silva", "email": "maria@example.com", "phone": "81 99999-0000",
+        "document": "123", "property_id": property_id, "rent_due_date": 5,
+        "contract_start_date": (today - timedelta(days=300)).isoformat(),
+    }
+    expiring = client.post("/api/v1/tenants/", json={**tenant, "contract_end_date": (today + timedelta(days=5)).isoformat()})
+    assert expiring.status_code == 200, expiring.text
+    client.post("/api/v1/tenants/", json={**tenant, "email": "joao@example.com", "contract_end_date": (today + timedelta(days=90)).isoformat()})
+
+    assert client.post("/api/v1/alerts/contract-expiring").json() == {"expiring": 1, "inserted": 1}
+    assert client.post("/api/v1/alerts/contract-expiring").json() == {"expiring": 1, "inserted": 0}
+    alerts = client.get("/api/v1/alerts/", params={"type": "contract_expiring"}).json()["items"]
+    assert [(alert["tenant_id"], alert["priority"]) for alert in alerts] == [(expiring.json()["id"], "high")]
+
+def test_contract_end_before_start_is_rejected(client):
+    response = client.post("/api/v1/tenants/", json={
+        "name": "Maria Silva", "email": "maria@example.com", "phone": "81", "document": "1", "rent_due_date": 5,
+        "contract_start_date": "2024-06-01T00:00:00", "contract_end_date": "2024-05-01T00:00:00",
+    })
+    assert response.status_code == 422
+
+def test_contract_end_before_start_is_rejected_on_update(client):
+    created = client.post("/api/v1/tenants/", json={
+        "name": "Maria Silva", "email": "maria@example.com", "phone": "81", "document": "1", "rent_due_date": 5,
+        "contract_start_date": "2024-06-01T00:00:00", "contract_end_date": "2025-06-01T00:00:00",
+    })
+    tenant_id = created.json()["id"]
+    both = {"contract_start_date": "2024-06-01T00:00:00", "contract_end_date": "2024-05-01T00:00:00"}
+    assert client.put(f"/api/v1/tenants/{tenant_id}", json=both).status_code == 422
+    # A single date is checked against the stored one
+    response = client.put(f"/api/v1/tenants/{tenant_id}", json={"contract_end_date": "2024-05-01T00:00:00"})
+    assert response.status_code == 400
+    assert client.put(f"/api/v1/tenants/{tenant_id}", json={"contract_start_date": "2025-07-01T00:00:00"}).status_code == 400
+    # Offset-aware payload dates compare against the naive stored ones
+    response = client.put(f"/api/v1/tenants/{tenant_id}", json={"contract_end_date": "2024-05-01T00:00:00Z"})
+    assert response.status_code == 400
+    both = {"contract_start_date": "2024-06-01T03:00:00-03:00", "contract_end_date": "2024-06-01T05:00:00Z"}
+    assert client.put(f"/api/v1/tenants/{tenant_id}", json=both).status_code == 422
+    response = client.put(f"/api/v1/tenants/{tenant_id}", json={"contract_end_date": "2026-06-01T00:00:00"})
+    assert response.status_code == 200
+    assert response.json()["contract_end_date"].startswith("2026-06-01")
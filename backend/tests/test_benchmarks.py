@@ -0,0 +1,83 @@
+"""
+Synthetic dataset generator and load-testing harness (backend/benchmarks)
+"""
+import os
+import random
+import sys
+from datetime import datetime
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from conftest import BACKEND_DIR
+
+sys.path.insert(0, os.path.join(BACKEND_DIR, "benchmarks"))
+
+from load_test import percentile, run_scenario, sample_ids, seed  # noqa: E402
+from synthetic_data import COLLECTIONS, DatasetSpec, generate, work_units  # noqa: E402
+
+SPEC = DatasetSpec(properties=12, tenants=30, months=6, alerts=20, group_size=4, end=datetime(2024, 6, 1))
+
+def test_generation_is_deterministic_per_slice():
+    whole = generate(SPEC, "tenants", 0, 30)["tenants"]
+    parts = generate(SPEC, "tenants", 0, 10)["tenants"] + generate(SPEC, "tenants", 10, 30)["tenants"]
+    assert whole == parts
+    assert generate(SPEC.model_copy(update={"seed": 7}), "tenants", 0, 30)["tenants"] != whole
+
+def test_work_units_cover_every_entity_once():
+    units = work_units(SPEC.scaled(100))
+    for kind, total in (("properties", 1200), ("tenants", 3000), ("alerts", 2000)):
+        ranges = sorted((start, stop) for unit_kind, start, stop in units if unit_kind == kind)
+        assert ranges[0][0] == 0 and ranges[-1][1] == total
+        assert all(previous[1] == current[0] for previous, current in zip(ranges, ranges[1:]))
+
+def test_references_are_consistent():
+    properties = {p["id"]: p for p in generate(SPEC, "properties", 0, SPEC.properties)["properties"]}
+    tenants = {t["id"]: t for t in generate(SPEC, "tenants", 0, SPEC.tenants)["tenants"]}
+    rent = generate(SPEC, "rent_transactions", 0, SPEC.tenants)["transactions"]
+    assert all(t["property_id"] in properties for t in tenants.values())
+    for prop in properties.values():
+        if prop["status"] == "rented":
+            assert tenants[prop["tenant_id"]]["property_id"] == prop["id"]
+            assert tenants[prop["tenant_id"]]["status"] == "active"
+    for transaction in rent:
+        tenant = tenants[transaction["tenant_id"]]
+        assert transaction["property_id"] == tenant["property_id"]
+        assert tenant["contract_start_date"] < transaction["date"]
+
+def test_percentile_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert (percentile(values, 0.5), percentile(values, 0.95), percentile(values, 0.99)) == (50.0, 95.0, 99.0)
+    assert percentile([], 0.5) == 0.0
+
+@pytest.mark.anyio
+async def test_seed_in_memory(db):
+    counts = await seed(db, SPEC, None, None)
+    assert set(counts) == set(COLLECTIONS)
+    for name in COLLECTIONS:
+        assert await db[name].count_documents({}) == counts[name]
+    assert counts["properties"] == 12 and counts["tenants"] == 30 and counts["transactions"] > 0
+    assert await db.users.count_documents({"email": "bench@sismobi.com"}) == 1
+    ids = await sample_ids(db, size=5)
+    assert len(ids["properties"]) == 5 and len(ids["tenants"]) == 5
+
+@pytest.mark.anyio
+async def test_run_scenario_counts_statuses():
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: str):
+        return {"id": item_id}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        result = await run_scenario(
+            http, lambda rng, ids: f"/items/{rng.choice(ids['items'])}" if rng.random() < 0.8 else "/missing",
+            {"items": ["a", "b"]}, requests=50, concurrency=5, warmup=2, rng=random.Random(1)
+        )
+    assert result["requests"] == 50
+    assert result["statuses"].get("200", 0) + result["statuses"].get("404", 0) == 50
+    assert result["errors"] == result["statuses"].get("404", 0)
+    latency = result["latency_ms"]
+    assert latency["p50"] <= latency["p95"] <= latency["p99"] <= latency["max"]
@@ -0,0 +1,46 @@
+"""
+Energy and water bill group summaries (aggregated in the database)
+"""
+import pytest
+
+def bill(property_id, kind, month, amount, quantity, group_id="g1", year=2024):
+    return {
+        "property_id": property_id,
+        "group_id": group_id,
+        "month": month,
+        "year": year,
+        "total_amount": amount,
+        "total_kwh" if kind == "energy" else "total_liters": quantity,
+        "reading_date": f"{year}-{month:02d}-05T00:00:00",
+        "due_date": f"{year}-{month:02d}-20T00:00:00",
+    }
+
+@pytest.mark.parametrize("kind,path,quantity_field", [
+    ("energy", "energy-bills", "kwh"),
+    ("water", "water-bills", "liters"),
+])
+def test_group_summary(client, property_id, kind, path, quantity_field):
+    for month, amount, quantity in [(1, 100.0, 200.0), (1, 50.0, 100.0), (2, 90.0, 150.0)]:
+        response = client.post(f"/api/v1/{path}/", json=bill(property_id, kind, month, amount, quantity))
+        assert response.status_code == 200, response.text
+    client.post(f"/api/v1/{path}/", json=bill(property_id, kind, 1, 999.0, 999.0, group_id="other"))
+    client.post(f"/api/v1/{path}/", json=bill(property_id, kind, 3, 10.0, 10.0, year=2023))
+
+    summary = client.get(f"/api/v1/{path}/group/g1/summary", params={"year": 2024}).json()
+    assert summary["total_bills"] == 3
+    assert summary["total_amount"] == 240.0
+    assert summary[f"total_{quantity_field}"] == 450.0
+    assert summary["average_amount"] == 80.0
+    assert [(row["month"], row["bills"], row["total_amount"]) for row in summary["monthly"]] == [(1, 2, 150.0), (2, 1, 90.0)]
+    assert "bills" not in summary
+
+    everything = client.get(f"/api/v1/{path}/group/g1/summary", params={"include_bills": True, "page_size": 2}).json()
+    assert everything["total_bills"] == 4
+    assert everything["bills"]["pagination"]["total_count"] == 4
+    assert len(everything["bills"]["items"]) == 2
+
+def test_empty_group_summary(client):
+    summary = client.get("/api/v1/energy-bills/group/none/summary").json()
+    assert summary["total_bills"] == 0
+    assert summary["average_kwh"] == 0
+    assert summary["monthly"] == []
@@ -0,0 +1,367 @@
+"""
+Document uploads: blob storage, downloads, reference counting and processing
+"""
+import asyncio
+import io
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import UploadFile
+from PIL import Image
+
+import storage
+from config import settings
+from conftest import TEST_USER_EMAIL
+from document_processing import detect_kind, process_blob
+from storage import BlobStore, blob_store, release_blobs, sweep_unreferenced_blobs
+
+CONTENT = bytes(range(256)) * 40
+
+def upload(client, content=CONTENT, name="contrato.bin", mime_type="application/octet-stream", **params):
+    return client.post("/api/v1/documents/upload", params=params, files={"file": (name, content, mime_type)})
+
+def blob(call, app_db, sha256):
+    return call(app_db.blobs.find_one, {"sha256": sha256}, {"_id": 0})
+
+@pytest.fixture
+def admin(monkeypatch):
+    monkeypatch.setattr(settings, "admin_emails", [TEST_USER_EMAIL])
+
+def wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = predicate()
+        if result:
+            return result
+        time.sleep(0.05)
+    raise AssertionError("condition not reached")
+
+def test_upload_deduplicates_content(client, app_db, call):
+    first, second = upload(client).json(), upload(client, name="copia.bin").json()
+    assert first["sha256"] == second["sha256"]
+    assert first["file_size"] == len(CONTENT)
+    assert first["file_path"] == os.path.join("blobs", first["sha256"][:2], first["sha256"])
+    assert blob(call, app_db, first["sha256"])["refcount"] == 2
+    assert os.listdir(blob_store.tmp_dir) == []
+
+def test_upload_limits(client, monkeypatch):
+    from config import settings
+    assert upload(client, content=b"").status_code == 400
+    assert upload(client, property_id="missing").status_code == 400
+    monkeypatch.setattr(settings, "document_max_upload_mb", 0)
+    assert upload(client).status_code == 413
+
+def test_download_ranges_and_etag(client):
+    document = upload(client).json()
+    url = f"/api/v1/documents/{document['id']}/content"
+
+    full = client.get(url)
+    assert full.status_code == 200 and full.content == CONTENT
+    assert full.headers["ETag"] == f'"{document["sha256"]}"'
+    assert full.headers["Accept-Ranges"] == "bytes"
+    assert client.get(url, headers={"If-None-Match": full.headers["ETag"]}).status_code == 304
+
+    partial = client.get(url, headers={"Range": "bytes=10-19"})
+    assert partial.status_code == 206
+    assert partial.content == CONTENT[10:20]
+    assert partial.headers["Content-Range"] == f"bytes 10-19/{len(CONTENT)}"
+
+    suffix = client.get(url, headers={"Range": "bytes=-5"})
+    assert suffix.content == CONTENT[-5:]
+    # A stale If-Range falls back to the full content
+    assert client.get(url, headers={"Range": "bytes=0-0", "If-Range": '"other"'}).status_code == 200
+
+    unsatisfiable = client.get(url, headers={"Range": f"bytes={len(CONTENT)}-"})
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["Content-Range"] == f"bytes */{len(CONTENT)}"
+
+def test_text_downloads_are_not_gzipped(client):
+    text = ("Contrato de locação residencial\n" * 500).encode()
+    document = upload(client, content=text, name="contrato.txt", mime_type="text/plain").json()
+    url = f"/api/v1/documents/{document['id']}/content"
+
+    partial = client.get(url, headers={"Accept-Encoding": "gzip", "Range": "bytes=100-199"})
+    assert partial.status_code == 206
+    assert "content-encoding" not in partial.headers
+    assert partial.content == text[100:200]
+    assert partial.headers["Content-Range"] == f"bytes 100-199/{len(text)}"
+
+    full = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in full.headers
+    assert full.headers["Content-Length"] == str(len(text))
+
+def test_downloads_can_be_handed_to_the_proxy(client, monkeypatch):
+    from config import settings
+    monkeypatch.setattr(settings, "document_accel_redirect_prefix", "/_blobs/")
+    document = upload(client).json()
+    url = f"/api/v1/documents/{document['id']}/content"
+
+    redirected = client.get(url, headers={"Range": "bytes=10-19"})
+    assert redirected.status_code == 200 and redirected.content == b""
+    assert redirected.headers["X-Accel-Redirect"] == f"/_blobs/{document['file_path']}"
+    assert redirected.headers["ETag"] == f'"{document["sha256"]}"'
+    assert "Content-Range" not in redirected.headers
+
+    # If-Range is checked against the content hash here, not by the proxy
+    resumed = client.get(url, headers={"Range": "bytes=10-19", "If-Range": f'"{document["sha256"]}"'})
+    assert resumed.status_code == 206 and resumed.content == CONTENT[10:20]
+    assert "X-Accel-Redirect" not in resumed.headers
+
+def test_head_sends_headers_only(client):
+    document = upload(client).json()
+    url = f"/api/v1/documents/{document['id']}/content"
+    head = client.head(url)
+    assert head.status_code == 200 and head.content == b""
+    assert head.headers["Content-Length"] == str(len(CONTENT))
+    assert head.headers["ETag"] == f'"{document["sha256"]}"'
+    partial = client.head(url, headers={"Range": "bytes=10-19"})
+    assert partial.status_code == 206 and partial.content == b""
+    assert partial.headers["Content-Range"] == f"bytes 10-19/{len(CONTENT)}"
+    assert client.head(f"/api/v1/documents/{document['id']}/thumbnail").status_code == 404
+
+def test_sweep_removes_unreferenced_blobs(client, app_db, call, admin):
+    first, second = upload(client).json(), upload(client).json()
+    path = blob_store.path_for(first["sha256"])
+
+    client.delete(f"/api/v1/documents/{first['id']}")
+    assert client.post("/api/v1/documents/storage/sweep", params={"grace_minutes": 0}).json()["blobs_removed"] == 0
+    assert os.path.exists(path)
+
+    client.delete(f"/api/v1/documents/{second['id']}")
+    record = blob(call, app_db, first["sha256"])
+    assert record["refcount"] == 0 and record["unreferenced_at"] is not None
+    # Still inside the grace period
+    assert client.post("/api/v1/documents/storage/sweep").json()["blobs_removed"] == 0
+
+    stats = client.post("/api/v1/documents/storage/sweep", params={"grace_minutes": 0}).json()
+    assert stats["blobs_removed"] == 1 and stats["bytes_reclaimed"] >= len(CONTENT)
+    assert not os.path.exists(path)
+    assert blob(call, app_db, first["sha256"]) is None
+    assert client.get("/api/v1/documents/storage/sweep").json()["blobs_removed"] == 1
+
+def test_metadata_only_documents_cannot_release_blobs(client, app_db, call, admin):
+    real = upload(client).json()
+    forged = client.post("/api/v1/documents/", json={
+        "name": "forged.bin", "type": "other", "file_path": real["file_path"], "file_size": len(CONTENT),
+        "mime_type": "application/octet-stream", "sha256": real["sha256"]
+    })
+    assert forged.status_code == 200, forged.text
+    assert forged.json()["sha256"] is None
+
+    client.delete(f"/api/v1/documents/{forged.json()['id']}")
+    assert blob(call, app_db, real["sha256"])["refcount"] == 1
+    assert client.post("/api/v1/documents/storage/sweep", params={"grace_minutes": 0}).json()["blobs_removed"] == 0
+    assert client.get(f"/api/v1/documents/{real['id']}/content").content == CONTENT
+
+def test_manual_sweep_takes_the_lease(client, app_db, call, admin):
+    call(app_db.leases.insert_one, {
+        "_id": "blob-sweep-run", "owner": "other-worker", "expires_at": datetime.utcnow() + timedelta(minutes=5)
+    })
+    assert client.post("/api/v1/documents/storage/sweep").status_code == 409
+    assert client.get("/api/v1/documents/storage/sweep").json() == {}
+
+    call(app_db.leases.delete_one, {"_id": "blob-sweep-run"})
+    stats = client.post("/api/v1/documents/storage/sweep").json()
+    # The result is shared through the database, and the run lease is given back
+    stored = call(app_db.jobs.find_one, {"_id": "blob-sweep"})
+    assert stored["blobs_removed"] == stats["blobs_removed"] and stored["worker"]
+    assert client.get("/api/v1/documents/storage/sweep").json()["worker"] == stored["worker"]
+    assert call(app_db.leases.find_one, {"_id": "blob-sweep-run"}) is None
+
+def test_sweep_requires_admin(client):
+    assert client.get("/api/v1/documents/storage/sweep").status_code == 403
+    assert client.post("/api/v1/documents/storage/sweep").status_code == 403
+
+class PausingBlobStore(BlobStore):
+    """Blocks in remove() until released, to interleave an upload with a sweep"""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.removing = threading.Event()
+        self.proceed = threading.Event()
+
+    def remove(self, sha256):
+        self.removing.set()
+        self.proceed.wait(5)
+        return super().remove(sha256)
+
+@pytest.mark.anyio
+async def test_upload_during_sweep_rewrites_the_blob(db, tmp_path, monkeypatch):
+    store = PausingBlobStore(str(tmp_path))
+    monkeypatch.setattr(storage, "blob_store", store)
+    sha256, _, _ = await store.save_upload(UploadFile(io.BytesIO(CONTENT), filename="a.bin"), db=db)
+    await release_blobs(db, [sha256])
+
+    sweep = asyncio.create_task(sweep_unreferenced_blobs(db, grace_minutes=0))
+    assert await asyncio.to_thread(store.removing.wait, 5)
+    # The record is claimed while the file is being unlinked
+    assert (await db.blobs.find_one({"sha256": sha256}))["deleting"] is True
+
+    again = asyncio.create_task(store.save_upload(UploadFile(io.BytesIO(CONTENT), filename="b.bin"), db=db))
+    await asyncio.sleep(0.2)
+    assert not again.done()
+
+    store.proceed.set()
+    assert (await sweep)["blobs_removed"] == 1
+    assert await again == (sha256, len(CONTENT), False)
+    assert store.exists(sha256)
+    record = await db.blobs.find_one({"sha256": sha256}, {"_id": 0})
+    assert record["refcount"] == 1 and "deleting" not in record
+
+    # Nothing left for a later sweep to take
+    assert (await sweep_unreferenced_blobs(db, grace_minutes=0))["blobs_removed"] == 0
+    assert store.exists(sha256)
+
+@pytest.mark.anyio
+async def test_abandoned_sweep_claims_expire(db, tmp_path, monkeypatch):
+    store = BlobStore(str(tmp_path))
+    monkeypatch.setattr(storage, "blob_store", store)
+    sha256, _, _ = await store.save_upload(UploadFile(io.BytesIO(CONTENT), filename="a.bin"), db=db)
+    await release_blobs(db, [sha256])
+    stale = storage.datetime.now() - storage.CLAIM_TIMEOUT * 2
+    await db.blobs.update_one({"sha256": sha256}, {"$set": {"deleting": True, "deleting_at": stale, "claim_id": "dead"}})
+
+    await store.save_upload(UploadFile(io.BytesIO(CONTENT), filename="b.bin"), db=db)
+    record = await db.blobs.find_one({"sha256": sha256}, {"_id": 0})
+    assert record["refcount"] == 1 and "deleting" not in record
+
+@pytest.mark.anyio
+async def test_failed_commit_releases_the_reference(db, tmp_path, monkeypatch):
+    store = BlobStore(str(tmp_path))
+    def failing_commit(tmp_path, sha256):
+        raise OSError("disk full")
+    monkeypatch.setattr(store, "_commit", failing_commit)
+    with pytest.raises(OSError):
+        await store.save_upload(UploadFile(io.BytesIO(CONTENT), filename="a.bin"), db=db)
+    (record,) = await db.blobs.find({}, {"_id": 0}).to_list(None)
+    assert record["refcount"] == 0 and record["unreferenced_at"] is not None
+    assert os.listdir(store.tmp_dir) == []
+
+@pytest.mark.anyio
+async def test_cascade_delete_releases_only_what_it_deleted(db, monkeypatch):
+    sha256 = "ab" * 32
+    await db.blobs.insert_one({"sha256": sha256, "refcount": 2, "unreferenced_at": None})
+    await db.documents.insert_many([
+        {"id": "a", "property_id": "p1", "sha256": sha256},
+        {"id": "b", "property_id": "p1", "sha256": sha256},
+        {"id": "plain", "property_id": "p1"}
+    ])
+    delete_many = db.documents.delete_many
+
+    async def racing_delete_many(filter_dict, **kwargs):
+        # Between the lookup and the delete, another request removes "a" and
+        # an upload adds "c" for the same property
+        await storage.delete_document_record(db, {"id": "a"})
+        await db.documents.insert_one({"id": "c", "property_id": "p1", "sha256": sha256})
+        await db.blobs.update_one({"sha256": sha256}, {"$inc": {"refcount": 1}})
+        monkeypatch.setattr(db.documents, "delete_many", delete_many)
+        return await delete_many(filter_dict, **kwargs)
+
+    monkeypatch.setattr(db.documents, "delete_many", racing_delete_many)
+    assert await storage.delete_documents(db, {"property_id": "p1"}) == 2
+    assert [doc["id"] async for doc in db.documents.find({}, {"id": 1})] == ["c"]
+    assert (await db.blobs.find_one({"sha256": sha256}))["refcount"] == 1
+
+    assert await storage.delete_document_record(db, {"id": "missing"}) is None
+    assert (await storage.delete_document_record(db, {"id": "c"}))["id"] == "c"
+    assert (await db.blobs.find_one({"sha256": sha256}))["refcount"] == 0
+
+def test_process_blob(tmp_path):
+    image_path = tmp_path / "scan"
+    Image.new("RGB", (800, 400), "navy").save(image_path, format="PNG")
+    assert process_blob(str(image_path), 128, 100) == {
+        "kind": "image", "thumbnail": True, "text_chars": 0, "keywords": [], "supported": True
+    }
+    with Image.open(f"{image_path}.thumb.png") as thumbnail:
+        assert thumbnail.size == (128, 64)
+
+    text_path = tmp_path / "notes"
+    text_path.write_text("contrato" * 20)
+    assert process_blob(str(text_path), 128, 50)["text_chars"] == 50
+    # Only the indexed prefix becomes keywords
+    text_path.write_text("Vistoria do imóvel\n" + "anexo " * 100 + "rodapé")
+    result = process_blob(str(text_path), 128, 1000, index_chars=40)
+    assert result["keywords"] == ["vistoria", "do", "imovel", "anexo"]
+    binary_path = tmp_path / "archive"
+    binary_path.write_bytes(CONTENT)
+    assert process_blob(str(binary_path), 128, 50) == {
+        "kind": None, "thumbnail": False, "text_chars": 0, "keywords": [], "supported": False
+    }
+
+def test_kind_comes_from_the_content(tmp_path):
+    path = tmp_path / "blob"
+    for content, kind in (
+        (b"%PDF-1.7\n", "pdf"), (b"\xff\xd8\xff\xe0", "image"), (b"RIFF\x00\x00\x00\x00WEBPVP8 ", "image"),
+        ("aluguel pago ✓".encode() * 1000, "text"), (b"\x00\x01", None), (b"", None),
+    ):
+        path.write_bytes(content)
+        assert detect_kind(str(path)) == kind
+
+def test_processing_ignores_the_declared_mime_type(client, app_db, call):
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), "red").save(buffer, format="PNG")
+    first = upload(client, content=buffer.getvalue(), name="scan.bin").json()
+    assert wait_for(lambda: client.get(f"/api/v1/documents/{first['id']}").json().get("has_thumbnail"))
+
+    # A blob marked unsupported from the declared type, before sniffing, is redone
+    call(app_db.blobs.update_one, {"sha256": first["sha256"]}, {"$set": {
+        "processing": {"status": "unsupported", "attempts": 1}, "has_thumbnail": False
+    }})
+    second = upload(client, content=buffer.getvalue(), name="scan.png", mime_type="image/png").json()
+    assert wait_for(lambda: client.get(f"/api/v1/documents/{second['id']}").json().get("has_thumbnail"))
+    assert blob(call, app_db, first["sha256"])["processing"]["kind"] == "image"
+
+def test_uploaded_images_get_thumbnails(client):
+    buffer = io.BytesIO()
+    Image.new("RGB", (640, 480), "green").save(buffer, format="PNG")
+    document = upload(client, content=buffer.getvalue(), name="foto.png", mime_type="image/png").json()
+
+    processed = wait_for(lambda: client.get(f"/api/v1/documents/{document['id']}").json().get("has_thumbnail"))
+    assert processed
+    thumbnail = client.get(f"/api/v1/documents/{document['id']}/thumbnail")
+    assert thumbnail.status_code == 200 and thumbnail.headers["content-type"] == "image/png"
+    listed = client.get("/api/v1/documents/").json()["items"][0]
+    assert listed["thumbnail_url"].endswith(f"/documents/{document['id']}/thumbnail")
+    assert listed["text_url"] is None
+
+def test_extracted_text_is_served(client):
+    text = "Contrato de locação\nCláusula primeira: aluguel mensal.\n"
+    binary = upload(client).json()
+    assert client.get(f"/api/v1/documents/{binary['id']}/text").status_code == 404
+
+    document = upload(client, content=text.encode(), name="contrato.txt", mime_type="text/plain").json()
+    assert wait_for(lambda: client.get(f"/api/v1/documents/{document['id']}").json().get("text_extracted"))
+    extracted = client.get(f"/api/v1/documents/{document['id']}/text")
+    assert extracted.status_code == 200 and extracted.text == text.strip()
+    assert extracted.headers["content-type"] == "text/plain; charset=utf-8"
+    assert client.get(
+        f"/api/v1/documents/{document['id']}/text", headers={"If-None-Match": extracted.headers["ETag"]}
+    ).status_code == 304
+    listed = client.get("/api/v1/documents/").json()["items"][0]
+    assert listed["text_url"].endswith(f"/documents/{document['id']}/text")
+
+def test_documents_are_searchable_by_name_and_text(client):
+    text = "Laudo de vistoria\nPintura e instalações elétricas em bom estado.\n"
+    document = upload(client, content=text.encode(), name="Laudo Março.txt", mime_type="text/plain").json()
+    assert wait_for(lambda: client.get(f"/api/v1/documents/{document['id']}").json().get("text_extracted"))
+    assert "search_keywords" not in client.get(f"/api/v1/documents/{document['id']}").json()
+
+    def found(q):
+        items = client.get("/api/v1/documents/", params={"q": q}).json()["items"]
+        assert all("search_keywords" not in item for item in items)
+        return [item["id"] for item in items]
+
+    assert found("marco") == [document["id"]]
+    assert found("INSTALA eletr") == [document["id"]]
+    assert found("telhado") == []
+    assert found("?!") == []
+
+    # A deduplicated upload picks up the words already extracted from the content
+    copy = upload(client, content=text.encode(), name="copia.txt", mime_type="text/plain").json()
+    assert sorted(found("pintura")) == sorted([document["id"], copy["id"]])
+    # Renaming keeps the text words
+    client.put(f"/api/v1/documents/{copy['id']}", json={"name": "Vistoria Abril.txt"})
+    assert found("abril") == found("abril pintura") == [copy["id"]]
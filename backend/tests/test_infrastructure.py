@@ -0,0 +1,306 @@
+"""
+Mongo client settings, health probes, leases, cross-worker cache
+invalidation and the dashboard WebSocket
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import dashboard_stream
+from cache import cached, invalidate_collections, query_cache
+from cache_sync import LocalInvalidationBus
+from config import settings
+from dashboard_stream import COUNTER_FIELDS, WATCHED_COLLECTIONS, DashboardHub, month_window
+from database import client_options, ensure_indexes, get_database, read_preference
+from document_processing import document_pipeline
+from leases import Lease
+from repository import create_client
+from storage import sweeper_lease
+from warmup import ReadinessProbe
+
+# Mongo client settings
+
+def test_client_options_from_settings(monkeypatch):
+    monkeypatch.setattr(settings, "mongo_wait_queue_timeout_ms", 0)
+    monkeypatch.setattr(settings, "mongo_socket_timeout_ms", 2500)
+    monkeypatch.setattr(settings, "mongo_compressors", "zlib")
+    options = client_options()
+    # 0 means "no timeout", which pymongo spells None
+    assert options["waitQueueTimeoutMS"] is None
+    assert options["socketTimeoutMS"] == 2500
+    assert options["compressors"] == "zlib"
+    assert options["readPreference"] == settings.mongo_read_preference
+    assert len(options["event_listeners"]) == 2
+
+def test_read_preference_with_staleness():
+    preference = read_preference("secondaryPreferred", 120)
+    assert preference.mongos_mode == "secondaryPreferred"
+    assert preference.max_staleness == 120
+    assert read_preference("primary").max_staleness == -1
+
+@pytest.mark.anyio
+async def test_a_failing_index_does_not_skip_the_others():
+    database = create_client("memory")["sismobi_indexes"]
+    await database.alerts.insert_many([{"dedup_key": "k"}, {"dedup_key": "k"}])
+    with pytest.raises(RuntimeError, match="alerts"):
+        await ensure_indexes(database)
+    assert "sha256_1" in await database.blobs.index_information()
+    assert "updated_at_1" in await database.alerts.index_information()
+
+# Health probes
+
+def test_liveness_and_readiness(client):
+    assert client.get("/livez").json() == {"status": "alive"}
+    deadline = time.monotonic() + 5
+    while (response := client.get("/readyz")).status_code != 200 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert response.json() == {"ready": True, "warmed": True, "draining": False, "database": "connected"}
+    assert client.get("/api/health").json()["database_status"] == "connected"
+
+def test_readiness_probe_survives_a_new_event_loop():
+    # Each lifespan (e.g. consecutive TestClient sessions) runs on its own loop
+    probe = ReadinessProbe(cache_seconds=60, timeout_seconds=1)
+    database = create_client("memory")["readiness"]
+    assert asyncio.run(probe.database_ok(database))
+    first_lock = probe._lock
+
+    probe.reset()
+    assert asyncio.run(probe.database_ok(database))
+    assert probe._lock is not first_lock
+
+# Leases
+
+@pytest.mark.anyio
+async def test_lease_is_exclusive_until_released_or_expired(db):
+    first = Lease("job", ttl_seconds=60, owner="worker-a")
+    second = Lease("job", ttl_seconds=60, owner="worker-b")
+    assert await first.acquire(db)
+    assert not await second.acquire(db)
+    # Renewal by the holder
+    assert await first.acquire(db)
+
+    await first.release(db)
+    assert not first.held
+    assert await second.acquire(db)
+
+    # An expired lease can be taken over
+    await db.leases.update_one({"_id": "job"}, {"$set": {"expires_at": datetime.utcnow() - timedelta(seconds=1)}})
+    assert await first.acquire(db)
+    assert not await second.acquire(db)
+
+@pytest.mark.anyio
+async def test_release_does_not_drop_a_lease_taken_over(db):
+    first = Lease("job", ttl_seconds=60, owner="worker-a")
+    assert await first.acquire(db)
+    await db.leases.update_one({"_id": "job"}, {"$set": {"owner": "worker-b"}})
+    await first.release(db)
+    assert (await db.leases.find_one({"_id": "job"}))["owner"] == "worker-b"
+
+def test_shutdown_releases_leases(app):
+    with TestClient(app) as test_client:
+        db = get_database()
+        assert test_client.portal.call(sweeper_lease.acquire, db)
+        leases = lambda: test_client.portal.call(lambda: db.leases.distinct("_id"))
+        for _ in range(100):
+            if "document-rescan" in leases():
+                break
+            time.sleep(0.01)
+        assert sorted(leases()) == ["blob-sweeper", "document-rescan"]
+    assert not sweeper_lease.held and not document_pipeline._rescan_lease.held
+    assert asyncio.run(db.leases.count_documents({})) == 0
+
+# Cross-worker cache invalidation
+
+@pytest.mark.anyio
+async def test_values_loaded_across_a_write_are_not_cached():
+    async def load_during_write():
+        invalidate_collections("properties")
+        return ["stale"]
+
+    async def load():
+        return ["fresh"]
+
+    try:
+        assert await cached("props", ["properties"], load_during_write) == ["stale"]
+        assert query_cache.get("props") is None
+        assert await cached("props", ["properties"], load) == ["fresh"]
+        assert query_cache.get("props") == ["fresh"]
+    finally:
+        query_cache.clear()
+
+@pytest.mark.anyio
+async def test_local_bus_invalidates_peers(tmp_path):
+    sender, receiver = LocalInvalidationBus(str(tmp_path)), LocalInvalidationBus(str(tmp_path))
+    # Both live in this process; give the receiver its own socket
+    receiver.path = str(tmp_path / "peer.sock")
+    sender.start()
+    receiver.start()
+    try:
+        query_cache.set("props", [1], depends_on=["properties"])
+        query_cache.set("tenants", [2], depends_on=["tenants"])
+        sender.publish(("properties",))
+        for _ in range(100):
+            if query_cache.get("props") is None:
+                break
+            await asyncio.sleep(0.01)
+        assert query_cache.get("props") is None
+        assert query_cache.get("tenants") == [2]
+
+        # Sockets of dead workers are cleaned up on the next publish
+        stale = tmp_path / "12345.sock"
+        stale.touch()
+        sender.publish(("tenants",))
+        assert not stale.exists()
+    finally:
+        sender.stop()
+        receiver.stop()
+        query_cache.clear()
+
+# Dashboard WebSocket
+
+def _hub():
+    hub = DashboardHub(push_interval=1, poll_interval=1, queue_size=4)
+    hub._month = month_window(datetime(2024, 5, 15))
+    hub._contributions = {name: {} for name in WATCHED_COLLECTIONS}
+    hub._counters = dict.fromkeys(COUNTER_FIELDS, 0)
+    return hub
+
+def _change(collection, _id, document=None):
+    return {"ns": {"coll": collection}, "documentKey": {"_id": _id}, "fullDocument": document}
+
+def test_hub_folds_change_events():
+    hub = _hub()
+    house, payment, alert = ObjectId(), ObjectId(), ObjectId()
+    hub._apply(_change("properties", house, {"_id": house, "status": "vacant"}))
+    hub._apply(_change("transactions", payment, {"_id": payment, "type": "income", "amount": 900.0, "date": datetime(2024, 5, 3)}))
+    hub._apply(_change("alerts", alert, {"_id": alert, "id": "a1", "resolved": False}))
+    assert hub._counters["vacant_properties"] == 1 and hub._counters["total_monthly_income"] == 900.0
+    assert hub._counters["pending_alerts"] == 1
+
+    # An update swaps the old contribution for the new one
+    hub._apply(_change("properties", house, {"_id": house, "status": "rented"}))
+    hub._apply(_change("transactions", payment, {"_id": payment, "type": "income", "amount": 900.0, "date": datetime(2024, 4, 30)}))
+    assert (hub._counters["vacant_properties"], hub._counters["occupied_properties"]) == (0, 1)
+    assert hub._counters["total_properties"] == 1
+    assert hub._counters["total_monthly_income"] == 0
+
+    # Deletes carry no document
+    hub._apply(_change("alerts", alert))
+    assert hub._counters["pending_alerts"] == 0
+    assert hub._alerts_deleted == {"a1"} and hub._alerts_upserted == {}
+    assert hub._recent_dirty
+
+class FakeStream:
+    """Change stream yielding the given events, then waiting forever"""
+
+    def __init__(self, changes):
+        self.changes = list(changes)
+        self.resume_token = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.changes:
+            await asyncio.Event().wait()
+        return self.changes.pop(0)
+
+    async def try_next(self):
+        return None
+
+@pytest.mark.anyio
+async def test_stream_loop_reloads_after_an_unexpected_error(db, monkeypatch):
+    await db.properties.insert_many([{"id": "p1", "status": "vacant"}, {"id": "p2", "status": "rented"}])
+    hub = DashboardHub(push_interval=1, poll_interval=1, queue_size=4)
+    hub._db = db
+    await hub._load()
+    monkeypatch.setattr(dashboard_stream, "_RELOAD_DELAY_SECONDS", 0)
+    monkeypatch.setattr(hub, "_watch", lambda resume_token=None: FakeStream([]))
+
+    hub._counters["total_properties"] = 99
+    # An event the folding cannot handle (unwatched collection) must not end the loop
+    task = asyncio.create_task(hub._stream_loop(FakeStream([_change("unknown", ObjectId(), {})])))
+    try:
+        for _ in range(100):
+            if hub._counters["total_properties"] == 2:
+                break
+            await asyncio.sleep(0.01)
+        assert hub._counters["total_properties"] == 2
+        assert not task.done()
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+@pytest.mark.anyio
+async def test_hub_keeps_only_pending_alerts(db):
+    await db.alerts.insert_many([
+        {"id": "open", "resolved": False}, *({"id": f"done{i}", "resolved": True} for i in range(5))
+    ])
+    hub = DashboardHub(push_interval=1, poll_interval=1, queue_size=4)
+    hub._db = db
+    await hub._load()
+    assert hub._counters["pending_alerts"] == 1
+    assert list(hub._alert_ids.values()) == ["open"] and len(hub._contributions["alerts"]) == 1
+
+    # Resolving an alert pushes it once, then forgets it
+    (_id,) = hub._alert_ids
+    hub._apply(_change("alerts", _id, {"_id": _id, "id": "open", "resolved": True}))
+    assert hub._counters["pending_alerts"] == 0
+    assert hub._alert_ids == {} and hub._contributions["alerts"] == {}
+    assert hub._alerts_upserted["open"]["resolved"] is True
+
+def test_alerts_without_id_are_counted_but_not_pushed():
+    hub = _hub()
+    alert = ObjectId()
+    hub._apply(_change("alerts", alert, {"_id": alert, "resolved": False}))
+    assert hub._counters["pending_alerts"] == 1 and hub._alerts_upserted == {}
+
+def test_dashboard_websocket_pushes_changes(client):
+    with client.websocket_connect("/api/v1/dashboard/ws") as websocket:
+        websocket.send_json({"type": "auth", "token": client.token})
+        snapshot = websocket.receive_json()
+        assert snapshot["type"] == "snapshot"
+        assert snapshot["data"]["total_properties"] == 0
+
+        response = client.post("/api/v1/properties/", json={
+            "name": "Casa Jardim", "address": "Av. das Palmeiras, 456", "type": "Casa",
+            "size": 120.0, "rooms": 3, "rent_value": 2500.0
+        })
+        assert response.status_code == 200
+        message = websocket.receive_json()
+        assert message["type"] == "diff"
+        assert message["changes"]["total_properties"] == 1
+        assert message["changes"]["vacant_properties"] == 1
+
+@pytest.mark.parametrize("first_message", [
+    {"type": "auth", "token": "nope"},
+    {"type": "subscribe"},
+    "not json",
+])
+def test_dashboard_websocket_requires_an_auth_message(client, first_message):
+    with pytest.raises(WebSocketDisconnect) as error:
+        with client.websocket_connect("/api/v1/dashboard/ws") as websocket:
+            if isinstance(first_message, dict):
+                websocket.send_json(first_message)
+            else:
+                websocket.send_text(first_message)
+            websocket.receive_json()
+    assert error.value.code == 1008
+
+def test_dashboard_websocket_ignores_tokens_in_the_url(client, monkeypatch):
+    monkeypatch.setattr(settings, "dashboard_auth_timeout_seconds", 0.1)
+    with pytest.raises(WebSocketDisconnect) as error:
+        with client.websocket_connect(f"/api/v1/dashboard/ws?token={client.token}") as websocket:
+            websocket.receive_json()
+    assert error.value.code == 1008
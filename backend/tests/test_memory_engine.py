@@ -0,0 +1,258 @@
+"""
+In-memory engine (memory_engine.py) against the query, update, index and
+aggregation features the routers rely on
+"""
+from datetime import datetime
+from typing import Generic, Protocol
+import inspect
+
+import pytest
+from motor.motor_asyncio import (
+    AsyncIOMotorChangeStream, AsyncIOMotorClient, AsyncIOMotorCollection, AsyncIOMotorCursor,
+    AsyncIOMotorDatabase, AsyncIOMotorLatentCommandCursor,
+)
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+from memory_engine import MemoryAggregationCursor, MemoryClient, MemoryCollection, MemoryCursor, MemoryDatabase
+from repository import create_client
+import repository
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+async def properties(db):
+    await db.properties.insert_many([
+        {"id": "p1", "name": "Casa Jardim", "status": "rented", "rent_value": 2500.0, "tags": ["garden", "pool"], "address": {"city": "Recife"}},
+        {"id": "p2", "name": "Apartamento Centro", "status": "vacant", "rent_value": 1500.0, "tags": ["center"], "address": {"city": "Olinda"}},
+        {"id": "p3", "name": "Casa Praia", "status": "rented", "rent_value": 3200.0, "tags": [], "address": {"city": "Recife"}},
+        {"id": "p4", "name": "Sala Comercial", "status": "maintenance", "rent_value": 900.0},
+    ])
+    return db.properties
+
+async def ids(cursor):
+    return [document["id"] async for document in cursor]
+
+async def test_create_client_memory():
+    assert isinstance(create_client("memory"), MemoryClient)
+    with pytest.raises(ValueError):
+        create_client("sqlite")
+
+async def test_filters(properties):
+    assert await ids(properties.find({"status": "rented"})) == ["p1", "p3"]
+    assert await ids(properties.find({"status": {"$in": ["vacant", "maintenance"]}})) == ["p2", "p4"]
+    assert await ids(properties.find({"status": {"$ne": "rented"}})) == ["p2", "p4"]
+    assert await ids(properties.find({"rent_value": {"$gte": 1500, "$lt": 3200}})) == ["p1", "p2"]
+    assert await ids(properties.find({"name": {"$regex": "^casa", "$options": "i"}})) == ["p1", "p3"]
+    assert await ids(properties.find({"tags": "pool"})) == ["p1"]
+    assert await ids(properties.find({"tags": {"$size": 0}})) == ["p3"]
+    assert await ids(properties.find({"address.city": "Recife"})) == ["p1", "p3"]
+    assert await ids(properties.find({"address": {"$exists": False}})) == ["p4"]
+    assert await ids(properties.find({"$or": [{"status": "vacant"}, {"rent_value": {"$gt": 3000}}]})) == ["p2", "p3"]
+    assert await ids(properties.find({"$expr": {"$gt": ["$rent_value", 2000]}})) == ["p1", "p3"]
+
+async def test_missing_field_semantics(properties):
+    # Missing fields match null and $ne, like MongoDB
+    assert await ids(properties.find({"address": None})) == ["p4"]
+    assert await ids(properties.find({"address.city": {"$ne": "Recife"}})) == ["p2", "p4"]
+
+async def test_projection_sort_skip_limit(properties):
+    cursor = properties.find({}, {"_id": 0, "id": 1, "rent_value": 1}).sort("rent_value", -1).skip(1).limit(2)
+    assert await cursor.to_list(None) == [{"id": "p1", "rent_value": 2500.0}, {"id": "p2", "rent_value": 1500.0}]
+    assert await properties.count_documents({"status": "rented"}) == 2
+    assert sorted(await properties.distinct("tags")) == ["center", "garden", "pool"]
+
+async def test_results_are_copies(properties):
+    document = await properties.find_one({"id": "p1"})
+    document["tags"].append("changed")
+    assert (await properties.find_one({"id": "p1"}))["tags"] == ["garden", "pool"]
+
+async def test_unique_index(db):
+    await db.users.create_index("email", unique=True)
+    await db.users.insert_one({"email": "a@b.com"})
+    with pytest.raises(DuplicateKeyError):
+        await db.users.insert_one({"email": "a@b.com"})
+    await db.users.insert_one({"email": "c@d.com"})
+    with pytest.raises(DuplicateKeyError):
+        await db.users.update_one({"email": "c@d.com"}, {"$set": {"email": "a@b.com"}})
+    # A non-sparse unique index treats a missing field as null, once
+    await db.users.insert_one({"name": "no email"})
+    with pytest.raises(DuplicateKeyError):
+        await db.users.insert_one({"name": "no email either"})
+
+async def test_sparse_unique_index(db):
+    await db.alerts.create_index("dedup_key", unique=True, sparse=True)
+    await db.alerts.insert_many([{"title": "a"}, {"title": "b"}])
+    await db.alerts.insert_one({"dedup_key": "k"})
+    with pytest.raises(DuplicateKeyError):
+        await db.alerts.insert_one({"dedup_key": "k"})
+    assert await db.alerts.count_documents({"dedup_key": None}) == 2
+
+async def test_compound_unique_index(db):
+    await db.bills.create_index([("group_id", 1), ("month", 1)], unique=True)
+    await db.bills.insert_one({"group_id": "g", "month": 1})
+    await db.bills.insert_one({"group_id": "g", "month": 2})
+    with pytest.raises(DuplicateKeyError):
+        await db.bills.insert_one({"group_id": "g", "month": 1})
+
+async def test_unique_index_build_fails_on_duplicates(db):
+    await db.users.insert_many([{"email": "a@b.com"}, {"email": "a@b.com"}])
+    with pytest.raises(DuplicateKeyError):
+        await db.users.create_index("email", unique=True)
+    assert "email_1" not in await db.users.index_information()
+
+async def test_update_operators(properties):
+    await properties.update_one({"id": "p1"}, {
+        "$set": {"address.city": "Olinda"},
+        "$inc": {"rent_value": 100, "visits": 1},
+        "$push": {"tags": "view"},
+        "$addToSet": {"owners": {"$each": ["ana", "ana", "bia"]}},
+        "$unset": {"status": ""},
+    })
+    document = await properties.find_one({"id": "p1"}, {"_id": 0})
+    assert document["address"] == {"city": "Olinda"}
+    assert document["rent_value"] == 2600.0 and document["visits"] == 1
+    assert document["tags"] == ["garden", "pool", "view"]
+    assert document["owners"] == ["ana", "bia"]
+    assert "status" not in document
+
+    result = await properties.update_many({"status": "rented"}, {"$max": {"rent_value": 3000}})
+    # p1 lost its status above; p3 is matched but already above 3000
+    assert (result.matched_count, result.modified_count) == (1, 0)
+    result = await properties.update_many({"tags": "pool"}, {"$pull": {"tags": "pool"}})
+    assert (result.matched_count, result.modified_count) == (1, 1)
+    assert (await properties.find_one({"id": "p1"}))["tags"] == ["garden", "view"]
+
+async def test_upsert_seeds_equality_fields(db):
+    now = datetime(2024, 1, 1)
+    result = await db.blobs.update_one(
+        {"sha256": "abc", "deleting": {"$ne": True}},
+        {"$inc": {"refcount": 1}, "$setOnInsert": {"created_at": now}},
+        upsert=True
+    )
+    assert result.upserted_id is not None
+    document = await db.blobs.find_one({"sha256": "abc"}, {"_id": 0})
+    # Operator conditions are not copied into the new document
+    assert document == {"sha256": "abc", "refcount": 1, "created_at": now}
+
+    await db.blobs.update_one({"sha256": "abc"}, {"$inc": {"refcount": 1}, "$setOnInsert": {"created_at": None}}, upsert=True)
+    assert await db.blobs.find_one({"sha256": "abc"}, {"_id": 0}) == {"sha256": "abc", "refcount": 2, "created_at": now}
+
+async def test_upsert_conflicting_with_unique_index(db):
+    await db.leases.insert_one({"_id": "job", "owner": "a"})
+    with pytest.raises(DuplicateKeyError):
+        await db.leases.update_one({"_id": "job", "owner": "b"}, {"$set": {"owner": "b"}}, upsert=True)
+
+async def test_find_one_and_update(db):
+    await db.counters.insert_one({"_id": "n", "value": 1})
+    before = await db.counters.find_one_and_update({"_id": "n"}, {"$inc": {"value": 1}})
+    after = await db.counters.find_one_and_update({"_id": "n"}, {"$inc": {"value": 1}}, return_document=ReturnDocument.AFTER)
+    assert (before["value"], after["value"]) == (1, 3)
+    created = await db.counters.find_one_and_update(
+        {"_id": "m"}, {"$set": {"value": 0}}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+    assert created == {"_id": "m", "value": 0}
+
+async def test_bulk_write_reports_duplicates(db):
+    await db.alerts.create_index("dedup_key", unique=True, sparse=True)
+    await db.alerts.insert_one({"dedup_key": "a", "title": "old"})
+    with pytest.raises(BulkWriteError) as error:
+        await db.alerts.bulk_write([
+            UpdateOne({"dedup_key": "b"}, {"$setOnInsert": {"title": "new"}}, upsert=True),
+            UpdateOne({"dedup_key": "c", "title": "x"}, {"$set": {"dedup_key": "a"}}, upsert=True),
+        ], ordered=False)
+    details = error.value.details
+    assert details["nUpserted"] == 1
+    assert [e["index"] for e in details["writeErrors"]] == [1]
+
+async def test_group_and_date_operators(db):
+    await db.bills.insert_many([
+        {"group_id": "g", "amount": 100.0, "reading_date": datetime(2024, 1, 10)},
+        {"group_id": "g", "amount": 50.0, "reading_date": datetime(2024, 1, 20)},
+        {"group_id": "g", "amount": 70.0, "reading_date": datetime(2024, 2, 5)},
+        {"group_id": "h", "amount": 10.0, "reading_date": datetime(2024, 2, 5)},
+    ])
+    rows = await db.bills.aggregate([
+        {"$match": {"group_id": "g"}},
+        {"$group": {"_id": {"month": {"$month": "$reading_date"}}, "total": {"$sum": "$amount"}, "bills": {"$sum": 1}, "avg": {"$avg": "$amount"}}},
+        {"$sort": {"_id.month": 1}},
+        {"$project": {"_id": 0, "month": "$_id.month", "total": 1, "bills": 1, "avg": {"$round": ["$avg", 1]}}},
+    ]).to_list(None)
+    assert rows == [{"total": 150.0, "bills": 2, "avg": 75.0, "month": 1}, {"total": 70.0, "bills": 1, "avg": 70.0, "month": 2}]
+
+async def test_facet_count_and_page(properties):
+    (result,) = await properties.aggregate([
+        {"$match": {"status": {"$ne": "maintenance"}}},
+        {"$facet": {
+            "total": [{"$count": "count"}],
+            "page": [{"$sort": {"rent_value": -1}}, {"$skip": 1}, {"$limit": 1}, {"$project": {"_id": 0, "id": 1}}],
+            "by_status": [{"$group": {"_id": "$status", "n": {"$sum": 1}}}, {"$sort": {"_id": 1}}],
+        }},
+    ]).to_list(None)
+    assert result["total"] == [{"count": 3}]
+    assert result["page"] == [{"id": "p1"}]
+    assert result["by_status"] == [{"_id": "rented", "n": 2}, {"_id": "vacant", "n": 1}]
+
+async def test_facet_on_empty_input(db):
+    (result,) = await db.empty.aggregate([{"$facet": {"total": [{"$count": "count"}], "page": [{"$limit": 5}]}}]).to_list(None)
+    assert result == {"total": [], "page": []}
+
+async def test_unwind_and_conditional_sum(properties):
+    rows = await properties.aggregate([
+        {"$unwind": "$tags"},
+        {"$group": {"_id": None, "tags": {"$sum": 1}, "pool": {"$sum": {"$cond": [{"$eq": ["$tags", "pool"]}, 1, 0]}}}},
+    ]).to_list(None)
+    # Empty arrays and missing fields produce no rows
+    assert rows == [{"_id": None, "tags": 3, "pool": 1}]
+
+async def test_sort_orders_mixed_types_like_mongo(db):
+    await db.mixed.insert_many([{"v": "b"}, {"v": 2}, {"v": None}, {"v": 1.5}, {}])
+    values = [document.get("v", "missing") async for document in db.mixed.find({}).sort("v", 1)]
+    assert values == [None, "missing", 1.5, 2, "b"]
+
+async def test_unsupported_features_fail_loudly(db):
+    with pytest.raises(OperationFailure):
+        await db.x.find({"a": {"$where": "1"}}).to_list(None)
+    with pytest.raises(OperationFailure):
+        await db.x.aggregate([{"$lookup": {}}]).to_list(None)
+    with pytest.raises(OperationFailure) as error:
+        db.watch()
+    assert error.value.code == 40573
+
+async def test_commands(db):
+    assert (await db.command("ping"))["ok"] == 1.0
+    await db.x.insert_one({})
+    assert (await db.command("dbStats"))["objects"] >= 1
+
+def protocol_members(protocol):
+    """Methods and attributes a repository protocol declares, including inherited ones"""
+    members = {}
+    for klass in reversed(protocol.__mro__):
+        if klass in (object, Protocol, Generic):
+            continue
+        members.update((name, None) for name in getattr(klass, "__annotations__", {}))
+        members.update(
+            (name, value) for name, value in vars(klass).items()
+            if callable(value) and (not name.startswith("_") or name in ("__getitem__", "__getattr__", "__aiter__", "__aenter__", "__aexit__"))
+        )
+    return members
+
+@pytest.mark.parametrize("protocol, motor_class, memory_class", [
+    (repository.Cursor, AsyncIOMotorCursor, MemoryCursor),
+    (repository.AggregationCursor, AsyncIOMotorLatentCommandCursor, MemoryAggregationCursor),
+    (repository.ChangeStream, AsyncIOMotorChangeStream, None),
+    (repository.Collection, AsyncIOMotorCollection, MemoryCollection),
+    (repository.Database, AsyncIOMotorDatabase, MemoryDatabase),
+    (repository.Client, AsyncIOMotorClient, MemoryClient),
+])
+async def test_engines_implement_repository_protocols(protocol, motor_class, memory_class):
+    for name, declared in protocol_members(protocol).items():
+        assert hasattr(motor_class, name), f"{motor_class.__name__} lacks {protocol.__name__}.{name}"
+        if memory_class is None or declared is None:
+            continue
+        implemented = getattr(memory_class, name, None)
+        assert implemented is not None, f"{memory_class.__name__} lacks {protocol.__name__}.{name}"
+        # Motor wraps its methods at class creation, so only the in-memory engine can be checked for async-ness
+        assert inspect.iscoroutinefunction(implemented) == inspect.iscoroutinefunction(declared), (
+            f"{memory_class.__name__}.{name} should {'' if inspect.iscoroutinefunction(declared) else 'not '}be a coroutine"
+        )
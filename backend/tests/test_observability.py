@@ -0,0 +1,170 @@
+"""
+Prometheus metrics, Mongo command monitoring and request profiling
+"""
+import json
+import os
+from collections import Counter
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import metrics
+import profiling
+from config import settings
+from conftest import TEST_USER_EMAIL
+from db_monitoring import command_shape, normalize_shape
+from metrics import MetricsRegistry
+from metrics_sync import MetricsSync, archive_worker
+from profiling import ProfileStore, ProfilingMiddleware
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", ("route",))
+    latency = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    requests.inc("/a")
+    requests.inc("/a")
+    latency.observe(0.05, "/a")
+    latency.observe(0.5, "/a")
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{route="/a"} 2' in text
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 2' in text
+    assert 'latency_seconds_count{route="/a"} 2' in text
+
+@pytest.mark.anyio
+async def test_metrics_sync_merges_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "web_workers", 2)
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", ("route",))
+    in_flight = registry.gauge("in_flight", "In flight")
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1,))
+    monkeypatch.setattr(metrics, "registry", registry)
+    requests.inc("/a", amount=2)
+    in_flight.inc()
+    latency.observe(0.05)
+    # Another worker, which has since exited, and a live one
+    for name in ("4001-dead.json", "4002-live.json"):
+        (tmp_path / name).write_text(json.dumps({
+            "samples": {"requests_total": [[["/a"], 3]], "in_flight": [[[], 1]], "latency_seconds": [[[], [0, 1], 0.5]]},
+            "gauges": ["in_flight"]
+        }))
+    archive_worker(str(tmp_path), 4001)
+    assert not (tmp_path / "4001-dead.json").exists()
+
+    sync = MetricsSync(str(tmp_path), interval=60)
+    await sync.start()
+    try:
+        text = registry.render(sync.snapshots(), local=False)
+    finally:
+        await sync.stop()
+    assert 'requests_total{route="/a"} 8' in text
+    # The exited worker's gauge is dropped
+    assert "in_flight 2" in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert metrics.snapshot_source is None
+
+def test_metrics_label_routes_by_template(client, property_id):
+    assert client.get(f"/api/v1/properties/{property_id}").status_code == 200
+    text = client.get("/metrics").text
+    assert 'route="/api/v1/properties/{property_id}"' in text
+    assert property_id not in text
+    assert "sismobi_http_requests_in_flight" in text
+
+def test_command_shape_drops_literals_and_session_fields():
+    command = {
+        "find": "tenants",
+        "filter": {"status": "active", "id": {"$in": ["a", "b", "c"]}},
+        "sort": {"contract_end_date": 1},
+        "lsid": {"id": "x"},
+        "$db": "sismobi",
+    }
+    assert command_shape("find", command) == {
+        "filter": {"status": "?", "id": {"$in": ["?"]}},
+        "sort": {"contract_end_date": "?"},
+    }
+    assert normalize_shape([]) == []
+    deep = {"a": {"b": {"c": {"d": {"e": {"f": {"g": {"h": 1}}}}}}}}
+    assert "..." in repr(normalize_shape(deep))
+
+def test_aggregate_shape_keeps_every_stage_and_branch():
+    command = {
+        "aggregate": "transactions",
+        "pipeline": [
+            {"$match": {"$or": [{"type": "income"}, {"amount": {"$gt": 100}}], "property_id": {"$in": ["a", "b"]}}},
+            {"$group": {"_id": "$category", "total": {"$sum": "$amount"}}},
+            {"$sort": {"total": -1}},
+        ],
+    }
+    assert command_shape("aggregate", command) == {
+        "pipeline": [
+            {"$match": {"$or": [{"type": "?"}, {"amount": {"$gt": "?"}}], "property_id": {"$in": ["?"]}}},
+            {"$group": {"_id": "?", "total": {"$sum": "?"}}},
+            {"$sort": {"total": "?"}},
+        ],
+    }
+
+def test_profile_store_round_trip(tmp_path):
+    store = ProfileStore(str(tmp_path))
+    profile_id = store.save("/api/v1/reports/{kind}", "GET", 200, 0.25, Counter({"main;handler": 3, "main": 1}))
+    assert profile_id.startswith("api_v1_reports_kind__")
+    (entry,) = store.list()
+    assert entry["id"] == profile_id and entry["samples"] == "4" and entry["status"] == "200"
+    with open(store.path_for(profile_id)) as f:
+        assert "main;handler 3" in f.read()
+    for forged in ("../../etc/passwd", "..__20240101T000000_abcdef12", "...", "x__..", profile_id + "/..", "_x__20240101T000000_abcdef12"):
+        assert store.path_for(forged) is None
+    assert store.list(route="/other") == []
+
+def test_profile_store_keeps_the_newest_per_route(tmp_path):
+    store = ProfileStore(str(tmp_path), max_per_route=3)
+    saved = [store.save("/a", "GET", 200, 0.01, Counter({"main": 1})) for _ in range(3)]
+    for age, profile_id in enumerate(saved):
+        os.utime(store.path_for(profile_id), (1_000_000 + age, 1_000_000 + age))
+    store.save("/b", "GET", 200, 0.01, Counter({"main": 1}))
+    newest = store.save("/a", "GET", 200, 0.01, Counter({"main": 1}))
+    assert store.path_for(saved[0]) is None
+    assert {entry["id"] for entry in store.list(route="/a")} == {saved[1], saved[2], newest}
+    assert len(store.list(route="/b")) == 1
+
+@pytest.fixture
+def profiled_app(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "profile_store", ProfileStore(str(tmp_path)))
+    monkeypatch.setattr(settings, "profiling_token", "secret")
+    monkeypatch.setattr(settings, "profiling_routes", ["/slow"])
+    app = FastAPI()
+
+    @app.get("/slow")
+    async def slow():
+        return {"ok": True}
+
+    @app.get("/fast")
+    async def fast():
+        return {"ok": True}
+
+    app.add_middleware(ProfilingMiddleware)
+    return app
+
+def test_profiling_selects_routes_and_token(profiled_app):
+    with TestClient(profiled_app) as test_client:
+        test_client.get("/fast")
+        assert profiling.profile_store.list() == []
+        test_client.get("/fast", headers={"X-Profile": "wrong"})
+        assert profiling.profile_store.list() == []
+        test_client.get("/fast", headers={"X-Profile": "secret"})
+        test_client.get("/slow")
+    routes = sorted(entry["route"] for entry in profiling.profile_store.list())
+    assert routes == ["/fast", "/slow"]
+
+def test_admin_profiles_require_admin(client, monkeypatch, tmp_path):
+    store = ProfileStore(str(tmp_path))
+    profile_id = store.save("/x", "GET", 200, 0.01, Counter({"a;b": 1}))
+    monkeypatch.setattr("routers.admin.profile_store", store)
+    assert client.get("/api/v1/admin/profiles").status_code == 403
+
+    monkeypatch.setattr(settings, "admin_emails", [TEST_USER_EMAIL])
+    listing = client.get("/api/v1/admin/profiles").json()
+    assert [item["id"] for item in listing["items"]] == [profile_id]
+    assert client.get(f"/api/v1/admin/profiles/{profile_id}").text.endswith("a;b 1\n")
+    assert client.get("/api/v1/admin/profiles/missing__x").status_code == 404
@@ -0,0 +1,177 @@
+"""
+PDF reports, typeahead lookups and report history
+"""
+import subprocess
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+import reports
+from conftest import BACKEND_DIR
+from report_history import get_latency_summary
+from leases import JOBS_COLLECTION, Lease
+from utils import SEARCH_KEYWORDS_BACKFILL_ID, backfill_search_keywords, run_search_keywords_backfill
+
+@pytest.fixture
+def ledger(client, app_db, call, property_id):
+    """60 transactions over the last three months plus two tenants"""
+    now = datetime.now()
+    call(app_db.transactions.insert_many, [
+        {
+            "id": f"t{i}", "property_id": property_id, "description": f"Lançamento {i}",
+            "amount": 100.0 + i, "type": "income" if i % 3 else "expense",
+            "category": ["Aluguel", "Manutenção", "Condomínio"][i % 3],
+            "date": now - timedelta(days=i * 1.5), "created_at": now, "updated_at": now
+        }
+        for i in range(60)
+    ])
+    call(app_db.tenants.insert_many, [
+        {"id": "tn1", "name": "Maria Silva", "email": "maria@example.com", "phone": "81", "status": "active",
+         "property_id": property_id, "created_at": now, "updated_at": now},
+        {"id": "tn2", "name": "João Souza", "email": "joao@example.com", "phone": "81", "status": "inactive",
+         "created_at": now, "updated_at": now},
+    ])
+    # Written without search_keywords, like data from before the lookup index
+    call(backfill_search_keywords, app_db)
+    return property_id
+
+def test_importing_reports_does_not_load_reportlab():
+    code = "import sys, routers.reports; print('reportlab' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == "False"
+
+@pytest.mark.parametrize("path", [
+    "/api/v1/reports/financial",
+    "/api/v1/reports/financial?stream=true",
+    "/api/v1/reports/tenants",
+    "/api/v1/reports/tenants?stream=true",
+    "/api/v1/reports/properties",
+    "/api/v1/reports/comprehensive",
+    "/api/v1/reports/quick-financial?period=last_90_days",
+])
+def test_reports_render_pdfs(client, ledger, path):
+    response = client.get(path)
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/pdf"
+    assert response.content.startswith(b"%PDF")
+
+def test_invalid_report_parameters(client):
+    assert client.get("/api/v1/reports/quick-financial?period=forever").status_code == 400
+    assert client.get("/api/v1/reports/financial?start_date=yesterday").status_code == 400
+
+def test_streaming_report_batches_rows(client, ledger, monkeypatch):
+    from config import settings
+    monkeypatch.setattr(settings, "report_stream_batch_size", 7)
+    assert client.get("/api/v1/reports/financial?stream=true").status_code == 200
+    (record,) = client.get("/api/v1/reports/history").json()["items"]
+    assert record["filters"] == {"stream": True}
+    assert record["rows"] == 60
+
+def test_failed_streaming_render_closes_the_cursor(client, ledger, monkeypatch):
+    from config import settings
+    from memory_engine import MemoryCursor
+    monkeypatch.setattr(settings, "report_stream_batch_size", 7)
+    closed = []
+    close = MemoryCursor.close
+    async def recording_close(cursor):
+        closed.append(cursor)
+        await close(cursor)
+    monkeypatch.setattr(MemoryCursor, "close", recording_close)
+    layout = reports.PDFReportGenerator._layout
+    laid_out = []
+    def failing_layout(doc, flowables):
+        laid_out.append(flowables)
+        # head, then the first batch, then fail
+        if len(laid_out) == 3:
+            raise RuntimeError("render failed")
+        layout(doc, flowables)
+    monkeypatch.setattr(reports.PDFReportGenerator, "_layout", staticmethod(failing_layout))
+
+    assert client.get("/api/v1/reports/financial?stream=true").status_code == 500
+    assert len(closed) == 1
+
+def test_history_records_timings(client, ledger):
+    reports._chart_cache.clear()
+    client.get("/api/v1/reports/financial")
+    client.get("/api/v1/reports/financial")
+    client.get("/api/v1/reports/comprehensive")
+    history = client.get("/api/v1/reports/history").json()
+    assert history["pagination"]["total_count"] == 3
+    latest, second, first = history["items"]
+    assert latest["report_type"] == "comprehensive"
+    assert set(latest["phases_ms"]) == {"dashboard", "transactions", "properties", "tenants", "alerts"}
+    # Identical series: the second financial report reuses the cached charts
+    assert (first["cache_hit"], second["cache_hit"]) == (False, True)
+    assert first["rows"] == 60 and first["pdf_bytes"] > 0
+
+    summary = client.get("/api/v1/reports/history/summary").json()["report_types"]
+    financial = next(entry for entry in summary if entry["report_type"] == "financial")
+    assert financial["count"] == 2
+    assert financial["cache_hit_rate"] == 0.5
+    assert set(financial["total_ms"]) == {"p50", "p95", "p99"}
+
+def test_latency_summary_uses_the_latest_records(client, app_db, call):
+    now = datetime.now()
+    call(app_db.reports_history.insert_many, [
+        {"report_type": "financial", "rows": 0, "pdf_bytes": 0, "cache_hit": False,
+         "query_ms": 0.0, "render_ms": 0.0, "total_ms": float(i), "created_at": now - timedelta(minutes=i)}
+        for i in range(1, 11)
+    ] + [
+        # Outside the window
+        {"report_type": "tenants", "rows": 0, "pdf_bytes": 0, "cache_hit": False,
+         "query_ms": 0.0, "render_ms": 0.0, "total_ms": 1.0, "created_at": now - timedelta(days=40)},
+        # Older than every financial record, but the only one of its type
+        {"report_type": "comprehensive", "rows": 0, "pdf_bytes": 0, "cache_hit": True,
+         "query_ms": 0.0, "render_ms": 0.0, "total_ms": 50.0, "created_at": now - timedelta(days=1)}
+    ])
+    comprehensive, financial = call(get_latency_summary, 30, 4)
+    assert financial["count"] == 4
+    assert financial["total_ms"]["p99"] < 5
+    assert comprehensive["report_type"] == "comprehensive" and comprehensive["count"] == 1
+    assert comprehensive["cache_hit_rate"] == 1
+
+def test_lookups(client, ledger):
+    page = client.get("/api/v1/reports/lookup/tenants", params={"q": "silva"}).json()
+    assert [tenant["id"] for tenant in page["items"]] == ["tn1"]
+    assert set(page["items"][0]) == {"id", "name", "email", "status"}
+
+    def tenant_ids(q):
+        return [tenant["id"] for tenant in client.get("/api/v1/reports/lookup/tenants", params={"q": q}).json()["items"]]
+    # Word prefixes, without case or accents, every word required
+    assert tenant_ids("JOÃ") == tenant_ids("joao s") == ["tn2"]
+    assert tenant_ids("example") == ["tn2", "tn1"]
+    assert tenant_ids("ilva") == tenant_ids("maria souza") == []
+    # Written through the API: indexed at once, and not part of the responses
+    client.put("/api/v1/tenants/tn1", json={"name": "Maria Oliveira"})
+    assert tenant_ids("oliv") == ["tn1"] and tenant_ids("silva") == []
+    assert "search_keywords" not in client.get("/api/v1/tenants/tn1").json()
+    assert "search_keywords" not in client.get("/api/v1/tenants/").json()["items"][0]
+    assert client.get("/api/v1/reports/lookup/properties", params={"q": "flores"}).json()["items"][0]["name"] == "Apartamento Centro"
+
+    first = client.get("/api/v1/reports/lookup/tenants", params={"limit": 1}).json()
+    assert first["has_more"] is True and len(first["items"]) == 1
+    # Regex characters are searched literally
+    assert client.get("/api/v1/reports/lookup/properties", params={"q": ".*"}).json()["items"] == []
+
+    filters = client.get("/api/v1/reports/available-filters").json()
+    assert filters["tenant_status"] == ["active", "inactive"]
+    assert "properties" not in filters and "tenants" not in filters
+
+@pytest.mark.anyio
+async def test_search_keywords_backfill_runs_once(db):
+    await db.tenants.insert_one({"id": "tn1", "name": "Maria Silva", "email": "maria@example.com"})
+    other_worker = Lease(SEARCH_KEYWORDS_BACKFILL_ID, ttl_seconds=60, owner="other-worker")
+    assert await other_worker.acquire(db)
+    assert await run_search_keywords_backfill(db) is None
+    await other_worker.release(db)
+
+    assert await run_search_keywords_backfill(db) == 1
+    assert (await db.tenants.find_one({"id": "tn1"}))["search_keywords"] == ["maria", "silva", "example", "com"]
+    assert (await db[JOBS_COLLECTION].find_one({"_id": SEARCH_KEYWORDS_BACKFILL_ID}))["updated"] == 1
+    assert await db.leases.count_documents({}) == 0
+
+    # Recorded as done: later starts do not scan again
+    await db.tenants.insert_one({"id": "tn2", "name": "João Souza"})
+    assert await run_search_keywords_backfill(db) is None
+    assert "search_keywords" not in await db.tenants.find_one({"id": "tn2"})
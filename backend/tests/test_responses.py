@@ -0,0 +1,71 @@
+"""
+orjson responses, conditional GET and compression
+"""
+from datetime import datetime
+from decimal import Decimal
+
+import numpy as np
+import orjson
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+
+from responses import dumps
+
+def test_dumps_handles_bson_and_numpy():
+    oid = ObjectId()
+    encoded = orjson.loads(dumps({
+        "_id": oid, "amount": Decimal128("10.50"), "price": Decimal("2.5"),
+        "when": datetime(2024, 1, 2, 3, 4, 5), "values": np.array([1.5, 2.0]), 3: "int key"
+    }))
+    assert encoded == {
+        "_id": str(oid), "amount": 10.5, "price": 2.5, "when": "2024-01-02T03:04:05",
+        "values": [1.5, 2.0], "3": "int key"
+    }
+
+def test_detail_and_list_are_plain_json(client, property_id):
+    detail = client.get(f"/api/v1/properties/{property_id}")
+    assert detail.headers["content-type"] == "application/json"
+    body = detail.json()
+    assert body["id"] == property_id and "_id" not in body
+    datetime.fromisoformat(body["created_at"])
+
+def test_etag_round_trip(client, property_id):
+    first = client.get("/api/v1/properties/")
+    etag = first.headers["ETag"]
+    assert etag.startswith('W/"')
+    assert client.get("/api/v1/properties/", headers={"If-None-Match": etag}).status_code == 304
+    # Another page or filter is another representation
+    assert client.get("/api/v1/properties/?page_size=1", headers={"If-None-Match": etag}).status_code == 200
+
+    client.put(f"/api/v1/properties/{property_id}", json={"rent_value": 1600.0})
+    changed = client.get("/api/v1/properties/", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+def test_deletes_change_the_etag(client, property_id):
+    first = client.get("/api/v1/properties/")
+    assert "Last-Modified" not in first.headers
+    client.post("/api/v1/properties/", json={
+        "name": "Casa Jardim", "address": "Av. das Palmeiras, 456", "type": "Casa",
+        "size": 120.0, "rooms": 3, "rent_value": 2500.0
+    })
+    with_two = client.get("/api/v1/properties/").headers["ETag"]
+    # Deleting the older property leaves the newest updated_at unchanged
+    client.delete(f"/api/v1/properties/{property_id}")
+    after_delete = client.get("/api/v1/properties/", headers={"If-None-Match": with_two})
+    assert after_delete.status_code == 200
+    assert after_delete.json()["pagination"]["total_count"] == 1
+    # If-Modified-Since is not honoured for lists
+    assert client.get("/api/v1/properties/", headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"}).status_code == 200
+
+def test_large_lists_are_gzipped(client, app_db, call):
+    call(app_db.properties.insert_many, [
+        {"id": f"p{i}", "name": f"Property {i}", "address": "Rua", "type": "Casa", "size": 50.0, "rooms": 1,
+         "rent_value": 1000.0, "status": "vacant", "created_at": datetime.now(), "updated_at": datetime.now()}
+        for i in range(30)
+    ])
+    response = client.get("/api/v1/properties/", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.json()["pagination"]["total_count"] == 30
+    small = client.get("/api/v1/properties/p1", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
@@ -3,9 +3,16 @@ Utility functions for SISMOBI 3.2.0
 """
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
+import asyncio
+import re
+import unicodedata
+import uuid
 import structlog
-from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
+from pymongo import UpdateOne
+
+from repository import Database
+from leases import JOBS_COLLECTION, Lease, worker_id
 
 logger = structlog.get_logger(__name__)
 
@@ -34,9 +41,15 @@ async def get_paginated_results(
     page: int = 1,
     page_size: int = 50,
     sort_field: str = "created_at",
-    sort_direction: int = -1
+    sort_direction: int = -1,
+    total_count: Optional[int] = None,
+    projection: Optional[Dict[str, Any]] = None
 ) -> Dict[str, Any]:
-    """Get paginated results from MongoDB collection"""
+    """Get paginated results from MongoDB collection
+
+    Pass `total_count` when it is already known (e.g. from
+    get_collection_validators) to skip the extra count query.
+    """
     if filter_dict is None:
         filter_dict = {}
     
@@ -44,10 +57,11 @@ async def get_paginated_results(
     skip = (page - 1) * page_size
     
     # Get total count
-    total_count = await collection.count_documents(filter_dict)
+    if total_count is None:
+        total_count = await collection.count_documents(filter_dict)
     
     # Get paginated results
-    cursor = collection.find(filter_dict).sort(sort_field, sort_direction).skip(skip).limit(page_size)
+    cursor = collection.find(filter_dict, projection).sort(sort_field, sort_direction).skip(skip).limit(page_size)
     items = []
     
     async for document in cursor:
@@ -70,7 +84,172 @@ async def get_paginated_results(
         }
     }
 
-async def validate_property_exists(db: AsyncIOMotorDatabase, property_id: str) -> bool:
+async def get_collection_validators(collection, filter_dict: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Get count and latest updated_at of the documents matching a filter
+
+    Used to build ETag validators for list endpoints before the page itself
+    is fetched. The count and a lookup of the newest updated_at (walks the
+    updated_at index, see ensure_indexes) run concurrently, so no matching
+    document has to be fetched and grouped.
+    """
+    filter_dict = filter_dict or {}
+    total_count, latest = await asyncio.gather(
+        collection.count_documents(filter_dict),
+        collection.find_one(filter_dict, {"_id": 0, "updated_at": 1}, sort=[("updated_at", -1)])
+    )
+    return {"total_count": total_count, "last_modified": latest.get("updated_at") if latest else None}
+
+async def get_bill_group_summary(
+    collection,
+    group_id: str,
+    quantity_field: str,
+    year: Optional[int] = None
+) -> Dict[str, Any]:
+    """Aggregate totals, averages and monthly series for a bill group
+
+    Runs entirely inside MongoDB so the bill documents never leave the server.
+    `quantity_field` is the consumption field of the collection
+    (e.g. "total_liters" or "total_kwh").
+    """
+    filter_dict = {"group_id": group_id}
+    if year:
+        filter_dict["year"] = year
+
+    quantity = f"${quantity_field}"
+    pipeline = [
+        {"$match": filter_dict},
+        {
+            "$facet": {
+                "totals": [
+                    {
+                        "$group": {
+                            "_id": None,
+                            "total_bills": {"$sum": 1},
+                            "total_amount": {"$sum": "$total_amount"},
+                            "total_quantity": {"$sum": quantity}
+                        }
+                    }
+                ],
+                "monthly": [
+                    {
+                        "$group": {
+                            "_id": {"year": "$year", "month": "$month"},
+                            "bills": {"$sum": 1},
+                            "total_amount": {"$sum": "$total_amount"},
+                            "total_quantity": {"$sum": quantity}
+                        }
+                    },
+                    {"$sort": {"_id.year": 1, "_id.month": 1}}
+                ]
+            }
+        }
+    ]
+
+    result = await collection.aggregate(pipeline).to_list(1)
+    facets = result[0] if result else {"totals": [], "monthly": []}
+    totals = facets["totals"][0] if facets["totals"] else {
+        "total_bills": 0, "total_amount": 0, "total_quantity": 0
+    }
+    total_bills = totals["total_bills"]
+
+    monthly = []
+    for row in facets["monthly"]:
+        monthly.append({
+            "year": row["_id"]["year"],
+            "month": row["_id"]["month"],
+            "bills": row["bills"],
+            "total_amount": row["total_amount"],
+            quantity_field: row["total_quantity"],
+            "average_amount": row["total_amount"] / row["bills"],
+        })
+
+    return {
+        "total_bills": total_bills,
+        "total_amount": totals["total_amount"],
+        "total_quantity": totals["total_quantity"],
+        "average_amount": totals["total_amount"] / total_bills if total_bills else 0,
+        "average_quantity": totals["total_quantity"] / total_bills if total_bills else 0,
+        "monthly": monthly
+    }
+
+# Typeahead search (reports lookups): the words of these fields are stored
+# lower-cased and without accents in an indexed search_keywords array, so a
+# search is an anchored prefix match on that index instead of a collection scan
+SEARCH_FIELDS = {
+    "properties": ("name", "address"),
+    "tenants": ("name", "email")
+}
+
+def search_keywords(*values: Optional[str]) -> List[str]:
+    """Distinct lower-cased, accent-free words of the given texts"""
+    words = []
+    for value in values:
+        if value:
+            decomposed = unicodedata.normalize("NFKD", value)
+            folded = "".join(char for char in decomposed if not unicodedata.combining(char)).lower()
+            words.extend(re.findall(r"\w+", folded))
+    return list(dict.fromkeys(words))
+
+def search_keywords_update(collection_name: str, document: Dict[str, Any]) -> Dict[str, Any]:
+    """{"search_keywords": [...]} for a document of a searchable collection
+
+    Pass the whole document as it will be stored (for updates, the existing
+    document merged with the changes).
+    """
+    return {"search_keywords": search_keywords(*(document.get(field) for field in SEARCH_FIELDS[collection_name]))}
+
+# Projection keeping search_keywords out of API responses
+WITHOUT_SEARCH_KEYWORDS = {"search_keywords": 0}
+
+async def backfill_search_keywords(db: Database, batch_size: int = 1000) -> int:
+    """Add search_keywords to documents written without them; returns the number updated"""
+    updated = 0
+    for collection_name, fields in SEARCH_FIELDS.items():
+        collection = db[collection_name]
+        operations = []
+        async for doc in collection.find({"search_keywords": {"$exists": False}}, {field: 1 for field in fields}):
+            operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": search_keywords_update(collection_name, doc)}))
+            if len(operations) >= batch_size:
+                updated += (await collection.bulk_write(operations, ordered=False)).modified_count
+                operations = []
+        if operations:
+            updated += (await collection.bulk_write(operations, ordered=False)).modified_count
+    return updated
+
+SEARCH_KEYWORDS_BACKFILL_ID = "search-keywords-backfill"
+
+async def run_search_keywords_backfill(db: Database) -> Optional[int]:
+    """Run backfill_search_keywords once per deployment (started from the app lifespan)
+
+    The worker holding the lease runs the (unindexed) scan and records it in
+    the jobs collection; other workers and later starts skip it. Returns the
+    number of documents updated, or None when skipped.
+    """
+    try:
+        if await db[JOBS_COLLECTION].find_one({"_id": SEARCH_KEYWORDS_BACKFILL_ID}):
+            return None
+        lease = Lease(SEARCH_KEYWORDS_BACKFILL_ID, ttl_seconds=3600)
+        if not await lease.acquire(db):
+            return None
+        try:
+            # Another worker may have finished it between the check and the lease
+            if await db[JOBS_COLLECTION].find_one({"_id": SEARCH_KEYWORDS_BACKFILL_ID}):
+                return None
+            updated = await backfill_search_keywords(db)
+            await db[JOBS_COLLECTION].replace_one(
+                {"_id": SEARCH_KEYWORDS_BACKFILL_ID},
+                {"updated": updated, "worker": worker_id(), "finished_at": datetime.utcnow()},
+                upsert=True
+            )
+            logger.info("Search keywords backfilled", documents=updated)
+            return updated
+        finally:
+            await lease.release(db)
+    except Exception as e:
+        logger.warning("Search keywords backfill failed", error=str(e))
+        return None
+
+async def validate_property_exists(db: Database, property_id: str) -> bool:
     """Validate if property exists"""
     try:
         property_doc = await db.properties.find_one({"id": property_id})
@@ -79,7 +258,7 @@ async def validate_property_exists(db: AsyncIOMotorDatabase, property_id: str) -
         logger.error("Error validating property", property_id=property_id, error=str(e))
         return False
 
-async def validate_tenant_exists(db: AsyncIOMotorDatabase, tenant_id: str) -> bool:
+async def validate_tenant_exists(db: Database, tenant_id: str) -> bool:
     """Validate if tenant exists"""
     try:
         tenant_doc = await db.tenants.find_one({"id": tenant_id})
@@ -88,7 +267,7 @@ async def validate_tenant_exists(db: AsyncIOMotorDatabase, tenant_id: str) -> bo
         logger.error("Error validating tenant", tenant_id=tenant_id, error=str(e))
         return False
 
-async def calculate_dashboard_summary(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+async def calculate_dashboard_summary(db: Database) -> Dict[str, Any]:
     """Calculate dashboard summary statistics"""
     try:
         # Get counts
@@ -211,7 +390,70 @@ def create_transaction_filter(
     
     return filter_dict
 
-async def generate_automatic_alerts(db: AsyncIOMotorDatabase) -> List[Dict[str, Any]]:
+async def upsert_alerts(db: Database, alerts: List[Dict[str, Any]]) -> int:
+    """Bulk insert generated alerts, skipping any whose dedup_key already exists
+
+    Idempotent: re-running a generator never duplicates alerts and never
+    touches alerts that users have already updated or resolved.
+    """
+    if not alerts:
+        return 0
+    
+    operations = [
+        UpdateOne({"dedup_key": alert["dedup_key"]}, {"$setOnInsert": alert}, upsert=True)
+        for alert in alerts
+    ]
+    result = await db.alerts.bulk_write(operations, ordered=False)
+    return result.upserted_count
+
+async def build_contract_expiring_alerts(db: Database, days_ahead: int = 30) -> List[Dict[str, Any]]:
+    """Build contract_expiring alerts for active leases ending within `days_ahead` days
+
+    Served by the (status, contract_end_date) index: only tenants inside the
+    window are read, with a minimal projection.
+    """
+    current_date = datetime.now()
+    window_start = current_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    window_end = window_start + timedelta(days=days_ahead + 1)
+    
+    cursor = db.tenants.find(
+        {
+            "status": "active",
+            "contract_end_date": {"$gte": window_start, "$lt": window_end}
+        },
+        {"_id": 0, "id": 1, "name": 1, "property_id": 1, "contract_end_date": 1}
+    ).batch_size(5000)
+    
+    alerts = []
+    async for tenant in cursor:
+        end_date = tenant["contract_end_date"]
+        days_left = (end_date.date() - current_date.date()).days
+        alerts.append({
+            "id": str(uuid.uuid4()),
+            "dedup_key": f"contract_expiring:{tenant['id']}:{end_date.date().isoformat()}",
+            "property_id": tenant.get("property_id"),
+            "tenant_id": tenant["id"],
+            "title": "Contract Expiring",
+            "message": f"Contract for tenant {tenant['name']} expires on {end_date.strftime('%d/%m/%Y')} ({days_left} days)",
+            "type": "contract_expiring",
+            "priority": "high" if days_left <= 7 else "medium",
+            "resolved": False,
+            "resolved_at": None,
+            "due_date": end_date,
+            "created_at": current_date,
+            "updated_at": current_date
+        })
+    
+    return alerts
+
+async def sync_contract_expiring_alerts(db: Database, days_ahead: int = 30) -> Dict[str, int]:
+    """Generate and idempotently upsert contract_expiring alerts"""
+    alerts = await build_contract_expiring_alerts(db, days_ahead)
+    inserted = await upsert_alerts(db, alerts)
+    logger.info("Contract expiring alerts synced", expiring=len(alerts), inserted=inserted)
+    return {"expiring": len(alerts), "inserted": inserted}
+
+async def generate_automatic_alerts(db: Database) -> List[Dict[str, Any]]:
     """Generate automatic alerts based on system data"""
     alerts = []
     current_date = datetime.now()
@@ -254,7 +496,7 @@ async def generate_automatic_alerts(db: AsyncIOMotorDatabase) -> List[Dict[str,
                 })
         
         # Contract expiring alerts (next 30 days)
-        # This would require contract end dates in tenant model - placeholder for now
+        alerts.extend(await build_contract_expiring_alerts(db, days_ahead=30))
         
         logger.info(f"Generated {len(alerts)} automatic alerts")
         return alerts
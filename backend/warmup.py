@@ -0,0 +1,129 @@
+"""
+Startup warmup and readiness for SISMOBI 3.2.0
+
+warm_up() runs in the background after the database connects:
+
+1. open MIN_CONNECTIONS_COUNT pool connections with concurrent pings, so the
+   first requests do not pay for connection setup (TCP, TLS, auth)
+2. scan the hot indexes once so they are in the server's cache
+3. run the dashboard aggregation and fill the report filter caches
+
+/readyz answers 503 until warmup has finished (or timed out) and while the
+server shuts down, so a load balancer only routes to warm instances during
+rolling deploys. /livez does no I/O. Database checks are shared between
+probes and cached for READINESS_CACHE_SECONDS.
+"""
+from typing import Any, Dict, Optional
+import asyncio
+import time
+import structlog
+
+from config import settings
+
+logger = structlog.get_logger(__name__)
+
+# (collection, index name) pairs used by the hottest routes; see database.ensure_indexes
+HOT_INDEXES = [
+    ("properties", "id_1"),
+    ("tenants", "id_1"),
+    ("transactions", "id_1"),
+    ("alerts", "id_1"),
+    ("tenants", "status_1_contract_end_date_1"),
+    ("users", "id_1"),
+]
+
+async def open_pool(database, connections: int):
+    """Check out `connections` pool connections at once by pinging concurrently"""
+    await asyncio.gather(*(database.command("ping") for _ in range(max(connections, 1))))
+
+async def touch_indexes(database, time_limit_ms: int):
+    """Count over each hot index so its pages are loaded into the server cache"""
+    for collection, index in HOT_INDEXES:
+        try:
+            await database[collection].count_documents({}, hint=index, maxTimeMS=time_limit_ms)
+        except Exception as e:
+            logger.debug("Index warmup skipped", collection=collection, index=index, error=str(e))
+
+async def preload_caches(database):
+    from utils import calculate_dashboard_summary
+    from routers.reports import preload_caches as preload_report_caches
+
+    await calculate_dashboard_summary(database)
+    await preload_report_caches()
+
+async def warm_up(database) -> Dict[str, float]:
+    """Run the warmup phases and return their durations in ms"""
+    phases = (
+        ("pool", lambda: open_pool(database, settings.min_connections_count)),
+        ("indexes", lambda: touch_indexes(database, settings.warmup_timeout_seconds * 1000)),
+        ("caches", lambda: preload_caches(database)),
+    )
+    timings = {}
+    for name, phase in phases:
+        started = time.perf_counter()
+        try:
+            await phase()
+        except Exception as e:
+            logger.warning("Warmup phase failed", phase=name, error=str(e))
+        timings[name] = round((time.perf_counter() - started) * 1000, 2)
+    return timings
+
+class ReadinessProbe:
+    """Warmup state plus a shared, briefly cached database check"""
+
+    def __init__(self, cache_seconds: float, timeout_seconds: float):
+        self.cache_seconds = cache_seconds
+        self.timeout_seconds = timeout_seconds
+        self.warmed = False
+        self.draining = False
+        self._checked_at = float("-inf")
+        self._database_ok = False
+        self._lock: Optional[asyncio.Lock] = None
+
+    def reset(self):
+        """Not warmed and not draining, for a new lifespan of the same process"""
+        self.warmed = False
+        self.draining = False
+        self._checked_at = float("-inf")
+        self._database_ok = False
+        # The lock belongs to the previous lifespan's event loop; database_ok
+        # creates a new one in the current loop
+        self._lock = None
+
+    async def run_warmup(self, database):
+        if settings.warmup_enabled:
+            try:
+                timings = await asyncio.wait_for(warm_up(database), settings.warmup_timeout_seconds)
+                logger.info("Warmup finished", phases_ms=timings)
+            except asyncio.TimeoutError:
+                logger.warning("Warmup timed out", timeout_seconds=settings.warmup_timeout_seconds)
+        self.warmed = True
+
+    async def database_ok(self, database) -> bool:
+        """Ping result, reused for cache_seconds across concurrent probes"""
+        if time.monotonic() - self._checked_at < self.cache_seconds:
+            return self._database_ok
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if time.monotonic() - self._checked_at >= self.cache_seconds:
+                try:
+                    await asyncio.wait_for(database.command("ping"), self.timeout_seconds)
+                    self._database_ok = True
+                except Exception as e:
+                    logger.error("Database health check failed", error=str(e) or type(e).__name__)
+                    self._database_ok = False
+                self._checked_at = time.monotonic()
+        return self._database_ok
+
+    async def status(self, database) -> Dict[str, Any]:
+        database_ok = await self.database_ok(database)
+        return {
+            "ready": self.warmed and not self.draining and database_ok,
+            "warmed": self.warmed,
+            "draining": self.draining,
+            "database": "connected" if database_ok else "disconnected"
+        }
+
+# Global readiness state
+readiness = ReadinessProbe(settings.readiness_cache_seconds, settings.readiness_timeout_seconds)
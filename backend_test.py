@@ -47,6 +47,7 @@ ENDPOINTS TO TEST:
    - DELETE /api/v1/alerts/{id}
 """
 
+import os
 import sys
 import json
 import requests
@@ -54,7 +55,7 @@ from datetime import datetime
 from typing import Dict, Any, Optional
 
 class SISMOBIBackendTester:
-    def __init__(self, base_url: str = "https://749ddd34-9a6e-4bd9-8473-c952fcaf5459.preview.emergentagent.com"):
+    def __init__(self, base_url: str = os.getenv("SISMOBI_BASE_URL", "http://localhost:8001")):
         self.base_url = base_url
         self.tests_run = 0
         self.tests_passed = 0
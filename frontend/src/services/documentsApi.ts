@@ -15,6 +15,10 @@ export interface Document {
   file_size: number;
   mime_type: string;
   description?: string;
+  sha256?: string;
+  has_thumbnail?: boolean;
+  text_extracted?: boolean;
+  thumbnail_url?: string | null;
   created_at: string;
   updated_at: string;
 }
@@ -6,18 +6,6 @@
 const API_URL = import.meta.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
 
 export interface ReportFilters {
-  properties: Array<{
-    id: string;
-    address: string;
-    type: string;
-    status: string;
-  }>;
-  tenants: Array<{
-    id: string;
-    name: string;
-    email: string;
-    status: string;
-  }>;
   property_status: string[];
   tenant_status: string[];
   property_types: string[];
@@ -27,6 +15,42 @@ export interface ReportFilters {
   }>;
 }
 
+export interface LookupPage<T> {
+  items: T[];
+  skip: number;
+  limit: number;
+  has_more: boolean;
+}
+
+export interface PropertyLookupItem {
+  id: string;
+  name: string;
+  address: string;
+  type: string;
+  status: string;
+}
+
+export interface TenantLookupItem {
+  id: string;
+  name: string;
+  email: string;
+  status: string;
+}
+
+export interface ReportHistoryEntry {
+  id: string;
+  report_type: string;
+  filters: Record<string, string>;
+  user: string;
+  rows: number;
+  query_ms: number;
+  render_ms: number;
+  total_ms: number;
+  pdf_bytes: number;
+  cache_hit: boolean;
+  created_at: string;
+}
+
 class ReportsApiService {
   private getHeaders(): Headers {
     const token = localStorage.getItem('access_token');
@@ -170,14 +194,68 @@ class ReportsApiService {
     return response.json();
   }
 
-  async getReportsHistory(limit: number = 20): Promise<{
-    message: string;
-    reports: any[];
-    total: number;
-    note: string;
+  async lookupProperties(params?: {
+    q?: string;
+    status?: string;
+    skip?: number;
+    limit?: number;
+  }): Promise<LookupPage<PropertyLookupItem>> {
+    return this.lookup<PropertyLookupItem>('properties', params);
+  }
+
+  async lookupTenants(params?: {
+    q?: string;
+    status?: string;
+    skip?: number;
+    limit?: number;
+  }): Promise<LookupPage<TenantLookupItem>> {
+    return this.lookup<TenantLookupItem>('tenants', params);
+  }
+
+  private async lookup<T>(
+    resource: 'properties' | 'tenants',
+    params?: { q?: string; status?: string; skip?: number; limit?: number }
+  ): Promise<LookupPage<T>> {
+    const queryParams = new URLSearchParams();
+    if (params?.q) queryParams.append('q', params.q);
+    if (params?.status) queryParams.append('status', params.status);
+    if (params?.skip) queryParams.append('skip', params.skip.toString());
+    if (params?.limit) queryParams.append('limit', params.limit.toString());
+
+    const response = await fetch(
+      `${API_URL}/api/v1/reports/lookup/${resource}?${queryParams.toString()}`,
+      {
+        method: 'GET',
+        headers: this.getHeaders(),
+      }
+    );
+
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+
+    return response.json();
+  }
+
+  async getReportsHistory(
+    page: number = 1,
+    pageSize: number = 20,
+    reportType?: string
+  ): Promise<{
+    items: ReportHistoryEntry[];
+    pagination: {
+      current_page: number;
+      page_size: number;
+      total_count: number;
+      total_pages: number;
+      has_next: boolean;
+      has_prev: boolean;
+    };
   }> {
     const queryParams = new URLSearchParams();
-    queryParams.append('limit', limit.toString());
+    queryParams.append('page', page.toString());
+    queryParams.append('page_size', pageSize.toString());
+    if (reportType) queryParams.append('report_type', reportType);
 
     const response = await fetch(
       `${API_URL}/api/v1/reports/history?${queryParams.toString()}`,
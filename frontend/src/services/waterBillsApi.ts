@@ -137,7 +137,8 @@ class WaterBillsApiService {
 
   async getGroupSummary(
     groupId: string,
-    year?: number
+    year?: number,
+    options?: { includeBills?: boolean; page?: number; pageSize?: number }
   ): Promise<{
     group_id: string;
     total_bills: number;
@@ -145,10 +146,31 @@ class WaterBillsApiService {
     total_liters: number;
     average_amount: number;
     average_liters: number;
-    bills: WaterBill[];
+    monthly: Array<{
+      year: number;
+      month: number;
+      bills: number;
+      total_amount: number;
+      total_liters: number;
+      average_amount: number;
+    }>;
+    bills?: {
+      items: WaterBill[];
+      pagination: {
+        current_page: number;
+        page_size: number;
+        total_count: number;
+        total_pages: number;
+        has_next: boolean;
+        has_prev: boolean;
+      };
+    };
   }> {
     const queryParams = new URLSearchParams();
     if (year) queryParams.append('year', year.toString());
+    if (options?.includeBills) queryParams.append('include_bills', 'true');
+    if (options?.page) queryParams.append('page', options.page.toString());
+    if (options?.pageSize) queryParams.append('page_size', options.pageSize.toString());
 
     const response = await fetch(
       `${API_URL}/api/v1/water-bills/group/${groupId}/summary?${queryParams.toString()}`,